@@ -1,18 +1,46 @@
 # gpio_relay.py
-# This script provides basic control for a GPIO pin, typically used to activate a relay.
-# It can be run directly for testing or imported by other scripts.
+# This script provides basic control for GPIO pins, typically used to activate relays (e.g. a siren).
+# It can be run directly for testing, run as an MQTT-driven relay service, or imported by other scripts.
+#
+# RelayController schedules on/off pulses, strobe patterns and auto-off timeouts on a background
+# thread, so callers (and MQTT callbacks) return immediately instead of sleeping. With --mqtt the
+# controller listens on RELAY_COMMAND_TOPIC for JSON commands such as
+#   {"pin": 17, "action": "pulse", "seconds": 30}
+#   {"pin": 17, "action": "pattern", "on_ms": 500, "off_ms": 500, "seconds": 60}
+#   {"pin": 17, "action": "off"}
+# and publishes each pin's state ("on"/"off", retained) to <RELAY_STATE_TOPIC>/<pin>.
+#
+# With --daemon the pins are set up once and held: commands arrive as the same JSON objects, one
+# per line, on a Unix socket (RELAY_SOCKET), and pin states and pending auto-offs/patterns are saved
+# to RELAY_STATE_FILE so a restarted daemon sets the pins up at their previous level instead of
+# driving them LOW first. `--state on|off|toggle` and `--test` go through a running daemon when its
+# socket exists; homebase/relayctl.sh is a shell client that needs no Python at all.
 
 import os
+import json
 import time
+import heapq
+import signal
+import socket
 import argparse
+import threading
+import itertools
+import socketserver
 import logging
 
 # --- Logging Setup ---
-logging.basicConfig(level=logging.INFO, format=\'%(asctime)s - %(levelname)s - %(message)s\
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
 # Default GPIO pin if not specified by argument or environment variable
 DEFAULT_GPIO_PIN = 17
+DEFAULT_MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
+DEFAULT_MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+DEFAULT_COMMAND_TOPIC = os.getenv("RELAY_COMMAND_TOPIC", "vz/relay/command") # JSON commands for --mqtt
+DEFAULT_STATE_TOPIC = os.getenv("RELAY_STATE_TOPIC", "vz/relay/state") # Retained "on"/"off" per pin
+DEFAULT_SOCKET = os.getenv("RELAY_SOCKET", "/run/gpio_relay/gpio_relay.sock") # Daemon command socket
+DEFAULT_STATE_FILE = os.getenv("RELAY_STATE_FILE", "/var/lib/gpio_relay/state.json") # Daemon pin states, "" disables
+HIGH, LOW = 1, 0 # Same values as GPIO.HIGH / GPIO.LOW, usable when RPi.GPIO is missing
 
 # Attempt to import RPi.GPIO
 USE_GPIO = False
@@ -48,12 +76,12 @@ def setup_pin(pin_number):
 
 def set_pin_state(pin_number, state):
     """Sets the specified GPIO pin to the given state (HIGH or LOW)."""
-    if not isinstance(state, bool) and state not in [GPIO.HIGH, GPIO.LOW, 1, 0]:
+    if not isinstance(state, bool) and state not in [HIGH, LOW]:
         logging.error(f"Invalid state for pin {pin_number}: {state}. Must be boolean, 0/1, or GPIO.HIGH/LOW.")
         return
 
-    gpio_state_to_set = GPIO.HIGH if state in [True, GPIO.HIGH, 1] else GPIO.LOW
-    state_str = "HIGH" if gpio_state_to_set == GPIO.HIGH else "LOW"
+    gpio_state_to_set = HIGH if state in [True, HIGH] else LOW
+    state_str = "HIGH" if gpio_state_to_set == HIGH else "LOW"
 
     if USE_GPIO and GPIO:
         try:
@@ -65,7 +93,7 @@ def set_pin_state(pin_number, state):
         logging.info(f"[SIMULATED] GPIO pin {pin_number} set to {state_str}.")
 
 def toggle_pin(pin_number, delay_seconds=1):
-    """Toggles the GPIO pin: HIGH, waits, then LOW."""
+    """Toggles the GPIO pin: HIGH, waits, then LOW. Blocks; use RelayController.pulse to avoid waiting."""
     logging.info(f"Toggling GPIO pin {pin_number} ON for {delay_seconds} second(s).")
     set_pin_state(pin_number, True) # Turn ON
     time.sleep(delay_seconds)
@@ -82,6 +110,466 @@ def cleanup_gpio():
     elif not USE_GPIO:
         logging.info("[SIMULATED] GPIO resources cleaned up.")
 
+# --- Relay Backends ---
+class RPiBackend:
+    """Drives real pins through RPi.GPIO."""
+
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self.gpio.setmode(self.gpio.BCM)
+
+    def setup(self, pin, on=False):
+        self.gpio.setup(pin, self.gpio.OUT, initial=self.gpio.HIGH if on else self.gpio.LOW)
+
+    def write(self, pin, on):
+        self.gpio.output(pin, self.gpio.HIGH if on else self.gpio.LOW)
+
+    def cleanup(self, pins):
+        self.gpio.cleanup(list(pins))
+
+class SimulatedBackend:
+    """Records pin writes instead of driving hardware (for testing without a Raspberry Pi)."""
+
+    def __init__(self, log_writes=True):
+        self.log_writes = log_writes
+        self.states = {}  # pin -> bool
+        self.history = [] # (monotonic time, pin, bool) for every write
+
+    def setup(self, pin, on=False):
+        self.states[pin] = on
+        if self.log_writes:
+            logging.info(f"[SIMULATED] GPIO pin {pin} set up as output, {'HIGH' if on else 'LOW'}.")
+
+    def write(self, pin, on):
+        self.states[pin] = on
+        self.history.append((time.monotonic(), pin, on))
+        if self.log_writes:
+            logging.info(f"[SIMULATED] GPIO pin {pin} set to {'HIGH' if on else 'LOW'}.")
+
+    def cleanup(self, pins):
+        if self.log_writes:
+            logging.info(f"[SIMULATED] GPIO pins {sorted(pins)} cleaned up.")
+
+def make_backend():
+    """RPiBackend when RPi.GPIO is available, else SimulatedBackend."""
+    if USE_GPIO and GPIO:
+        return RPiBackend(GPIO)
+    return SimulatedBackend()
+
+# --- Relay Controller ---
+class RelayController:
+    """Non-blocking control of several relay pins.
+
+    Every call writes the pin immediately on the caller's thread and returns; later changes (the
+    end of a pulse, the steps of a pattern, auto-off) run on one background timer thread. A new
+    command for a pin cancels whatever was still scheduled for it. on_change(pin, on) is called
+    after every write that changes a pin, and on_update() after every command or scheduled write,
+    from whichever thread made it (with the controller locked, so keep them short).
+    initial ({pin: on}) sets pins up at a known level instead of LOW, e.g. when a daemon restarts.
+    """
+
+    def __init__(self, pins, backend=None, on_change=None, on_update=None, initial=None):
+        self.backend = backend or make_backend()
+        self.on_change = on_change
+        self.on_update = on_update
+        self._states = {}
+        self._plans = {}      # pin -> (monotonic auto-off time or None, (on_seconds, off_seconds) or None)
+        self._generation = {} # pin -> counter; scheduled steps of older generations are skipped
+        self._schedule = []   # heap of (when, seq, pin, generation, on, pattern)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        initial = initial or {}
+        for pin in pins:
+            self.backend.setup(pin, bool(initial.get(pin)))
+            self._states[pin] = bool(initial.get(pin))
+            self._plans[pin] = (None, None)
+            self._generation[pin] = 0
+
+    @property
+    def pins(self):
+        return sorted(self._states)
+
+    def state(self, pin):
+        """Returns True if the pin is on."""
+        return self._states[self._check_pin(pin)]
+
+    def states(self):
+        """Returns {pin: on} for every pin."""
+        with self._cond:
+            return dict(self._states)
+
+    def on(self, pin, auto_off=None):
+        """Turns the pin on, and off again after auto_off seconds if given."""
+        with self._cond:
+            generation = self._cancel_locked(pin)
+            self._write_locked(pin, True)
+            if auto_off:
+                self._plans[pin] = (time.monotonic() + auto_off, None)
+                self._push_locked(self._plans[pin][0], pin, generation, False)
+            self._updated_locked()
+
+    def off(self, pin):
+        """Turns the pin off and cancels anything scheduled for it."""
+        with self._cond:
+            self._cancel_locked(pin)
+            self._write_locked(pin, False)
+            self._updated_locked()
+
+    def pulse(self, pin, seconds):
+        """Turns the pin on for seconds without blocking."""
+        self.on(pin, auto_off=seconds)
+
+    def pattern(self, pin, on_seconds, off_seconds, count=None, duration=None):
+        """Strobes the pin: on for on_seconds, off for off_seconds, for count cycles or duration seconds.
+
+        With neither count nor duration the pattern runs until the pin is turned off or given another command.
+        """
+        if on_seconds <= 0 or off_seconds <= 0:
+            raise ValueError("Pattern on and off times must be positive.")
+        with self._cond:
+            generation = self._cancel_locked(pin)
+            now = time.monotonic()
+            end = float("inf")
+            if count:
+                end = now + count * (on_seconds + off_seconds) - off_seconds
+            if duration:
+                end = min(end, now + duration)
+            self._write_locked(pin, True)
+            self._plans[pin] = (end if end != float("inf") else None, (on_seconds, off_seconds))
+            self._push_locked(min(now + on_seconds, end), pin, generation, False, (on_seconds, off_seconds, end))
+            self._updated_locked()
+
+    def snapshot(self):
+        """Returns {pin: {"on", "until" (wall-clock auto-off or None), "pattern" ([on, off] seconds or None)}}."""
+        with self._cond:
+            now_monotonic, now = time.monotonic(), time.time()
+            snapshot = {}
+            for pin, on in self._states.items():
+                until, pattern = self._plans[pin]
+                if until is not None and until <= now_monotonic:
+                    until, pattern = None, None # Already finished
+                snapshot[pin] = {"on": on or pattern is not None,
+                                 "until": round(now + until - now_monotonic, 3) if until is not None else None,
+                                 "pattern": list(pattern) if pattern else None}
+            return snapshot
+
+    def restore(self, snapshot):
+        """Re-applies a snapshot(): pins stay on, and auto-offs and patterns resume for their remaining time."""
+        now = time.time()
+        for pin, saved in snapshot.items():
+            if pin not in self._states:
+                logging.warning(f"Ignoring saved state of GPIO pin {pin}, which is not managed by this controller.")
+                continue
+            until = saved.get("until")
+            remaining = until - now if until is not None else None
+            if not saved.get("on") or (remaining is not None and remaining <= 0):
+                self.off(pin)
+            elif saved.get("pattern"):
+                self.pattern(pin, *saved["pattern"], duration=remaining)
+            else:
+                self.on(pin, auto_off=remaining)
+
+    def handle_command(self, command):
+        """Runs a command dict ({"pin", "action", ...}, see the module header). Raises ValueError if invalid."""
+        if not isinstance(command, dict):
+            raise ValueError("Command must be a JSON object.")
+        action = str(command.get("action", "")).lower()
+        try:
+            pin = self._check_pin(int(command["pin"]))
+            seconds = float(command["seconds"]) if command.get("seconds") is not None else None
+            if action == "on":
+                self.on(pin, auto_off=seconds)
+            elif action == "off":
+                self.off(pin)
+            elif action == "pulse":
+                self.pulse(pin, seconds if seconds is not None else 1.0)
+            elif action == "pattern":
+                count = int(command["count"]) if command.get("count") is not None else None
+                self.pattern(pin, float(command.get("on_ms", 500)) / 1000, float(command.get("off_ms", 500)) / 1000,
+                             count=count, duration=seconds)
+            else:
+                raise ValueError(f"Unknown action '{action}'.")
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid command {command}: {e}")
+        return {"pin": pin, "on": self._states[pin]}
+
+    def start(self):
+        """Starts the background timer thread."""
+        with self._cond:
+            if self._thread:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="relay-controller", daemon=True)
+            self._thread.start()
+
+    def stop(self, turn_off=True, cleanup=True):
+        """Stops the timer thread; turns every pin off and releases them unless told otherwise."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        with self._cond:
+            for pin in self._states:
+                self._cancel_locked(pin)
+                if turn_off and self._states[pin]:
+                    self._write_locked(pin, False)
+        if cleanup:
+            try:
+                self.backend.cleanup(self._states)
+            except Exception as e:
+                logging.error(f"Error during GPIO cleanup: {e}")
+
+    def _check_pin(self, pin):
+        if pin not in self._states:
+            raise ValueError(f"GPIO pin {pin} is not managed by this controller (pins: {self.pins}).")
+        return pin
+
+    def _cancel_locked(self, pin):
+        self._check_pin(pin)
+        self._generation[pin] += 1
+        self._plans[pin] = (None, None)
+        return self._generation[pin]
+
+    def _updated_locked(self):
+        if self.on_update:
+            try:
+                self.on_update()
+            except Exception as e:
+                logging.error(f"Error reporting relay update: {e}")
+
+    def _push_locked(self, when, pin, generation, on, pattern=None):
+        heapq.heappush(self._schedule, (when, next(self._seq), pin, generation, on, pattern))
+        self._cond.notify()
+
+    def _write_locked(self, pin, on):
+        try:
+            self.backend.write(pin, on)
+        except Exception as e:
+            logging.error(f"Error setting GPIO pin {pin} to {'HIGH' if on else 'LOW'}: {e}")
+            return
+        changed = self._states[pin] != on
+        self._states[pin] = on
+        if changed and self.on_change:
+            try:
+                self.on_change(pin, on)
+            except Exception as e:
+                logging.error(f"Error reporting state of GPIO pin {pin}: {e}")
+
+    def _run(self):
+        with self._cond:
+            while self._running:
+                if not self._schedule:
+                    self._cond.wait()
+                    continue
+                when, _, pin, generation, on, pattern = self._schedule[0]
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._schedule)
+                if generation != self._generation[pin]:
+                    continue # Cancelled by a newer command for this pin
+                self._write_locked(pin, on)
+                self._updated_locked()
+                if pattern:
+                    on_seconds, off_seconds, end = pattern
+                    if when < end:
+                        # Schedule from the planned time, not now, so a long strobe does not drift
+                        next_when = when + (on_seconds if on else off_seconds)
+                        if next_when >= end:
+                            self._push_locked(end, pin, generation, False)
+                        else:
+                            self._push_locked(next_when, pin, generation, not on, pattern)
+
+# --- MQTT Command Listener ---
+def run_mqtt(controller, host, port, command_topic, state_topic):
+    """Drives controller from JSON commands on command_topic until interrupted. Blocks."""
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client()
+
+    def publish_state(pin, on):
+        client.publish(f"{state_topic}/{pin}", "on" if on else "off", qos=1, retain=True)
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(command_topic, qos=1)
+            logging.info(f"Listening for relay commands on {command_topic} (pins {controller.pins}).")
+            for pin, on in controller.states().items():
+                publish_state(pin, on)
+        else:
+            logging.error(f"Failed to connect to MQTT broker, return code: {rc}")
+
+    def on_message(client, userdata, msg):
+        try:
+            result = controller.handle_command(json.loads(msg.payload.decode()))
+            logging.info(f"Relay command on {msg.topic}: {msg.payload.decode()} -> pin {result['pin']} {'on' if result['on'] else 'off'}")
+        except (UnicodeDecodeError, ValueError) as e:
+            logging.error(f"Ignoring relay command on {msg.topic}: {e}")
+
+    previous_on_change = controller.on_change
+    def on_change(pin, on):
+        if previous_on_change:
+            previous_on_change(pin, on)
+        publish_state(pin, on)
+
+    controller.on_change = on_change
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(host, port, 60)
+    client.loop_forever()
+
+# --- Daemon ---
+class StateFile:
+    """Saves controller.snapshot() to a JSON file on a background thread, off the command path."""
+
+    def __init__(self, path, controller):
+        self.path = path
+        self.controller = controller
+        self._dirty = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """Returns the saved {pin: state}, or {} if there is none or it cannot be read."""
+        try:
+            with open(self.path, "r") as f:
+                return {int(pin): state for pin, state in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError) as e:
+            logging.error(f"Ignoring unreadable relay state file {self.path}: {e}")
+            return {}
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def save(self):
+        """Writes the snapshot to a temporary file and renames it over the state file."""
+        self._dirty.clear()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump({str(pin): state for pin, state in self.controller.snapshot().items()}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error saving relay state to {self.path}: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="relay-state-file", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._dirty.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.save()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._dirty.wait()
+            if not self._stop_event.is_set():
+                self.save()
+
+def dispatch_command(controller, line):
+    """Runs one JSON command line and returns the reply dict ({"ok": ...}). {"action": "status"} lists all pins."""
+    try:
+        command = json.loads(line)
+        if isinstance(command, dict) and str(command.get("action", "")).lower() == "status":
+            return {"ok": True, "states": {str(pin): on for pin, on in controller.states().items()}}
+        return dict(controller.handle_command(command), ok=True)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    """One client connection: JSON commands in, one JSON reply line per command out."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            reply = dispatch_command(self.server.controller, line)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, controller):
+        self.controller = controller
+        super().__init__(path, _CommandHandler)
+        os.chmod(path, 0o660) # Owner and group (e.g. gpio) may send commands
+
+def _claim_socket(path):
+    """Removes a stale socket file, or raises OSError if a daemon is still answering on it."""
+    if os.path.exists(path):
+        try:
+            send_command({"action": "status"}, path, timeout=0.5)
+        except (ConnectionRefusedError, FileNotFoundError, socket.timeout):
+            os.unlink(path) # Left behind by a daemon that did not shut down cleanly
+            return
+        raise OSError(f"Another relay daemon is already listening on {path}.")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+def send_command(command, socket_path=DEFAULT_SOCKET, timeout=2.0):
+    """Thin client: sends one command dict to the daemon and returns its reply dict. Raises OSError if unreachable."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(json.dumps(command).encode() + b"\n")
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+    return json.loads(reply)
+
+def run_daemon(pins, socket_path, state_path, mqtt_args=None):
+    """Holds the pins and serves commands on the Unix socket (and MQTT if mqtt_args is given) until stopped."""
+    _claim_socket(socket_path) # Before touching any pin
+    state_file = StateFile(state_path, None) if state_path else None
+    saved = state_file.load() if state_file else {}
+    now = time.time()
+    initial = {pin: state.get("on") and (state.get("until") is None or state["until"] > now)
+               for pin, state in saved.items()}
+    controller = RelayController(pins, initial=initial)
+    if state_file:
+        state_file.controller = controller
+        controller.on_update = state_file.mark_dirty
+    controller.restore(saved)
+    controller.start()
+    if state_file:
+        state_file.start()
+    server = CommandServer(socket_path, controller)
+    threading.Thread(target=server.serve_forever, name="relay-command-server", daemon=True).start()
+    logging.info(f"Relay daemon holding pins {controller.pins} ({controller.states()}), listening on {socket_path}.")
+    signal.signal(signal.SIGTERM, signal.default_int_handler) # systemctl stop: shut down like Ctrl+C
+    try:
+        if mqtt_args:
+            run_mqtt(controller, *mqtt_args)
+        else:
+            threading.Event().wait()
+    finally:
+        server.shutdown()
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+        if state_file:
+            state_file.stop() # Saved before the controller cancels its schedule, so patterns and auto-offs resume
+        # Leave the pins as they are (no cleanup, which would release them); the state file restores them
+        controller.stop(turn_off=False, cleanup=False)
+
 # --- Main Execution (for direct script running) ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Control a GPIO relay.")
@@ -93,6 +581,24 @@ if __name__ == "__main__":
                         help="Delay in seconds for the 'toggle' state. Default: 1.0s")
     parser.add_argument("--test", action="store_true",
                         help="Run a simple toggle test on the specified pin.")
+    parser.add_argument("--mqtt", action="store_true",
+                        help="Run as a relay service driven by JSON commands on the MQTT command topic.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run as a long-lived relay daemon on the Unix socket (add --mqtt to also listen on MQTT).")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET,
+                        help=f"Daemon command socket. Default: RELAY_SOCKET env var or {DEFAULT_SOCKET}.")
+    parser.add_argument("--state-file", type=str, default=DEFAULT_STATE_FILE,
+                        help=f"Daemon pin state file (empty disables). Default: RELAY_STATE_FILE env var or {DEFAULT_STATE_FILE}.")
+    parser.add_argument("--local", action="store_true",
+                        help="Drive the pin directly even if a relay daemon is running.")
+    parser.add_argument("--pins", type=str, default=os.getenv("RELAY_PINS", ""),
+                        help="Comma-separated pins the --mqtt service may drive. Default: RELAY_PINS env var or --pin.")
+    parser.add_argument("--mqtt-host", type=str, default=DEFAULT_MQTT_HOST, help="MQTT broker host. Default: MQTT_HOST env var or localhost.")
+    parser.add_argument("--mqtt-port", type=int, default=DEFAULT_MQTT_PORT, help="MQTT broker port. Default: MQTT_PORT env var or 1883.")
+    parser.add_argument("--command-topic", type=str, default=DEFAULT_COMMAND_TOPIC,
+                        help=f"Topic for relay commands. Default: RELAY_COMMAND_TOPIC env var or {DEFAULT_COMMAND_TOPIC}.")
+    parser.add_argument("--state-topic", type=str, default=DEFAULT_STATE_TOPIC,
+                        help=f"Base topic for retained pin states. Default: RELAY_STATE_TOPIC env var or {DEFAULT_STATE_TOPIC}.")
 
     args = parser.parse_args()
 
@@ -101,6 +607,52 @@ if __name__ == "__main__":
     if not USE_GPIO:
         logging.warning("RPi.GPIO not available. Operations will be simulated.")
 
+    if args.daemon or args.mqtt:
+        try:
+            pins = [int(pin) for pin in args.pins.split(",") if pin.strip()] or [args.pin]
+        except ValueError:
+            logging.error(f"Invalid --pins value: {args.pins}. Exiting.")
+            exit(1)
+
+    if args.daemon:
+        mqtt_args = (args.mqtt_host, args.mqtt_port, args.command_topic, args.state_topic) if args.mqtt else None
+        try:
+            run_daemon(pins, args.socket, args.state_file, mqtt_args)
+        except KeyboardInterrupt:
+            logging.info("Relay daemon interrupted by user.")
+        except Exception as e:
+            logging.error(f"Relay daemon failed: {e}")
+            exit(1)
+        logging.info("gpio_relay.py relay daemon stopped.")
+        exit(0)
+
+    if args.mqtt:
+        controller = RelayController(pins)
+        controller.start()
+        try:
+            run_mqtt(controller, args.mqtt_host, args.mqtt_port, args.command_topic, args.state_topic)
+        except KeyboardInterrupt:
+            logging.info("Relay service interrupted by user.")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+        finally:
+            controller.stop()
+            logging.info("gpio_relay.py relay service stopped.")
+        exit(0)
+
+    if (args.state or args.test) and not args.local and os.path.exists(args.socket):
+        # A daemon holds the pins: send it the command instead of setting the pin up (and resetting it) here
+        command = {"pin": args.pin, "action": "pulse" if args.test or args.state == "toggle" else args.state}
+        if command["action"] == "pulse":
+            command["seconds"] = args.delay
+        try:
+            reply = send_command(command, args.socket)
+        except (OSError, ValueError) as e:
+            logging.error(f"Relay daemon on {args.socket} did not answer: {e}. Use --local to drive the pin directly.")
+            exit(1)
+        print(json.dumps(reply))
+        exit(0 if reply.get("ok") else 1)
+
     if not setup_pin(args.pin):
         logging.error(f"Failed to set up GPIO pin {args.pin}. Exiting.")
         exit(1)
@@ -128,4 +680,3 @@ if __name__ == "__main__":
         # If imported, the importing script should manage cleanup.
         cleanup_gpio()
         logging.info("gpio_relay.py script finished.")
-
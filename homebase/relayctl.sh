@@ -0,0 +1,62 @@
+#!/bin/sh
+# relayctl.sh
+# Thin shell client for the GPIO relay daemon (`gpio_relay.py --daemon`), for hooks such as the UPS
+# shutdown and LTE failover scripts. It sends one JSON command to the daemon's Unix socket and prints
+# the reply, without starting Python or setting up (and resetting) the pins itself.
+# Requires socat or OpenBSD netcat (nc -U).
+#
+# Usage:
+#   relayctl.sh on PIN [SECONDS]                   # SECONDS = turn off again after this long
+#   relayctl.sh off PIN
+#   relayctl.sh pulse PIN SECONDS
+#   relayctl.sh pattern PIN ON_MS OFF_MS [SECONDS] # Strobe, until "off" if no SECONDS
+#   relayctl.sh status
+# Exit status is 0 if the daemon accepted the command, 1 if it refused it or did not answer.
+
+SOCKET="${RELAY_SOCKET:-/run/gpio_relay/gpio_relay.sock}"
+
+usage() {
+    sed -n 's/^#   //p' "$0" >&2
+    exit 2
+}
+
+# Integer (pins, milliseconds) or decimal (seconds) arguments only, so the JSON stays valid
+check_number() {
+    case "$1" in
+        ''|*[!0-9.]*|*.*.*) usage ;;
+    esac
+}
+
+case "$1" in
+    on)
+        check_number "$2"; [ -z "$3" ] || check_number "$3"
+        CMD="{\"pin\": $2, \"action\": \"on\"${3:+, \"seconds\": $3}}" ;;
+    off)
+        check_number "$2"
+        CMD="{\"pin\": $2, \"action\": \"off\"}" ;;
+    pulse)
+        check_number "$2"; check_number "$3"
+        CMD="{\"pin\": $2, \"action\": \"pulse\", \"seconds\": $3}" ;;
+    pattern)
+        check_number "$2"; check_number "$3"; check_number "$4"; [ -z "$5" ] || check_number "$5"
+        CMD="{\"pin\": $2, \"action\": \"pattern\", \"on_ms\": $3, \"off_ms\": $4${5:+, \"seconds\": $5}}" ;;
+    status)
+        CMD='{"action": "status"}' ;;
+    *)
+        usage ;;
+esac
+
+if command -v socat >/dev/null 2>&1; then
+    REPLY=$(printf '%s\n' "$CMD" | socat -t 2 - "UNIX-CONNECT:$SOCKET")
+elif command -v nc >/dev/null 2>&1; then
+    REPLY=$(printf '%s\n' "$CMD" | nc -U -N -w 2 "$SOCKET")
+else
+    echo "relayctl.sh: socat or nc is required" >&2
+    exit 1
+fi
+
+echo "$REPLY"
+case "$REPLY" in
+    *'"ok": true'*) exit 0 ;;
+    *) exit 1 ;;
+esac
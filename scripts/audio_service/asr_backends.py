@@ -0,0 +1,201 @@
+# asr_backends.py
+# Speech recognition backends for audio_service.py (and asr_bench.py).
+# Every backend takes 16 kHz mono float32 audio and returns text, so the service does not care
+# which engine is loaded:
+#   whisper           openai-whisper (PyTorch, float32 on CPU)
+#   faster_whisper    CTranslate2 Whisper with int8 quantization; several times faster on a Pi 5 CPU
+#   keyword_spotting  Vosk recognizer restricted to a keyword grammar; reports only the keywords heard,
+#                     for hardware too slow for full transcription
+# Engines are optional dependencies; only the selected one needs to be installed.
+
+import json
+import threading
+import logging
+
+import numpy as np
+
+# Optional ASR engines
+try:
+    import whisper
+except ImportError:
+    whisper = None
+try:
+    import faster_whisper
+except ImportError:
+    faster_whisper = None
+try:
+    import vosk
+except ImportError:
+    vosk = None
+
+ASR_SAMPLE_RATE = 16000 # All backends take 16 kHz mono float32 audio in [-1.0, 1.0]
+BACKENDS = ("auto", "whisper", "faster_whisper", "keyword_spotting")
+
+def pcm16_to_float32(pcm_bytes, channels=1, rate=ASR_SAMPLE_RATE):
+    """Converts raw 16-bit PCM into the 16 kHz mono float32 array the ASR backends expect."""
+    audio = np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != ASR_SAMPLE_RATE and len(audio):
+        # Linear resampling is adequate for speech; avoids spawning ffmpeg
+        target_length = int(round(len(audio) * ASR_SAMPLE_RATE / rate))
+        audio = np.interp(np.linspace(0, len(audio) - 1, target_length), np.arange(len(audio)), audio).astype(np.float32)
+    return audio
+
+def _split_model_size(model_size):
+    """Splits e.g. "tiny-int8" into ("tiny", "int8"); the suffix is a compute type, not part of the model name."""
+    for compute_type in ("int8_float16", "int8", "float16", "float32"):
+        if model_size.endswith("-" + compute_type):
+            return model_size[:-len(compute_type) - 1], compute_type
+    return model_size, None
+
+class ASRBackend:
+    """Interface: load() once, then transcribe(audio) from any thread.
+
+    Backends whose model can't decode concurrently serialize calls themselves (see WhisperBackend),
+    so parallel callers queue on the model rather than corrupting it.
+    """
+    name = "base"
+
+    def load(self):
+        raise NotImplementedError
+
+    def transcribe(self, audio):
+        """Returns the text spoken in a 16 kHz mono float32 array."""
+        raise NotImplementedError
+
+    def try_transcribe(self, audio):
+        """Like transcribe(), but returns None instead of waiting when the model is busy with another call."""
+        return self.transcribe(audio)
+
+    def transcribe_batch(self, audios):
+        """Transcribes several arrays. Backends without native batching run them one at a time."""
+        return [self.transcribe(audio) for audio in audios]
+
+    def describe(self):
+        """Short description for logs and status messages."""
+        return self.name
+
+class WhisperBackend(ASRBackend):
+    """openai-whisper. Runs float32 on CPU; an "-int8" suffix on the model size is ignored.
+
+    model.transcribe/decode install kv-cache hooks on the shared decoder modules and are not
+    reentrant, so one call at a time runs on the model.
+    """
+    name = "whisper"
+
+    def __init__(self, model_size="tiny", threads=0, model_dir=None, language=None):
+        if whisper is None:
+            raise RuntimeError("openai-whisper is not installed.")
+        self.model_size, compute_type = _split_model_size(model_size)
+        if compute_type and compute_type != "float32":
+            logging.warning(f"openai-whisper has no {compute_type} mode; loading '{self.model_size}' as float32. "
+                            f"Use ASR_BACKEND=faster_whisper for quantized inference.")
+        self.threads = threads
+        self.model_dir = model_dir
+        self.language = language
+        self.model = None
+        self._model_lock = threading.Lock()
+
+    def load(self):
+        if self.threads > 0:
+            import torch
+            torch.set_num_threads(self.threads)
+        self.model = whisper.load_model(self.model_size, download_root=self.model_dir)
+
+    def transcribe(self, audio):
+        with self._model_lock:
+            result = self.model.transcribe(audio, fp16=False, language=self.language) # fp16=False for CPU
+        return result["text"].strip()
+
+    def try_transcribe(self, audio):
+        if not self._model_lock.acquire(blocking=False):
+            return None
+        try:
+            result = self.model.transcribe(audio, fp16=False, language=self.language)
+        finally:
+            self._model_lock.release()
+        return result["text"].strip()
+
+    def transcribe_batch(self, audios):
+        """Decodes recordings of up to 30 s as one padded mel-spectrogram batch (single window, no temperature fallback)."""
+        window_samples = whisper.audio.N_SAMPLES
+        if len(audios) == 1 or any(len(audio) > window_samples for audio in audios):
+            return super().transcribe_batch(audios)
+        import torch
+        mel = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), self.model.dims.n_mels)
+                           for audio in audios]).to(self.model.device)
+        options = whisper.DecodingOptions(fp16=False, language=self.language, without_timestamps=True)
+        with self._model_lock:
+            results = whisper.decode(self.model, mel, options)
+        return [result.text.strip() for result in results]
+
+    def describe(self):
+        return f"whisper/{self.model_size}"
+
+class FasterWhisperBackend(ASRBackend):
+    """faster-whisper (CTranslate2) with a quantized compute type, int8 by default."""
+    name = "faster_whisper"
+
+    def __init__(self, model_size="tiny-int8", threads=0, model_dir=None, language=None, beam_size=1):
+        if faster_whisper is None:
+            raise RuntimeError("faster-whisper is not installed.")
+        self.model_size, compute_type = _split_model_size(model_size)
+        self.compute_type = compute_type or "int8"
+        self.threads = threads
+        self.model_dir = model_dir
+        self.language = language
+        self.beam_size = beam_size # Greedy decoding by default; short replies gain little from beam search
+        self.model = None
+
+    def load(self):
+        self.model = faster_whisper.WhisperModel(self.model_size, device="cpu", compute_type=self.compute_type,
+                                                 cpu_threads=self.threads, download_root=self.model_dir)
+
+    def transcribe(self, audio):
+        segments, _ = self.model.transcribe(audio, beam_size=self.beam_size, language=self.language)
+        return "".join(segment.text for segment in segments).strip()
+
+    def describe(self):
+        return f"faster_whisper/{self.model_size}/{self.compute_type}"
+
+class KeywordSpottingBackend(ASRBackend):
+    """Vosk recognizer limited to a keyword grammar. The "transcript" is the keywords heard, in order."""
+    name = "keyword_spotting"
+
+    def __init__(self, keywords, model_dir=None):
+        if vosk is None:
+            raise RuntimeError("vosk is not installed.")
+        if not model_dir:
+            raise RuntimeError("The keyword_spotting backend needs ASR_MODEL_DIR pointing at an unpacked Vosk model.")
+        # Vosk grammars take plain words/phrases; "word*" prefixes are matched on the stem only
+        self.keywords = sorted({keyword.rstrip("*") for keyword in keywords if keyword.rstrip("*")})
+        self.model_dir = model_dir
+        self.model = None
+
+    def load(self):
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(self.model_dir)
+
+    def transcribe(self, audio):
+        # Recognizers are cheap and not thread-safe, so one per call
+        recognizer = vosk.KaldiRecognizer(self.model, ASR_SAMPLE_RATE, json.dumps(self.keywords + ["[unk]"]))
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        recognizer.AcceptWaveform(pcm)
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        return " ".join(word for word in text.split() if word != "[unk]")
+
+    def describe(self):
+        return f"keyword_spotting/{len(self.keywords)} keywords"
+
+def make_asr_backend(backend, model_size="tiny-int8", threads=0, model_dir=None, language=None, keywords=()):
+    """Creates (but does not load) the configured backend. "auto" prefers faster_whisper when installed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ASR backend '{backend}'. Expected one of {BACKENDS}.")
+    if backend == "auto":
+        backend = "faster_whisper" if faster_whisper is not None else "whisper"
+    if backend == "faster_whisper":
+        return FasterWhisperBackend(model_size, threads=threads, model_dir=model_dir, language=language)
+    if backend == "keyword_spotting":
+        return KeywordSpottingBackend(keywords, model_dir=model_dir)
+    return WhisperBackend(model_size, threads=threads, model_dir=model_dir, language=language)
@@ -0,0 +1,133 @@
+# asr_batcher.py
+# Micro-batching transcription stage for audio_service.py.
+# When several cameras trigger inquiries at once, their recordings finish within a short time of
+# each other. Instead of running the model once per recording, the batcher holds the first
+# recording for up to max_wait_seconds to collect others and runs them through the backend's
+# transcribe_batch() as one padded batch (at most max_batch_size). Callers block on their own
+# result, so the rest of the service still sees a plain transcribe(audio) call.
+
+import time
+import threading
+import logging
+from concurrent.futures import Future
+
+class TranscriptionBatcher:
+    """Collects concurrent transcription requests into batches for transcribe_batch_fn(list of arrays) -> list of text."""
+
+    def __init__(self, transcribe_batch_fn, max_batch_size=4, max_wait_seconds=0.25, metrics_interval=60.0):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self.transcribe_batch_fn = transcribe_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.metrics_interval = metrics_interval
+        self._pending = [] # (audio, future, submitted_at)
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._stop_event = threading.Event() # Wakes the metrics logger on stop
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        self._thread = threading.Thread(target=self._run, name="asr-batcher", daemon=True)
+        self._thread.start()
+        if metrics_interval > 0:
+            threading.Thread(target=self._metrics_loop, name="asr-batcher-metrics", daemon=True).start()
+
+    def transcribe(self, audio, timeout=None):
+        """Queues audio for the next batch and blocks until its transcript is ready."""
+        return self.submit(audio).result(timeout)
+
+    def submit(self, audio):
+        """Queues audio for the next batch. Returns a Future for the transcript."""
+        future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Transcription batcher is stopped.")
+            self._pending.append((audio, future, time.perf_counter()))
+            self._condition.notify()
+        return future
+
+    def stop(self):
+        """Stops after transcribing whatever is already queued."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._stop_event.set()
+        self._thread.join(timeout=30)
+        logging.info(f"Transcription batcher stopped. Final metrics: {self.stats()}")
+
+    def stats(self):
+        """Returns batch fill and per-item latency figures since the last metrics interval."""
+        with self._stats_lock:
+            batches, items = self._batches, self._items
+            return {
+                "batches": batches,
+                "items": items,
+                "mean_batch_size": round(items / batches, 2) if batches else 0.0,
+                "mean_batch_fill": round(items / (batches * self.max_batch_size), 3) if batches else 0.0,
+                "max_batch_size_seen": self._max_seen,
+                "mean_queue_wait_ms": round(self._queue_wait_total / items * 1000, 1) if items else 0.0,
+                "mean_item_latency_ms": round(self._latency_total / items * 1000, 1) if items else 0.0,
+                "max_item_latency_ms": round(self._latency_max * 1000, 1),
+                "mean_batch_compute_ms": round(self._compute_total / batches * 1000, 1) if batches else 0.0,
+            }
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+        self._queue_wait_total = 0.0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._compute_total = 0.0
+
+    def _next_batch(self):
+        """Waits for a first item, then up to max_wait_seconds (from its arrival) for the batch to fill."""
+        with self._condition:
+            while not self._pending and not self._stopped:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][2] + self.max_wait_seconds
+            while len(self._pending) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                texts = self.transcribe_batch_fn([audio for audio, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Error transcribing batch of {len(batch)} recording(s): {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for (_, future, _), text in zip(batch, texts):
+                future.set_result(text)
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._max_seen = max(self._max_seen, len(batch))
+                self._compute_total += finished - started
+                for _, _, submitted_at in batch:
+                    self._queue_wait_total += started - submitted_at
+                    self._latency_total += finished - submitted_at
+                    self._latency_max = max(self._latency_max, finished - submitted_at)
+            if len(batch) > 1:
+                logging.info(f"Transcribed a batch of {len(batch)} recordings in {finished - started:.2f}s.")
+
+    def _metrics_loop(self):
+        while not self._stop_event.wait(self.metrics_interval):
+            if self._batches:
+                logging.info(f"Transcription batcher metrics: {self.stats()}")
+                with self._stats_lock:
+                    self._reset_stats()
@@ -0,0 +1,113 @@
+# asr_bench.py
+# Compares the ASR backends in asr_backends.py on a directory of WAV files (by default the
+# audio prompts). For each backend it reports model load time, per-file latency, real-time factor
+# (processing time / audio duration; below 1.0 is faster than real time) and the transcripts.
+#
+# Usage:
+#   python asr_bench.py [--dir /srv/prompts] [--backends whisper,faster_whisper,keyword_spotting]
+#                       [--model-size tiny-int8] [--threads 4] [--repeat 3] [--model-dir DIR] [--json]
+# Backends whose engine is not installed are reported and skipped.
+
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import logging
+
+from asr_backends import make_asr_backend, pcm16_to_float32, ASR_SAMPLE_RATE
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from keyword_matcher import parse_keyword_list
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def load_wav(path):
+    """Reads a 16-bit PCM WAV file into a 16 kHz mono float32 array."""
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported.")
+        return pcm16_to_float32(wf.readframes(wf.getnframes()), wf.getnchannels(), wf.getframerate())
+
+def bench_backend(backend, clips, repeat):
+    """Loads a backend and transcribes every clip `repeat` times. Returns a result dict."""
+    load_start = time.perf_counter()
+    backend.load()
+    load_seconds = time.perf_counter() - load_start
+    backend.transcribe(clips[0][1]) # Warm-up, not timed
+
+    latencies = []
+    audio_seconds = 0.0
+    transcripts = {}
+    for _ in range(repeat):
+        for name, audio in clips:
+            start = time.perf_counter()
+            text = backend.transcribe(audio)
+            latencies.append(time.perf_counter() - start)
+            audio_seconds += len(audio) / ASR_SAMPLE_RATE
+            transcripts.setdefault(name, text)
+    latencies.sort()
+    return {
+        "backend": backend.describe(),
+        "load_seconds": round(load_seconds, 3),
+        "latency_mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+        "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000, 1),
+        "real_time_factor": round(sum(latencies) / audio_seconds, 3) if audio_seconds else None,
+        "transcripts": transcripts,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ASR backends on a directory of WAV files.")
+    parser.add_argument("--dir", default=os.getenv("AUDIO_PROMPT_DIR", "/srv/prompts"), help="Directory of .wav files.")
+    parser.add_argument("--backends", default="whisper,faster_whisper,keyword_spotting",
+                        help="Comma-separated backends to compare.")
+    parser.add_argument("--model-size", default=os.getenv("WHISPER_MODEL_SIZE", "tiny-int8"))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("ASR_THREADS", "0")), help="0 = engine default.")
+    parser.add_argument("--model-dir", default=os.getenv("ASR_MODEL_DIR", "") or None)
+    parser.add_argument("--language", default=os.getenv("ASR_LANGUAGE", "") or None)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over all files.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print(f"Directory not found: {args.dir}", file=sys.stderr)
+        return 1
+    clips = [(name, load_wav(os.path.join(args.dir, name))) for name in sorted(os.listdir(args.dir)) if name.endswith(".wav")]
+    if not clips:
+        print(f"No .wav files found in {args.dir}.", file=sys.stderr)
+        return 1
+
+    keywords = list(parse_keyword_list(os.getenv("NEGATIVE_KEYWORDS", "angry,leave,attack,police,help,intruder,gun,knife,weapon")))
+    keywords += list(parse_keyword_list(os.getenv("POSITIVE_KEYWORDS_CALM", "delivery,package,mail,food,hello,hi,yes,okay")))
+
+    results = []
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        try:
+            backend = make_asr_backend(name, args.model_size, threads=args.threads, model_dir=args.model_dir,
+                                       language=args.language, keywords=keywords)
+            results.append(bench_backend(backend, clips, args.repeat))
+        except Exception as e:
+            logging.warning(f"Skipping backend {name}: {e}")
+            results.append({"backend": name, "error": str(e)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    total_audio = sum(len(audio) for _, audio in clips) / ASR_SAMPLE_RATE
+    print(f"{len(clips)} file(s), {total_audio:.1f}s of audio, {args.repeat} pass(es)\n")
+    print(f"{'backend':<40} {'load s':>8} {'mean ms':>9} {'p95 ms':>9} {'RTF':>7}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<40} skipped: {result['error']}")
+        else:
+            print(f"{result['backend']:<40} {result['load_seconds']:>8} {result['latency_mean_ms']:>9} "
+                  f"{result['latency_p95_ms']:>9} {result['real_time_factor']:>7}")
+    for result in results:
+        for name, text in result.get("transcripts", {}).items():
+            print(f"  [{result['backend']}] {name}: \"{text}\"")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# audio_prompts.py
+# In-memory prompt library, selection policies and a persistent output stream for audio_service.py.
+# Prompts are decoded once into PCM in a single output format (16-bit, AUDIO_OUTPUT_CHANNELS,
+# AUDIO_OUTPUT_RATE), so one pre-opened PyAudio output stream can play any of them: playing a
+# prompt is a memory copy into the device buffer, with no file I/O or device open per inquiry.
+# The prompt directory is rescanned periodically and new or changed .wav files are picked up
+# without a restart.
+
+import os
+import time
+import wave
+import random
+import threading
+import logging
+from collections import Counter
+
+import numpy as np
+
+SELECTION_RANDOM = "random"           # Uniformly random (original behaviour)
+SELECTION_ROUND_ROBIN = "round_robin" # Cycle through the candidates in name order
+SELECTION_NO_REPEAT = "no_repeat"     # Random, but never the prompt played last
+SELECTION_POLICIES = (SELECTION_RANDOM, SELECTION_ROUND_ROBIN, SELECTION_NO_REPEAT)
+
+class Prompt:
+    """A decoded prompt ready to be written to the output stream."""
+    __slots__ = ("name", "pcm", "duration_seconds", "mtime", "size")
+
+    def __init__(self, name, pcm, duration_seconds, mtime, size):
+        self.name = name
+        self.pcm = pcm # 16-bit PCM bytes in the library's output format
+        self.duration_seconds = duration_seconds
+        self.mtime = mtime
+        self.size = size
+
+def _read_wav(path):
+    """Reads a WAV file into (int16 array shaped (frames, channels), sample rate)."""
+    with wave.open(path, "rb") as wf:
+        channels, width, rate = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    if width == 2:
+        samples = np.frombuffer(raw, dtype=np.int16)
+    elif width == 1:
+        samples = ((np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128) << 8).astype(np.int16)
+    elif width == 4:
+        samples = (np.frombuffer(raw, dtype=np.int32) >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"unsupported sample width {width * 8} bits")
+    return samples.reshape(-1, channels), rate
+
+def _convert(samples, rate, channels, target_rate, target_channels):
+    """Converts int16 (frames, channels) audio to the target channel count and sample rate."""
+    if channels != target_channels:
+        mono = samples.astype(np.float32).mean(axis=1)
+        samples = np.repeat(mono[:, None], target_channels, axis=1)
+    if rate != target_rate and len(samples):
+        target_frames = int(round(len(samples) * target_rate / rate))
+        positions = np.linspace(0, len(samples) - 1, target_frames)
+        samples = np.stack([np.interp(positions, np.arange(len(samples)), samples[:, c]) for c in range(samples.shape[1])], axis=1)
+    return np.clip(np.round(samples), -32768, 32767).astype(np.int16)
+
+class PromptLibrary:
+    """Decoded .wav prompts from a directory, kept in memory and refreshed by a background rescan."""
+
+    def __init__(self, prompt_dir, channels=1, rate=0, rescan_seconds=30.0):
+        self.prompt_dir = prompt_dir
+        self.channels = channels
+        self.rate = rate # 0 = the most common sample rate among the prompts found at the first load
+        self.rescan_seconds = rescan_seconds
+        self._prompts = {} # name -> Prompt; replaced wholesale on rescan so readers never lock
+        self._failed = {}  # name -> (mtime, size) of files that failed to decode, retried only once changed
+        self._stop = threading.Event()
+        self._thread = None
+
+    def names(self):
+        """Returns the loaded prompt names in sorted order."""
+        return sorted(self._prompts)
+
+    def get(self, name):
+        return self._prompts.get(name)
+
+    def __len__(self):
+        return len(self._prompts)
+
+    def load(self):
+        """Scans the directory, decoding new or changed .wav files. Returns True if the prompt set changed."""
+        if not os.path.isdir(self.prompt_dir):
+            if self._prompts:
+                logging.warning(f"Audio prompt directory {self.prompt_dir} disappeared. Keeping loaded prompts.")
+            return False
+        entries = {}
+        for name in os.listdir(self.prompt_dir):
+            if name.endswith(".wav"):
+                try:
+                    stat = os.stat(os.path.join(self.prompt_dir, name))
+                    entries[name] = (stat.st_mtime, stat.st_size)
+                except OSError:
+                    continue
+
+        current = self._prompts
+        changed = [name for name, (mtime, size) in entries.items()
+                   if (name not in current or (current[name].mtime, current[name].size) != (mtime, size))
+                   and self._failed.get(name) != (mtime, size)]
+        removed = [name for name in current if name not in entries]
+        if not changed and not removed:
+            return False
+
+        decoded = {}
+        for name in changed:
+            try:
+                decoded[name] = _read_wav(os.path.join(self.prompt_dir, name))
+            except (OSError, EOFError, ValueError, wave.Error) as e:
+                self._failed[name] = entries[name]
+                logging.error(f"Failed to load audio prompt {name}: {e!r}")
+        if not self.rate and decoded:
+            self.rate = Counter(rate for _, rate in decoded.values()).most_common(1)[0][0]
+
+        prompts = {name: prompt for name, prompt in current.items() if name in entries and name not in changed}
+        for name, (samples, rate) in decoded.items():
+            converted = _convert(samples, rate, samples.shape[1], self.rate, self.channels)
+            mtime, size = entries[name]
+            prompts[name] = Prompt(name, converted.tobytes(), len(converted) / self.rate, mtime, size)
+        self._prompts = prompts
+        logging.info(f"Audio prompts loaded: {sorted(decoded)}; removed: {sorted(removed)}; "
+                     f"{len(prompts)} available at {self.rate} Hz, {self.channels} channel(s).")
+        return True
+
+    def start(self):
+        """Starts the background directory rescan (no-op if rescan_seconds <= 0)."""
+        if self.rescan_seconds <= 0 or self._thread:
+            return
+        self._thread = threading.Thread(target=self._rescan_loop, name="prompt-rescan", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _rescan_loop(self):
+        while not self._stop.wait(self.rescan_seconds):
+            try:
+                self.load()
+            except Exception as e:
+                logging.error(f"Error rescanning audio prompts: {e}")
+
+def parse_prompt_map(text):
+    """Parses "person:who_are_you.wav|state_reason.wav,front/vehicle:hello.wav" into {key: [prompt names]}."""
+    prompt_map = {}
+    for entry in text.split(","):
+        key, _, names = entry.partition(":")
+        names = [name.strip() for name in names.split("|") if name.strip()]
+        if key.strip() and names:
+            prompt_map[key.strip().lower()] = names
+    return prompt_map
+
+class PromptSelector:
+    """Chooses a prompt for an inquiry.
+
+    The candidates are narrowed by the prompt map, looked up by "<camera>/<label>", then the label,
+    then the camera from the trigger; with no mapping (or no mapped prompt loaded) every prompt is
+    a candidate. The policy then picks among the candidates.
+    """
+
+    def __init__(self, policy=SELECTION_RANDOM, prompt_map=None):
+        if policy not in SELECTION_POLICIES:
+            raise ValueError(f"Unknown prompt selection policy '{policy}'. Expected one of {SELECTION_POLICIES}.")
+        self.policy = policy
+        self.prompt_map = prompt_map or {}
+        self._lock = threading.Lock()
+        self._next_index = {} # Candidate tuple -> round-robin position
+        self._last = None
+
+    def candidates(self, request, names):
+        label = str(request.get("label") or "").lower()
+        camera = str(request.get("camera") or "").lower()
+        for key in (f"{camera}/{label}", label, camera):
+            mapped = [name for name in self.prompt_map.get(key, ()) if name in names]
+            if mapped:
+                return mapped
+        return list(names)
+
+    def select(self, request, names):
+        """Returns a prompt name from names for this inquiry request, or None if there are none."""
+        candidates = self.candidates(request, names)
+        if not candidates:
+            return None
+        with self._lock:
+            if self.policy == SELECTION_ROUND_ROBIN:
+                key = tuple(candidates)
+                index = self._next_index.get(key, 0)
+                self._next_index[key] = index + 1
+                choice = candidates[index % len(candidates)]
+            elif self.policy == SELECTION_NO_REPEAT and len(candidates) > 1:
+                choice = random.choice([name for name in candidates if name != self._last])
+            else:
+                choice = random.choice(candidates)
+            self._last = choice
+        return choice
+
+class PromptPlayer:
+    """Plays library prompts through one output stream that is opened once and kept open."""
+
+    def __init__(self, py_audio, library, output_device_index=None, chunk_size=2048):
+        self.py_audio = py_audio
+        self.library = library
+        self.output_device_index = output_device_index
+        self.chunk_size = chunk_size
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Opens the output stream ahead of the first inquiry."""
+        with self._lock:
+            self._open_locked()
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def play(self, name):
+        """Plays a prompt and waits until it has been heard. Returns seconds to first audio, or None on failure."""
+        prompt = self.library.get(name)
+        if prompt is None:
+            logging.error(f"Audio prompt not loaded: {name}")
+            return None
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    return self._play_locked(prompt)
+                except Exception as e:
+                    # The device may have gone away (e.g. USB speaker replugged); reopen once and retry
+                    logging.error(f"Error playing audio prompt {name} (attempt {attempt}): {e}")
+                    self._close_locked()
+        return None
+
+    def _play_locked(self, prompt):
+        start = time.perf_counter()
+        self._open_locked()
+        bytes_per_chunk = self.chunk_size * self.library.channels * 2
+        time_to_first_audio = None
+        for offset in range(0, len(prompt.pcm), bytes_per_chunk):
+            self._stream.write(prompt.pcm[offset:offset + bytes_per_chunk])
+            if time_to_first_audio is None:
+                time_to_first_audio = time.perf_counter() - start
+        # write() returns once data is buffered; wait for the buffered tail so the recording doesn't catch it
+        time.sleep(self._stream.get_output_latency())
+        logging.info(f"Played audio prompt {prompt.name} ({prompt.duration_seconds:.2f}s, "
+                     f"first audio after {(time_to_first_audio or 0.0) * 1000:.1f} ms).")
+        return time_to_first_audio
+
+    def _open_locked(self):
+        if self._stream is not None:
+            return
+        self._stream = self.py_audio.open(format=self.py_audio.get_format_from_width(2),
+                                          channels=self.library.channels,
+                                          rate=self.library.rate,
+                                          output=True,
+                                          frames_per_buffer=self.chunk_size,
+                                          output_device_index=self.output_device_index)
+        logging.info(f"Opened persistent audio output stream ({self.library.rate} Hz, {self.library.channels} channel(s)).")
+
+    def _close_locked(self):
+        if self._stream is None:
+            return
+        try:
+            self._stream.stop_stream()
+            self._stream.close()
+        except Exception as e:
+            logging.warning(f"Error closing audio output stream: {e}")
+        self._stream = None
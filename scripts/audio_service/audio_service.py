@@ -5,19 +5,33 @@
 # and publishes the results back via MQTT.
 
 import os
+import sys
 import json
-import random
 import time
 import wave
+import threading
 import paho.mqtt.client as mqtt
 import logging
 
+from audio_vad import EnergyVAD, VADRecordingState, STOP_NO_SPEECH, STOP_MAX_DURATION
+from inquiry_scheduler import InquiryScheduler
+from audio_stream import StreamingTranscriber
+from audio_prompts import PromptLibrary, PromptSelector, PromptPlayer, parse_prompt_map, SELECTION_POLICIES
+from asr_batcher import TranscriptionBatcher
+from asr_backends import make_asr_backend, pcm16_to_float32, ASR_SAMPLE_RATE, BACKENDS as ASR_BACKENDS
+
+# keyword_matcher.py is shared with the scorer and lives in scripts/ (the Docker image copies it next to this file)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from keyword_matcher import KeywordMatcher, parse_keyword_list
+from service_metrics import MetricsRegistry
+from event_trace import mark
+
 # Attempt to import audio-related libraries
 try:
+    import numpy as np
     import pyaudio
-    from whisper import load_model as load_whisper_model
 except ImportError as e:
-    logging.error(f"Missing critical audio dependency: {e}. Please install pyaudio and openai-whisper.")
+    logging.error(f"Missing critical audio dependency: {e}. Please install numpy and pyaudio.")
     exit(1)
 
 # --- Configuration from Environment Variables ---
@@ -27,11 +41,11 @@ try:
     MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
     MQTT_INQUIRY_LISTEN_TOPIC = os.getenv("MQTT_INQUIRY_LISTEN_TOPIC", "vz/inquiry/#") # Topic to listen for inquiry triggers
     MQTT_AUDIO_RESULT_TOPIC_BASE = os.getenv("MQTT_AUDIO_RESULT_TOPIC_BASE", "vz/audio") # Base topic to publish audio results
+    MQTT_STATUS_TOPIC = os.getenv("MQTT_STATUS_TOPIC", "vz/status/audio_service") # Retained readiness/health status
 
     # Audio Configuration
     AUDIO_PROMPT_DIR = os.getenv("AUDIO_PROMPT_DIR", "/srv/prompts") # Directory containing .wav prompt files
     AUDIO_RECORD_SECONDS = int(os.getenv("AUDIO_RECORD_SECONDS", "5"))
-    AUDIO_RECORD_FILENAME_TMP = os.getenv("AUDIO_RECORD_FILENAME_TMP", "/tmp/recorded_reply.wav")
     AUDIO_CHANNELS = int(os.getenv("AUDIO_CHANNELS", "1"))
     AUDIO_RATE = int(os.getenv("AUDIO_RATE", "16000"))
     AUDIO_FORMAT_PYAUDIO = pyaudio.paInt16 # Corresponds to 16-bit audio
@@ -39,12 +53,57 @@ try:
     AUDIO_INPUT_DEVICE_INDEX = os.getenv("AUDIO_INPUT_DEVICE_INDEX") # Optional: specify input device index
     AUDIO_OUTPUT_DEVICE_INDEX = os.getenv("AUDIO_OUTPUT_DEVICE_INDEX") # Optional: specify output device index
 
-    # Whisper Model Configuration
-    WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "tiny-int8") # e.g., tiny, base, small, medium (int8 for efficiency)
-
-    # Sentiment/Keyword Analysis
-    NEGATIVE_KEYWORDS = os.getenv("NEGATIVE_KEYWORDS", "angry,leave,attack,police,help,intruder,gun,knife,weapon").split(',')
-    POSITIVE_KEYWORDS_CALM = os.getenv("POSITIVE_KEYWORDS_CALM", "delivery,package,mail,food,hello,hi,yes,okay").split(',')
+    # Prompt Playback (prompts are decoded into memory and played through one persistent output stream)
+    AUDIO_OUTPUT_RATE = int(os.getenv("AUDIO_OUTPUT_RATE", "0")) # 0 = most common prompt sample rate
+    AUDIO_OUTPUT_CHANNELS = int(os.getenv("AUDIO_OUTPUT_CHANNELS", "1"))
+    AUDIO_PROMPT_RESCAN_SECONDS = float(os.getenv("AUDIO_PROMPT_RESCAN_SECONDS", "30")) # Pick up new/changed prompts; 0 disables
+    AUDIO_PROMPT_SELECTION = os.getenv("AUDIO_PROMPT_SELECTION", "random").lower() # random, round_robin or no_repeat
+    AUDIO_PROMPT_MAP = parse_prompt_map(os.getenv("AUDIO_PROMPT_MAP", "")) # e.g. "person:who_are_you.wav|state_reason.wav"
+
+    # Voice Activity Detection (AUDIO_RECORD_SECONDS becomes the maximum recording length)
+    AUDIO_VAD_ENABLED = os.getenv("AUDIO_VAD_ENABLED", "true").lower() == "true"
+    AUDIO_VAD_ENERGY_THRESHOLD_DBFS = float(os.getenv("AUDIO_VAD_ENERGY_THRESHOLD_DBFS", "-45")) # Minimum speech energy
+    AUDIO_VAD_NOISE_MARGIN_DB = float(os.getenv("AUDIO_VAD_NOISE_MARGIN_DB", "10")) # Speech must exceed the noise floor by this
+    AUDIO_VAD_ZCR_MAX = float(os.getenv("AUDIO_VAD_ZCR_MAX", "0.35")) # Max zero-crossing rate for speech chunks
+    AUDIO_VAD_TRAILING_SILENCE_SECONDS = float(os.getenv("AUDIO_VAD_TRAILING_SILENCE_SECONDS", "0.8")) # Stop after this much silence
+    AUDIO_VAD_NO_SPEECH_TIMEOUT_SECONDS = float(os.getenv("AUDIO_VAD_NO_SPEECH_TIMEOUT_SECONDS", "2.5")) # Give up if no speech starts
+
+    # Streaming Transcription (partial results on <MQTT_AUDIO_RESULT_TOPIC_BASE>/<event_id>/partial)
+    AUDIO_STREAMING_ENABLED = os.getenv("AUDIO_STREAMING_ENABLED", "false").lower() == "true"
+    AUDIO_STREAM_WINDOW_SECONDS = float(os.getenv("AUDIO_STREAM_WINDOW_SECONDS", "3.0")) # Audio transcribed per partial
+    AUDIO_STREAM_HOP_SECONDS = float(os.getenv("AUDIO_STREAM_HOP_SECONDS", "1.0")) # New audio between partials
+
+    # ASR (Speech Recognition) Configuration
+    ASR_BACKEND = os.getenv("ASR_BACKEND", "auto").lower() # auto, whisper, faster_whisper or keyword_spotting
+    WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "tiny-int8") # e.g., tiny, base, small, medium; "-int8" = quantized (faster_whisper)
+    WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "true").lower() == "true" # Run one dummy transcription at startup
+    ASR_MODEL_DIR = os.getenv("ASR_MODEL_DIR", "") # Optional local model cache (required Vosk model for keyword_spotting)
+    ASR_THREADS = int(os.getenv("ASR_THREADS", "0")) # CPU threads per model; 0 = engine default
+    ASR_LANGUAGE = os.getenv("ASR_LANGUAGE", "") or None # e.g. "en"; skips language detection
+    # Inquiries arriving before the model is loaded: "queue" (prompt and record now, transcribe once loaded)
+    # or "fail" (publish an "asr_not_ready" result immediately so the scorer decides on the visual score)
+    AUDIO_NOT_READY_POLICY = os.getenv("AUDIO_NOT_READY_POLICY", "queue").lower()
+    AUDIO_MODEL_WAIT_SECONDS = float(os.getenv("AUDIO_MODEL_WAIT_SECONDS", "60")) # Max wait for the model per queued inquiry
+
+    # Transcription Micro-Batching (recordings finishing close together are transcribed as one batch)
+    AUDIO_BATCH_MAX_SIZE = int(os.getenv("AUDIO_BATCH_MAX_SIZE", "1")) # 1 disables batching
+    AUDIO_BATCH_MAX_WAIT_SECONDS = float(os.getenv("AUDIO_BATCH_MAX_WAIT_SECONDS", "0.25")) # Max hold for the first recording
+    AUDIO_BATCH_METRICS_INTERVAL = float(os.getenv("AUDIO_BATCH_METRICS_INTERVAL", "60")) # Seconds, 0 disables
+
+    # Inquiry Scheduling
+    AUDIO_TRANSCRIBE_WORKERS = int(os.getenv("AUDIO_TRANSCRIBE_WORKERS", "1")) # Inquiries transcribed/analyzed in parallel
+    AUDIO_INQUIRY_QUEUE_SIZE = int(os.getenv("AUDIO_INQUIRY_QUEUE_SIZE", "10")) # Max queued inquiries per speaker device
+
+    # Sentiment/Keyword Analysis (whole words/phrases, optional ":weight", "word*" for prefixes)
+    NEGATIVE_KEYWORDS = parse_keyword_list(os.getenv("NEGATIVE_KEYWORDS", "angry,leave,attack,police,help,intruder,gun,knife,weapon"))
+    POSITIVE_KEYWORDS_CALM = parse_keyword_list(os.getenv("POSITIVE_KEYWORDS_CALM", "delivery,package,mail,food,hello,hi,yes,okay"))
+
+    # Metrics (Prometheus text format on http://<host>:<port>/metrics, optional JSON snapshots on MQTT)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_HTTP_HOST = os.getenv("METRICS_HTTP_HOST", "0.0.0.0")
+    METRICS_HTTP_PORT = int(os.getenv("METRICS_HTTP_PORT", "9102")) # 0 disables the HTTP endpoint
+    METRICS_MQTT_TOPIC = os.getenv("METRICS_MQTT_TOPIC", "") # e.g. "vz/stats/audio_service"; empty disables
+    METRICS_MQTT_INTERVAL = float(os.getenv("METRICS_MQTT_INTERVAL", "60")) # Seconds between MQTT snapshots
 
 except ValueError as e:
     logging.error(f"Error reading environment variable: {e}. Please check data types.")
@@ -54,86 +113,157 @@ except Exception as e:
     exit(1)
 
 # --- Logging Setup ---
-logging.basicConfig(level=logging.INFO, format=\'%(asctime)s - %(levelname)s - %(message)s\')
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Both keyword lists compiled into one matcher; a transcript is scanned once
+keyword_matcher = KeywordMatcher({"negative": NEGATIVE_KEYWORDS, "calm": POSITIVE_KEYWORDS_CALM})
 
 # --- Global Variables ---
 py_audio_interface = None
-whisper_model = None
-available_prompts = []
+asr_backend = None
+transcription_batcher = None
+prompt_library = None
+prompt_selector = None
+prompt_player = None
+mqtt_client = None
+inquiry_scheduler = None
+asr_ready = threading.Event()     # Set once the ASR model is loaded (and warmed up)
+service_state = "starting"        # starting, loading_model, ready or failed; published retained on MQTT_STATUS_TOPIC
+startup_started_at = time.monotonic()
+startup_timings = {}              # Startup phase -> seconds, logged and included in the "ready" status
+
+# --- Metrics ---
+# No-op objects unless METRICS_ENABLED
+metrics = MetricsRegistry(enabled=METRICS_ENABLED)
+stage_seconds = metrics.histogram("audio_stage_seconds", "Time spent per inquiry stage.", ("stage",))
+inquiries_total = metrics.counter("audio_inquiries_total", "Inquiry triggers by outcome.", ("result",))
+metrics.gauge("audio_asr_ready", "1 once the ASR model is loaded.", fn=lambda: asr_ready.is_set())
+metrics.gauge("audio_inquiries_active", "Inquiries queued or in progress.",
+              fn=lambda: inquiry_scheduler.stats()["active"] if inquiry_scheduler else 0)
+metrics.gauge("audio_inquiries_coalesced", "Duplicate triggers merged into an active inquiry since start.",
+              fn=lambda: inquiry_scheduler.coalesced_count if inquiry_scheduler else 0)
+metrics.gauge("audio_inquiries_rejected", "Triggers dropped on a full device queue since start.",
+              fn=lambda: inquiry_scheduler.rejected_count if inquiry_scheduler else 0)
 
 # --- Helper Functions ---
 def initialize_audio_system():
-    """Initializes PyAudio and loads the Whisper model."""
-    global py_audio_interface, whisper_model, available_prompts
+    """Initializes PyAudio, the prompt library and the output stream. The ASR model is loaded by load_asr_model()."""
+    global py_audio_interface, prompt_library, prompt_selector, prompt_player
     try:
+        phase_start = time.monotonic()
         py_audio_interface = pyaudio.PyAudio()
+        startup_timings["pyaudio_init"] = round(time.monotonic() - phase_start, 3)
         logging.info("PyAudio interface initialized.")
 
-        # List available audio prompts
-        if os.path.isdir(AUDIO_PROMPT_DIR):
-            available_prompts = [f for f in os.listdir(AUDIO_PROMPT_DIR) if f.endswith(".wav")]
-            if not available_prompts:
-                logging.warning(f"No .wav prompt files found in {AUDIO_PROMPT_DIR}.")
-            else:
-                logging.info(f"Available audio prompts: {available_prompts}")
-        else:
+        # Decode the audio prompts into memory and open the output stream once
+        phase_start = time.monotonic()
+        prompt_library = PromptLibrary(AUDIO_PROMPT_DIR, channels=AUDIO_OUTPUT_CHANNELS, rate=AUDIO_OUTPUT_RATE,
+                                       rescan_seconds=AUDIO_PROMPT_RESCAN_SECONDS)
+        if not os.path.isdir(AUDIO_PROMPT_DIR):
             logging.warning(f"Audio prompt directory {AUDIO_PROMPT_DIR} not found.")
-
-        logging.info(f"Loading Whisper model: {WHISPER_MODEL_SIZE}...")
-        whisper_model = load_whisper_model(WHISPER_MODEL_SIZE)
-        logging.info("Whisper model loaded successfully.")
+        prompt_library.load()
+        if not len(prompt_library):
+            logging.warning(f"No .wav prompt files found in {AUDIO_PROMPT_DIR}.")
+        prompt_library.start()
+        prompt_selector = PromptSelector(AUDIO_PROMPT_SELECTION, AUDIO_PROMPT_MAP)
+        output_device_index_int = int(AUDIO_OUTPUT_DEVICE_INDEX) if AUDIO_OUTPUT_DEVICE_INDEX else None
+        prompt_player = PromptPlayer(py_audio_interface, prompt_library, output_device_index_int, AUDIO_CHUNK_SIZE)
+        if len(prompt_library):
+            prompt_player.open()
+        startup_timings["prompt_load"] = round(time.monotonic() - phase_start, 3)
         return True
 
     except Exception as e:
         logging.error(f"Error initializing audio system: {e}")
         return False
 
+def load_asr_model():
+    """Loads (and warms up) the ASR backend. Runs in the background while MQTT is already connected."""
+    global asr_backend
+    try:
+        set_service_state("loading_model")
+        backend = make_asr_backend(ASR_BACKEND, WHISPER_MODEL_SIZE, threads=ASR_THREADS, model_dir=ASR_MODEL_DIR or None,
+                                   language=ASR_LANGUAGE, keywords=list(NEGATIVE_KEYWORDS) + list(POSITIVE_KEYWORDS_CALM))
+        logging.info(f"Loading ASR model: {backend.describe()}...")
+        phase_start = time.monotonic()
+        backend.load()
+        startup_timings["model_load"] = round(time.monotonic() - phase_start, 3)
+        logging.info(f"ASR model loaded successfully in {startup_timings['model_load']:.2f}s.")
+
+        if WHISPER_WARMUP:
+            # The first transcription pays one-off allocation and kernel setup costs; pay them now
+            phase_start = time.monotonic()
+            backend.transcribe(np.zeros(ASR_SAMPLE_RATE, dtype=np.float32))
+            startup_timings["model_warmup"] = round(time.monotonic() - phase_start, 3)
+            logging.info(f"ASR model warmed up in {startup_timings['model_warmup']:.2f}s.")
+        asr_backend = backend
+
+        startup_timings["total_to_ready"] = round(time.monotonic() - startup_started_at, 3)
+        asr_ready.set()
+        set_service_state("ready")
+        logging.info(f"Audio service ready. Startup timings (s): {startup_timings}")
+    except Exception as e:
+        logging.critical(f"Failed to load ASR model ({ASR_BACKEND}, {WHISPER_MODEL_SIZE}): {e}")
+        set_service_state("failed", error=str(e))
+        # Ends loop_forever() so the process exits non-zero and the container restart policy applies
+        mqtt_client.disconnect()
+
+def set_service_state(state, **details):
+    """Updates the service state and publishes it, retained, on MQTT_STATUS_TOPIC."""
+    global service_state
+    service_state = state
+    publish_service_status(**details)
+
+def publish_service_status(**details):
+    """Publishes the current service state (retained) so other services can check readiness at any time."""
+    status_payload = {
+        "state": service_state,
+        "asr_backend": asr_backend.describe() if asr_backend else ASR_BACKEND,
+        "model": WHISPER_MODEL_SIZE,
+        "uptime_seconds": round(time.monotonic() - startup_started_at, 3),
+        "timestamp": time.time()
+    }
+    if service_state == "ready":
+        status_payload["startup_timings"] = startup_timings
+    status_payload.update(details)
+    try:
+        # QoS 1 messages published before the connection completes are queued by Paho
+        mqtt_client.publish(MQTT_STATUS_TOPIC, json.dumps(status_payload), qos=1, retain=True)
+    except Exception as e:
+        logging.error(f"Error publishing service status: {e}")
+
+def asr_unavailable_result(event_id, reason="asr_not_ready"):
+    """Result payload for an inquiry that could not be transcribed because the model is not loaded."""
+    return {
+        "id": event_id,
+        "transcript": "",
+        "tone": "unknown",
+        "matched_keywords": [],
+        "error": reason,
+        "timestamp": time.time()
+    }
+
 def play_audio_prompt(prompt_filename):
-    """Plays a specified .wav audio prompt."""
-    if not py_audio_interface:
+    """Plays a preloaded audio prompt through the persistent output stream."""
+    if not prompt_player:
         logging.error("PyAudio not initialized. Cannot play audio.")
         return
-    
-    filepath = os.path.join(AUDIO_PROMPT_DIR, prompt_filename)
-    if not os.path.exists(filepath):
-        logging.error(f"Prompt file not found: {filepath}")
-        return
+    with stage_seconds.labels("prompt").time():
+        prompt_player.play(prompt_filename)
 
-    wf = None
-    stream = None
-    try:
-        wf = wave.open(filepath, 'rb')
-        output_device_index_int = int(AUDIO_OUTPUT_DEVICE_INDEX) if AUDIO_OUTPUT_DEVICE_INDEX else None
-        stream = py_audio_interface.open(format=py_audio_interface.get_format_from_width(wf.getsampwidth()),
-                                       channels=wf.getnchannels(),
-                                       rate=wf.getframerate(),
-                                       output=True,
-                                       output_device_index=output_device_index_int)
-        logging.info(f"Playing audio prompt: {filepath}")
-        data = wf.readframes(AUDIO_CHUNK_SIZE)
-        while data:
-            stream.write(data)
-            data = wf.readframes(AUDIO_CHUNK_SIZE)
-        logging.info("Finished playing audio prompt.")
-    except FileNotFoundError:
-        logging.error(f"Audio prompt file not found: {filepath}")
-    except Exception as e:
-        logging.error(f"Error playing audio prompt {filepath}: {e}")
-    finally:
-        if stream:
-            stream.stop_stream()
-            stream.close()
-        if wf:
-            wf.close()
+def record_audio_response(streamer=None):
+    """Records the visitor's reply from the microphone.
 
-def record_audio_response():
-    """Records audio from the microphone for a specified duration."""
+    With AUDIO_VAD_ENABLED, recording stops after AUDIO_VAD_TRAILING_SILENCE_SECONDS of silence
+    following speech, or after AUDIO_VAD_NO_SPEECH_TIMEOUT_SECONDS if no speech starts; otherwise
+    it lasts AUDIO_RECORD_SECONDS. Chunks are also fed to the optional StreamingTranscriber.
+    Returns (float32 NumPy array, recording summary dict), or (None, None) on error.
+    """
     if not py_audio_interface:
         logging.error("PyAudio not initialized. Cannot record audio.")
-        return None
+        return None, None
 
     stream = None
-    wf = None
     try:
         input_device_index_int = int(AUDIO_INPUT_DEVICE_INDEX) if AUDIO_INPUT_DEVICE_INDEX else None
         stream = py_audio_interface.open(format=AUDIO_FORMAT_PYAUDIO,
@@ -142,44 +272,79 @@ def record_audio_response():
                                        input=True,
                                        frames_per_buffer=AUDIO_CHUNK_SIZE,
                                        input_device_index=input_device_index_int)
-        logging.info(f"Recording audio for {AUDIO_RECORD_SECONDS} seconds...")
+        chunk_seconds = AUDIO_CHUNK_SIZE / AUDIO_RATE
+        max_chunks = int(AUDIO_RATE / AUDIO_CHUNK_SIZE * AUDIO_RECORD_SECONDS)
+        vad_state = None
+        if AUDIO_VAD_ENABLED:
+            vad = EnergyVAD(channels=AUDIO_CHANNELS,
+                            energy_threshold_dbfs=AUDIO_VAD_ENERGY_THRESHOLD_DBFS,
+                            noise_margin_db=AUDIO_VAD_NOISE_MARGIN_DB,
+                            zcr_max=AUDIO_VAD_ZCR_MAX)
+            vad_state = VADRecordingState(vad, chunk_seconds, AUDIO_RECORD_SECONDS,
+                                          trailing_silence_seconds=AUDIO_VAD_TRAILING_SILENCE_SECONDS,
+                                          no_speech_timeout_seconds=AUDIO_VAD_NO_SPEECH_TIMEOUT_SECONDS)
+            logging.info(f"Recording audio for up to {AUDIO_RECORD_SECONDS} seconds (VAD enabled)...")
+        else:
+            logging.info(f"Recording audio for {AUDIO_RECORD_SECONDS} seconds...")
+
         frames = []
-        for _ in range(0, int(AUDIO_RATE / AUDIO_CHUNK_SIZE * AUDIO_RECORD_SECONDS)):
+        for _ in range(0, max_chunks):
             data = stream.read(AUDIO_CHUNK_SIZE)
             frames.append(data)
-        logging.info("Finished recording.")
-
-        # Save the recorded data as a WAV file
-        wf = wave.open(AUDIO_RECORD_FILENAME_TMP, 'wb')
-        wf.setnchannels(AUDIO_CHANNELS)
-        wf.setsampwidth(py_audio_interface.get_sample_size(AUDIO_FORMAT_PYAUDIO))
-        wf.setframerate(AUDIO_RATE)
-        wf.writeframes(b''.join(frames))
-        logging.info(f"Recorded audio saved to {AUDIO_RECORD_FILENAME_TMP}")
-        return AUDIO_RECORD_FILENAME_TMP
+            stop = vad_state.add_chunk(data) if vad_state else False
+            if streamer:
+                # Don't spend CPU transcribing windows until someone has actually started talking
+                streamer.feed(pcm16_to_float32(data, AUDIO_CHANNELS, AUDIO_RATE), submit=vad_state is None or vad_state.speech_onset_seconds is not None)
+            if stop:
+                break
+
+        if vad_state:
+            recording_summary = vad_state.summary()
+        else:
+            recording_summary = {
+                "speech_detected": None,
+                "speech_onset_seconds": None,
+                "speech_end_seconds": None,
+                "recorded_seconds": round(len(frames) * chunk_seconds, 3),
+                "stop_reason": STOP_MAX_DURATION,
+            }
+        logging.info(f"Finished recording: {recording_summary}")
+
+        # Keep the recording in memory; no temporary WAV file or ffmpeg decode needed
+        return pcm16_to_float32(b''.join(frames), AUDIO_CHANNELS, AUDIO_RATE), recording_summary
 
     except Exception as e:
         logging.error(f"Error recording audio: {e}")
-        return None
+        return None, None
     finally:
         if stream:
             stream.stop_stream()
             stream.close()
-        if wf:
-            wf.close()
 
-def transcribe_audio(filepath):
-    """Transcribes the audio file to text using Whisper."""
-    if not whisper_model:
-        logging.error("Whisper model not loaded. Cannot transcribe.")
+def transcribe_audio(audio, batched=True, partial=False):
+    """Transcribes a 16 kHz mono float32 NumPy array to text using the loaded ASR backend.
+
+    With AUDIO_BATCH_MAX_SIZE > 1 the recording goes through the micro-batcher unless batched=False.
+    Streaming partials (partial=True) bypass the batcher and return None rather than wait while
+    the model is busy with a final transcription, so they never queue on or delay it.
+    """
+    if not asr_backend:
+        logging.error("ASR model not loaded. Cannot transcribe.")
         return None
-    if not os.path.exists(filepath):
-        logging.error(f"Audio file for transcription not found: {filepath}")
+    if audio is None or not len(audio):
+        logging.error("No audio to transcribe.")
         return None
     try:
-        logging.info(f"Transcribing audio file: {filepath}...")
-        result = whisper_model.transcribe(filepath, fp16=False) # fp16=False for CPU, can be True for GPU
-        transcript = result["text"].strip()
+        logging.info(f"Transcribing {len(audio) / ASR_SAMPLE_RATE:.1f}s of audio...")
+        if partial:
+            transcript = asr_backend.try_transcribe(audio)
+            if transcript is None:
+                logging.debug("ASR model busy. Skipping partial window.")
+                return None
+        elif batched and transcription_batcher:
+            transcript = transcription_batcher.transcribe(audio)
+        else:
+            transcript = asr_backend.transcribe(audio)
         logging.info(f"Transcription result: \"{transcript}\"")
         return transcript
     except Exception as e:
@@ -187,111 +352,184 @@ def transcribe_audio(filepath):
         return None
 
 def analyze_transcript(transcript):
-    """Performs basic sentiment/keyword analysis on the transcript."""
+    """Performs basic sentiment/keyword analysis on the transcript.
+
+    Tones: "negative", "neutral" or "silent" (no speech, also reported when the VAD hears none),
+    the vocabulary the scorer's audio rules match on.
+    """
     if transcript is None:
         return "unknown", [] # Default tone and empty matched keywords
 
-    text_lower = transcript.lower()
-    matched_keywords = []
-    tone = "neutral" # Default tone
-
-    # Check for negative keywords
-    for keyword in NEGATIVE_KEYWORDS:
-        if keyword in text_lower:
-            tone = "negative"
-            matched_keywords.append(keyword)
-            # If a strong negative keyword is found, no need to check for calm/positive ones
-            logging.info(f"Negative keyword 	"{keyword}" found. Tone set to negative.")
-            return tone, matched_keywords 
-
-    # Check for calm/positive keywords if not already negative
-    for keyword in POSITIVE_KEYWORDS_CALM:
-        if keyword in text_lower:
-            # Don't override if already negative, but can mark as neutral or positive if desired
-            if tone != "negative": 
-                tone = "neutral" # Or potentially "positive" if a separate category is needed
-            matched_keywords.append(keyword)
-            logging.info(f"Calm/positive keyword 	"{keyword}" found.")
-            # Continue checking for other calm keywords
-
     if not transcript: # If transcript is empty (silence)
-        tone = "silent" # Special tone for silence
         logging.info("Transcript is empty. Tone set to silent.")
+        return "silent", [] # Special tone for silence
+
+    matches = keyword_matcher.by_group(transcript)
+    if "negative" in matches:
+        # Negative keywords decide the tone; calm ones alongside them are not reported
+        logging.info(f"Negative keyword(s) {matches['negative']} found. Tone set to negative.")
+        return "negative", matches["negative"]
 
-    return tone, matched_keywords
+    matched_keywords = matches.get("calm", [])
+    if matched_keywords:
+        logging.info(f"Calm/positive keyword(s) {matched_keywords} found.")
+    return "neutral", matched_keywords # Or potentially "positive" if a separate category is needed
 
 # --- MQTT Callbacks ---
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
+        if "mqtt_connect" not in startup_timings:
+            startup_timings["mqtt_connect"] = round(time.monotonic() - startup_started_at, 3)
         logging.info("Successfully connected to MQTT broker.")
         try:
             client.subscribe(MQTT_INQUIRY_LISTEN_TOPIC)
             logging.info(f"Subscribed to inquiry trigger topic: {MQTT_INQUIRY_LISTEN_TOPIC}")
         except Exception as e:
             logging.error(f"Error subscribing to topic: {e}")
+        publish_service_status() # Replace the "offline" will from a previous connection
     else:
         logging.error(f"Failed to connect to MQTT broker, return code: {rc}")
 
 def on_disconnect(client, userdata, rc):
     logging.warning(f"Disconnected from MQTT broker with result code {rc}. Reconnection will be attempted by Paho.")
 
+def capture_inquiry_response(event_id, request):
+    """Inquiry stage 1 (per speaker device): plays a prompt and records the reply."""
+    trace = mark(request.get("trace"), "capture_started")
+    # 1. Play an audio prompt chosen by AUDIO_PROMPT_SELECTION / AUDIO_PROMPT_MAP
+    selected_prompt = prompt_selector.select(request, prompt_library.names())
+    if selected_prompt is None:
+        logging.warning(f"No audio prompts available for event {event_id}. Skipping inquiry.")
+        return None
+    play_audio_prompt(selected_prompt)
+    trace = mark(trace, "prompt_played")
+    time.sleep(0.5) # Brief pause after prompt
+
+    # 2. Record the response (streaming partial transcripts while recording, if enabled)
+    streamer = None
+    if AUDIO_STREAMING_ENABLED:
+        streamer = StreamingTranscriber(lambda window: transcribe_audio(window, partial=True),
+                                        lambda text, window_end, sequence: publish_partial_result(event_id, text, window_end, sequence, trace),
+                                        window_seconds=AUDIO_STREAM_WINDOW_SECONDS,
+                                        hop_seconds=AUDIO_STREAM_HOP_SECONDS,
+                                        sample_rate=ASR_SAMPLE_RATE)
+    try:
+        with stage_seconds.labels("record").time():
+            recorded_audio, recording_summary = record_audio_response(streamer)
+    finally:
+        if streamer:
+            streamer.close()
+    if recorded_audio is None:
+        logging.error(f"Audio recording failed for event {event_id}. Cannot proceed with inquiry.")
+        # Optionally publish a status back indicating recording failure
+        return None
+
+    return {
+        "trace": mark(trace, "recorded"),
+        "prompt_played": selected_prompt,
+        "audio": recorded_audio,
+        "recording_summary": recording_summary,
+        # Nobody answered: report silence without queueing behind other transcriptions
+        "needs_transcription": recording_summary["stop_reason"] != STOP_NO_SPEECH,
+    }
+
+def analyze_inquiry_response(event_id, request, capture):
+    """Inquiry stage 2 (transcription worker): transcribes and analyzes a recording into a result payload."""
+    recording_summary = capture["recording_summary"]
+    if not capture["needs_transcription"]:
+        logging.info(f"No speech detected for event {event_id}. Skipping transcription.")
+        transcript = ""
+        tone, matched_keywords = "silent", []
+    elif not asr_ready.wait(AUDIO_MODEL_WAIT_SECONDS):
+        logging.error(f"ASR model not ready after waiting {AUDIO_MODEL_WAIT_SECONDS}s. Cannot transcribe event {event_id}.")
+        return asr_unavailable_result(event_id)
+    else:
+        # 3. Transcribe the response
+        with stage_seconds.labels("transcribe").time():
+            transcript = transcribe_audio(capture["audio"])
+        if transcript is None:
+            logging.warning("Audio transcription failed or produced no text.")
+            # Use empty string if transcription fails to allow tone analysis (e.g. for silence)
+            transcript = ""
+
+        # 4. Analyze the transcript
+        with stage_seconds.labels("analyze").time():
+            tone, matched_keywords = analyze_transcript(transcript)
+
+    return {
+        "id": event_id,
+        "transcript": transcript,
+        "tone": tone,
+        "matched_keywords": matched_keywords,
+        "prompt_played": capture["prompt_played"],
+        "speech_detected": recording_summary["speech_detected"],
+        "speech_onset_seconds": recording_summary["speech_onset_seconds"], # Seconds after recording started
+        "recorded_seconds": recording_summary["recorded_seconds"],
+        "recording_stop_reason": recording_summary["stop_reason"],
+        "timestamp": time.time(),
+        "trace": mark(capture.get("trace"), "transcribed") # Marked again on publish
+    }
+
+def publish_partial_result(event_id, transcript, window_end_seconds, sequence, trace=None):
+    """Publishes a partial transcript of a reply that is still being recorded."""
+    tone, matched_keywords = analyze_transcript(transcript)
+    partial_payload = {
+        "id": event_id,
+        "partial": True,
+        "sequence": sequence,
+        "transcript": transcript,
+        "tone": tone,
+        "matched_keywords": matched_keywords,
+        "window_end_seconds": round(window_end_seconds, 3), # Seconds after recording started
+        "timestamp": time.time(),
+        "trace": mark(trace, "partial_sent")
+    }
+    partial_topic = f"{MQTT_AUDIO_RESULT_TOPIC_BASE}/{event_id}/partial"
+    mqtt_client.publish(partial_topic, json.dumps(partial_payload), qos=1)
+    logging.info(f"Published partial audio result to {partial_topic}: {partial_payload}")
+
+def publish_inquiry_result(event_id, result_payload):
+    """Publishes an inquiry result to the scorer."""
+    # 5. Publish the results
+    result_topic = f"{MQTT_AUDIO_RESULT_TOPIC_BASE}/{event_id}"
+    if result_payload.get("trace"):
+        result_payload["trace"] = mark(result_payload["trace"], "result_sent")
+    with stage_seconds.labels("publish").time():
+        mqtt_client.publish(result_topic, json.dumps(result_payload), qos=1)
+    logging.info(f"Published audio analysis result to {result_topic}: {result_payload}")
+
 def on_inquiry_trigger(client, userdata, msg):
-    """Handles incoming MQTT messages that trigger an audio inquiry."""
+    """Handles incoming MQTT messages that trigger an audio inquiry.
+
+    Only validates and queues the inquiry; prompting, recording and transcription run on the
+    inquiry scheduler's threads so the MQTT network loop is never blocked.
+    """
     try:
         payload_data = json.loads(msg.payload.decode())
         event_id = payload_data.get("event_id")
+        # Trace context from the scorer, marked at each inquiry stage and returned in the result
+        payload_data["trace"] = mark(payload_data.get("trace"), "inquiry_received")
         logging.info(f"Received inquiry trigger for event ID: {event_id} from topic: {msg.topic}")
 
         if not event_id:
             logging.warning("Inquiry trigger received without an event_id. Skipping.")
             return
 
-        if not available_prompts:
+        if not len(prompt_library):
             logging.warning("No audio prompts available to play. Skipping inquiry.")
             # Optionally publish a status back indicating no prompts
             return
 
-        # 1. Play a random audio prompt
-        selected_prompt = random.choice(available_prompts)
-        play_audio_prompt(selected_prompt)
-        time.sleep(0.5) # Brief pause after prompt
-
-        # 2. Record the response
-        recorded_audio_path = record_audio_response()
-        if not recorded_audio_path:
-            logging.error("Audio recording failed. Cannot proceed with inquiry.")
-            # Optionally publish a status back indicating recording failure
+        if not asr_ready.is_set() and AUDIO_NOT_READY_POLICY == "fail":
+            logging.warning(f"ASR model not ready ({service_state}). Failing inquiry for event {event_id} fast.")
+            inquiries_total.labels("failed_fast").inc()
+            publish_inquiry_result(event_id, asr_unavailable_result(event_id))
             return
 
-        # 3. Transcribe the response
-        transcript = transcribe_audio(recorded_audio_path)
-        if transcript is None:
-            logging.warning("Audio transcription failed or produced no text.")
-            # Use empty string if transcription fails to allow tone analysis (e.g. for silence)
-            transcript = "" 
-
-        # 4. Analyze the transcript
-        tone, matched_keywords = analyze_transcript(transcript)
-
-        # 5. Publish the results
-        result_payload = {
-            "id": event_id,
-            "transcript": transcript,
-            "tone": tone,
-            "matched_keywords": matched_keywords,
-            "prompt_played": selected_prompt,
-            "timestamp": time.time()
-        }
-        result_topic = f"{MQTT_AUDIO_RESULT_TOPIC_BASE}/{event_id}"
-        client.publish(result_topic, json.dumps(result_payload), qos=1)
-        logging.info(f"Published audio analysis result to {result_topic}: {result_payload}")
-
-        # Clean up temporary recording file
-        if os.path.exists(AUDIO_RECORD_FILENAME_TMP):
-            try:
-                os.remove(AUDIO_RECORD_FILENAME_TMP)
-            except OSError as e:
-                logging.warning(f"Could not remove temporary audio file {AUDIO_RECORD_FILENAME_TMP}: {e}")
+        # Optional "device" in the trigger selects the speaker queue; otherwise the configured output device
+        device = str(payload_data.get("device", AUDIO_OUTPUT_DEVICE_INDEX or "default"))
+        if inquiry_scheduler.submit(event_id, payload_data, device=device):
+            inquiries_total.labels("queued").inc()
 
     except json.JSONDecodeError:
         logging.error(f"Failed to decode JSON from inquiry trigger message: {msg.payload}")
@@ -302,24 +540,70 @@ def on_inquiry_trigger(client, userdata, msg):
 if __name__ == "__main__":
     logging.info("Starting Audio Interaction Service...")
 
+    if ASR_BACKEND not in ASR_BACKENDS:
+        logging.error(f"Invalid ASR_BACKEND '{ASR_BACKEND}'. Expected one of {ASR_BACKENDS}.")
+        exit(1)
+    if AUDIO_PROMPT_SELECTION not in SELECTION_POLICIES:
+        logging.error(f"Invalid AUDIO_PROMPT_SELECTION '{AUDIO_PROMPT_SELECTION}'. Expected one of {SELECTION_POLICIES}.")
+        exit(1)
+    if AUDIO_NOT_READY_POLICY not in ("queue", "fail"):
+        logging.error(f"Invalid AUDIO_NOT_READY_POLICY '{AUDIO_NOT_READY_POLICY}'. Expected 'queue' or 'fail'.")
+        exit(1)
+
     if not initialize_audio_system():
         logging.critical("Failed to initialize audio system. Exiting.")
         exit(1)
 
+    if AUDIO_BATCH_MAX_SIZE > 1:
+        # Model calls happen on the batcher thread; the analysis workers only wait for their transcript
+        transcription_batcher = TranscriptionBatcher(lambda audios: asr_backend.transcribe_batch(audios),
+                                                     max_batch_size=AUDIO_BATCH_MAX_SIZE,
+                                                     max_wait_seconds=AUDIO_BATCH_MAX_WAIT_SECONDS,
+                                                     metrics_interval=AUDIO_BATCH_METRICS_INTERVAL)
+        if AUDIO_TRANSCRIBE_WORKERS < AUDIO_BATCH_MAX_SIZE:
+            logging.warning(f"AUDIO_TRANSCRIBE_WORKERS={AUDIO_TRANSCRIBE_WORKERS} limits batches to {AUDIO_TRANSCRIBE_WORKERS} "
+                            f"recording(s); set it to at least AUDIO_BATCH_MAX_SIZE={AUDIO_BATCH_MAX_SIZE} to fill them.")
+
+    inquiry_scheduler = InquiryScheduler(capture_inquiry_response, analyze_inquiry_response, publish_inquiry_result,
+                                         # The batcher thread owns model decoding; the workers wait on it or the model lock
+                                         transcribe_workers=AUDIO_TRANSCRIBE_WORKERS,
+                                         max_queue_per_device=AUDIO_INQUIRY_QUEUE_SIZE)
+
     mqtt_client = mqtt.Client()
     mqtt_client.on_connect = on_connect
     mqtt_client.on_disconnect = on_disconnect
     mqtt_client.message_callback_add(MQTT_INQUIRY_LISTEN_TOPIC, on_inquiry_trigger)
+    # The broker marks the service offline (retained) if the connection drops without a clean disconnect
+    mqtt_client.will_set(MQTT_STATUS_TOPIC, json.dumps({"state": "offline", "asr_backend": ASR_BACKEND, "model": WHISPER_MODEL_SIZE}), qos=1, retain=True)
+
+    try:
+        metrics.start_http_server(METRICS_HTTP_PORT, METRICS_HTTP_HOST)
+    except OSError as e:
+        logging.error(f"Could not start metrics endpoint on port {METRICS_HTTP_PORT}: {e}")
+    if METRICS_MQTT_TOPIC:
+        metrics.start_publisher(lambda snapshot: mqtt_client.publish(METRICS_MQTT_TOPIC, snapshot), METRICS_MQTT_INTERVAL)
 
     try:
         mqtt_client.connect(MQTT_HOST, MQTT_PORT, 60)
+        # Load the model in the background so inquiry triggers are received (and queued) from the start
+        threading.Thread(target=load_asr_model, name="asr-model-loader", daemon=True).start()
         mqtt_client.loop_forever()
     except ConnectionRefusedError:
         logging.error(f"MQTT connection refused. Is the broker at {MQTT_HOST}:{MQTT_PORT} running?")
     except Exception as e:
         logging.critical(f"An unexpected error occurred in the main loop: {e}")
     finally:
+        inquiry_scheduler.stop()
+        metrics.stop()
+        if transcription_batcher:
+            transcription_batcher.stop()
+        if prompt_library:
+            prompt_library.stop()
+        if prompt_player:
+            prompt_player.close()
         if py_audio_interface:
             py_audio_interface.terminate()
         logging.info("Audio Interaction Service stopped.")
+    if service_state == "failed":
+        exit(1)
 
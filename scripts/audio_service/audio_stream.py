@@ -0,0 +1,96 @@
+# audio_stream.py
+# Streaming (incremental) transcription for audio_service.py.
+# While a reply is being recorded, the trailing window of audio is transcribed every hop on a
+# background thread and each new partial transcript is handed to a callback, so a threat keyword
+# can be reported seconds before the recording ends and the final transcription completes.
+# The recorder never waits on the model: if a window is still being transcribed when the next
+# one is ready, the stale window is replaced rather than queued.
+
+import threading
+import logging
+
+import numpy as np
+
+class StreamingTranscriber:
+    """Transcribes sliding windows of an in-progress recording on a background thread.
+
+    transcribe_fn(float32 array) -> text or None
+    on_partial(text, window_end_seconds, sequence) is called for each non-empty partial
+    transcript that differs from the previous one.
+    """
+
+    def __init__(self, transcribe_fn, on_partial, window_seconds=3.0, hop_seconds=1.0, sample_rate=16000):
+        self.transcribe_fn = transcribe_fn
+        self.on_partial = on_partial
+        self.window_samples = int(window_seconds * sample_rate)
+        self.hop_samples = max(1, int(hop_seconds * sample_rate))
+        self.sample_rate = sample_rate
+        self._chunks = []
+        self._buffered_samples = 0
+        self._total_samples = 0
+        self._samples_since_submit = 0
+        self._pending_window = None # (window, window_end_seconds); single slot, newest wins
+        self._closed = False
+        self._condition = threading.Condition()
+        self._last_text = None
+        self.sequence = 0
+        self.windows_submitted = 0
+        self.windows_skipped = 0
+        self._thread = threading.Thread(target=self._run, name="inquiry-stream", daemon=True)
+        self._thread.start()
+
+    def feed(self, samples, submit=True):
+        """Appends a chunk of 16 kHz mono float32 samples.
+
+        Once a hop's worth of new audio has arrived, the trailing window is queued for
+        transcription; pass submit=False to buffer without transcribing (e.g. before VAD
+        has heard any speech).
+        """
+        self._chunks.append(samples)
+        self._buffered_samples += len(samples)
+        self._total_samples += len(samples)
+        self._samples_since_submit += len(samples)
+        # Only keep enough chunks to cover one window
+        while self._chunks and self._buffered_samples - len(self._chunks[0]) >= self.window_samples:
+            self._buffered_samples -= len(self._chunks.pop(0))
+        if not submit or self._samples_since_submit < self.hop_samples:
+            return
+        self._samples_since_submit = 0
+        window = np.concatenate(self._chunks)[-self.window_samples:]
+        with self._condition:
+            if self._pending_window is not None:
+                self.windows_skipped += 1
+            self._pending_window = (window, self._total_samples / self.sample_rate)
+            self.windows_submitted += 1
+            self._condition.notify()
+
+    def close(self):
+        """Stops streaming. Drops any window not yet started; an in-flight one may still report."""
+        with self._condition:
+            self._closed = True
+            self._pending_window = None
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending_window is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                window, window_end_seconds = self._pending_window
+                self._pending_window = None
+            try:
+                text = self.transcribe_fn(window)
+            except Exception as e:
+                logging.error(f"Error transcribing partial audio window: {e}")
+                continue
+            text = (text or "").strip()
+            if not text or text == self._last_text:
+                continue
+            self._last_text = text
+            self.sequence += 1
+            try:
+                self.on_partial(text, window_end_seconds, self.sequence)
+            except Exception as e:
+                logging.error(f"Error handling partial transcript: {e}")
@@ -0,0 +1,96 @@
+# audio_vad.py
+# Lightweight voice activity detection for audio_service.py.
+# Classifies each PyAudio chunk as speech or non-speech from its energy (dBFS) and
+# zero-crossing rate, with an adaptive noise floor, and tracks the recording state so the
+# recorder can stop after trailing silence or give up early when nobody answers.
+
+import numpy as np
+
+# Reasons a VAD-driven recording stopped
+STOP_TRAILING_SILENCE = "trailing_silence" # Speech was heard and then silence lasted long enough
+STOP_NO_SPEECH = "no_speech"               # No speech started within the no-speech timeout
+STOP_MAX_DURATION = "max_duration"         # Hit AUDIO_RECORD_SECONDS
+
+class EnergyVAD:
+    """Energy / zero-crossing-rate speech classifier for int16 PCM chunks."""
+
+    def __init__(self, channels=1, energy_threshold_dbfs=-45.0, noise_margin_db=10.0, zcr_max=0.35,
+                 noise_adapt_rate=0.05):
+        self.channels = channels
+        self.energy_threshold_dbfs = energy_threshold_dbfs # Absolute floor for speech energy
+        self.noise_margin_db = noise_margin_db             # Speech must also be this far above the noise floor
+        self.zcr_max = zcr_max                             # Higher crossing rates are treated as hiss/noise
+        self.noise_adapt_rate = noise_adapt_rate
+        self.noise_floor_dbfs = None
+
+    def frame_features(self, pcm_bytes):
+        """Returns (energy_dbfs, zero_crossing_rate) for a chunk of int16 PCM."""
+        samples = np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if not len(samples):
+            return -120.0, 0.0
+        rms = float(np.sqrt(np.mean(samples * samples)))
+        energy_dbfs = 20.0 * np.log10(rms / 32768.0 + 1e-9)
+        signs = np.signbit(samples)
+        zero_crossing_rate = float(np.count_nonzero(signs[1:] != signs[:-1])) / max(len(samples) - 1, 1)
+        return energy_dbfs, zero_crossing_rate
+
+    def is_speech(self, pcm_bytes):
+        """Classifies a chunk, updating the noise floor estimate from non-speech chunks."""
+        energy_dbfs, zero_crossing_rate = self.frame_features(pcm_bytes)
+        threshold = self.energy_threshold_dbfs
+        if self.noise_floor_dbfs is not None:
+            threshold = max(threshold, self.noise_floor_dbfs + self.noise_margin_db)
+        speech = energy_dbfs >= threshold and zero_crossing_rate <= self.zcr_max
+        if not speech:
+            if self.noise_floor_dbfs is None:
+                self.noise_floor_dbfs = energy_dbfs
+            else:
+                self.noise_floor_dbfs += self.noise_adapt_rate * (energy_dbfs - self.noise_floor_dbfs)
+        return speech
+
+class VADRecordingState:
+    """Tracks speech onset and trailing silence across the chunks of one recording."""
+
+    def __init__(self, vad, chunk_seconds, max_seconds, trailing_silence_seconds=0.8, no_speech_timeout_seconds=2.5):
+        self.vad = vad
+        self.chunk_seconds = chunk_seconds
+        self.max_seconds = max_seconds
+        self.trailing_silence_seconds = trailing_silence_seconds
+        self.no_speech_timeout_seconds = no_speech_timeout_seconds
+        self.elapsed_seconds = 0.0
+        self.speech_onset_seconds = None
+        self.speech_end_seconds = None
+        self._silence_run_seconds = 0.0
+        self.stop_reason = None
+
+    def add_chunk(self, pcm_bytes):
+        """Feeds one chunk. Returns True when recording should stop (see stop_reason)."""
+        speech = self.vad.is_speech(pcm_bytes)
+        self.elapsed_seconds += self.chunk_seconds
+        if speech:
+            if self.speech_onset_seconds is None:
+                self.speech_onset_seconds = self.elapsed_seconds - self.chunk_seconds
+            self.speech_end_seconds = self.elapsed_seconds
+            self._silence_run_seconds = 0.0
+        else:
+            self._silence_run_seconds += self.chunk_seconds
+
+        if self.speech_onset_seconds is None and self.elapsed_seconds >= self.no_speech_timeout_seconds:
+            self.stop_reason = STOP_NO_SPEECH
+        elif self.speech_onset_seconds is not None and self._silence_run_seconds >= self.trailing_silence_seconds:
+            self.stop_reason = STOP_TRAILING_SILENCE
+        elif self.elapsed_seconds >= self.max_seconds:
+            self.stop_reason = STOP_MAX_DURATION
+        return self.stop_reason is not None
+
+    def summary(self):
+        """Returns recording timing details for the result payload."""
+        return {
+            "speech_detected": self.speech_onset_seconds is not None,
+            "speech_onset_seconds": round(self.speech_onset_seconds, 3) if self.speech_onset_seconds is not None else None,
+            "speech_end_seconds": round(self.speech_end_seconds, 3) if self.speech_end_seconds is not None else None,
+            "recorded_seconds": round(self.elapsed_seconds, 3),
+            "stop_reason": self.stop_reason or STOP_MAX_DURATION,
+        }
@@ -0,0 +1,127 @@
+# inquiry_scheduler.py
+# Pipelined inquiry scheduling for audio_service.py.
+# An inquiry has two stages with very different resources:
+#   1. capture    - play a prompt and record the reply; needs exclusive use of a speaker/mic device
+#   2. transcribe - run ASR and keyword analysis on the recording; needs CPU
+# Each speaker device gets its own FIFO queue and capture thread, and transcription runs on a
+# separate worker pool, so the next visitor can be prompted while the previous reply is still
+# being transcribed. The MQTT callback only submits work and returns immediately.
+# Inquiries for an event_id that is already queued or in progress are coalesced.
+
+import queue
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+_STOP = object() # Sentinel telling a capture thread to exit
+
+class InquiryScheduler:
+    """Runs capture per device and transcription on a worker pool, deduplicating by event_id.
+
+    capture_fn(event_id, request) -> capture dict or None (capture failed)
+    analyze_fn(event_id, request, capture) -> result payload dict or None
+    publish_fn(event_id, result) -> None
+    A capture dict with "needs_transcription": False is analyzed on the capture thread
+    (e.g. silence detected by VAD), skipping the transcription queue.
+    """
+
+    def __init__(self, capture_fn, analyze_fn, publish_fn, transcribe_workers=1, max_queue_per_device=10):
+        self.capture_fn = capture_fn
+        self.analyze_fn = analyze_fn
+        self.publish_fn = publish_fn
+        self.max_queue_per_device = max_queue_per_device
+        self._executor = ThreadPoolExecutor(max_workers=transcribe_workers, thread_name_prefix="inquiry-transcribe")
+        self._device_queues = {}
+        self._device_threads = {}
+        self._active = {} # event_id -> latest request, while queued, capturing or transcribing
+        self._lock = threading.Lock()
+        self.coalesced_count = 0
+        self.rejected_count = 0
+
+    def submit(self, event_id, request, device="default"):
+        """Queues an inquiry on a device. Returns False if it was coalesced or the device queue is full."""
+        with self._lock:
+            if event_id in self._active:
+                # Same event already being handled: keep the latest trigger data, don't prompt twice
+                self._active[event_id].update(request)
+                self.coalesced_count += 1
+                logging.info(f"Inquiry for event {event_id} already queued or in progress. Coalescing.")
+                return False
+            device_queue = self._device_queue_locked(device)
+            try:
+                device_queue.put_nowait((event_id, request))
+            except queue.Full:
+                self.rejected_count += 1
+                logging.warning(f"Inquiry queue for device {device} is full. Dropping inquiry for event {event_id}.")
+                return False
+            self._active[event_id] = request
+            depth = device_queue.qsize()
+        logging.info(f"Queued inquiry for event {event_id} on device {device} (queue depth {depth}).")
+        return True
+
+    def stop(self, timeout=10.0):
+        """Stops capture threads after their queued inquiries and waits for transcriptions to finish."""
+        with self._lock:
+            queues = list(self._device_queues.values())
+            threads = list(self._device_threads.values())
+        for device_queue in queues:
+            device_queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        """Returns queue depths and counters."""
+        with self._lock:
+            return {
+                "queue_depths": {device: q.qsize() for device, q in self._device_queues.items()},
+                "active": len(self._active),
+                "coalesced": self.coalesced_count,
+                "rejected": self.rejected_count,
+            }
+
+    def _device_queue_locked(self, device):
+        device_queue = self._device_queues.get(device)
+        if device_queue is None:
+            device_queue = queue.Queue(maxsize=self.max_queue_per_device)
+            thread = threading.Thread(target=self._capture_loop, args=(device, device_queue),
+                                      name=f"inquiry-capture-{device}", daemon=True)
+            self._device_queues[device] = device_queue
+            self._device_threads[device] = thread
+            thread.start()
+        return device_queue
+
+    def _capture_loop(self, device, device_queue):
+        while True:
+            item = device_queue.get()
+            if item is _STOP:
+                return
+            event_id, request = item
+            try:
+                capture = self.capture_fn(event_id, request)
+            except Exception as e:
+                logging.error(f"Error capturing inquiry response for event {event_id} on device {device}: {e}")
+                capture = None
+            if capture is None:
+                self._finish(event_id)
+            elif not capture.get("needs_transcription", True):
+                self._analyze_and_publish(event_id, capture)
+            else:
+                # Hand off to the transcription pool; this device is free for the next visitor now
+                self._executor.submit(self._analyze_and_publish, event_id, capture)
+
+    def _analyze_and_publish(self, event_id, capture):
+        try:
+            with self._lock:
+                request = dict(self._active.get(event_id, {}))
+            result = self.analyze_fn(event_id, request, capture)
+            if result is not None:
+                self.publish_fn(event_id, result)
+        except Exception as e:
+            logging.error(f"Error analyzing inquiry response for event {event_id}: {e}")
+        finally:
+            self._finish(event_id)
+
+    def _finish(self, event_id):
+        with self._lock:
+            self._active.pop(event_id, None)
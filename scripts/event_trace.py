@@ -0,0 +1,65 @@
+# event_trace.py
+# Trace context carried with an event from the Frigate detection through the audio inquiry to the
+# alarm, shared by scorer.py and audio_service.py.
+#
+# A trace is a small JSON-friendly dict that travels in the inquiry trigger, the audio result and
+# the alert payload:
+#   {"event_id": "...", "origin": <Frigate frame time, unix seconds or None>, "received": <unix seconds>,
+#    "clock": "<boot id>", "marks": [["frigate_received", <monotonic seconds>], ["scored", ...], ...]}
+# Marks use time.monotonic(), which is one clock for every process (and container) on the same
+# kernel, so marks made by the scorer and the audio service can be subtracted. Marks made on a
+# host with a different clock are recorded with a None timestamp and left out of the breakdown.
+# Traces are never mutated in place: mark() returns a new trace, so a copy held by another thread
+# (e.g. a streaming partial) is unaffected.
+
+import time
+
+def _read_clock_id():
+    """Identifies the monotonic clock domain: the kernel boot ID where available."""
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        import socket
+        return socket.gethostname()
+
+CLOCK_ID = _read_clock_id()
+
+def new_trace(event_id, origin=None, marks=()):
+    """Starts a trace from (stage, monotonic time) pairs already taken. origin is the detection's wall-clock time."""
+    marks = [[stage, round(t, 6)] for stage, t in marks]
+    now = time.monotonic()
+    received = time.time() - (now - marks[0][1]) if marks else time.time() # Wall-clock time of the first mark
+    return {"event_id": event_id, "origin": origin, "received": round(received, 6), "clock": CLOCK_ID, "marks": marks}
+
+def mark(trace, stage, now=None):
+    """Returns a copy of trace with a mark for stage appended (None stays None)."""
+    if not isinstance(trace, dict):
+        return None
+    if trace.get("clock") == CLOCK_ID:
+        timestamp = round(time.monotonic() if now is None else now, 6)
+    else:
+        timestamp = None # Different clock domain; the mark only records that the stage happened
+    return dict(trace, marks=list(trace.get("marks") or ()) + [[stage, timestamp]])
+
+def breakdown(trace):
+    """Summarizes a trace as milliseconds per step, for the alert payload.
+
+    Returns {"total_ms", "steps": {stage: ms since the previous mark}, "audio_round_trip_ms",
+    "detection_lag_ms"}; fields that cannot be computed are omitted. detection_lag_ms compares the
+    Frigate frame time with the scorer's wall clock, so it is only as good as their clock sync.
+    """
+    if not isinstance(trace, dict):
+        return {}
+    marks = [(stage, t) for stage, t in trace.get("marks") or () if t is not None]
+    summary = {}
+    if len(marks) > 1:
+        summary["total_ms"] = round((marks[-1][1] - marks[0][1]) * 1000, 2)
+        summary["steps"] = {stage: round((t - marks[i][1]) * 1000, 2) for i, (stage, t) in enumerate(marks[1:])}
+        times = dict(marks)
+        if "inquiry_sent" in times and "audio_received" in times:
+            summary["audio_round_trip_ms"] = round((times["audio_received"] - times["inquiry_sent"]) * 1000, 2)
+    origin, received = trace.get("origin"), trace.get("received")
+    if isinstance(origin, (int, float)) and isinstance(received, (int, float)):
+        summary["detection_lag_ms"] = round((received - origin) * 1000, 2)
+    return summary
@@ -0,0 +1,99 @@
+# keyword_matcher.py
+# Shared keyword/phrase matching for scorer.py and audio_service.py.
+# All keyword lists are compiled once into a single case-insensitive alternation regex with word
+# boundaries, so one pass over a transcript finds every keyword and phrase ("hi" no longer matches
+# "this", "gun" no longer matches "begun") regardless of how many keywords are configured.
+#
+# Keyword syntax:
+#   gun                 whole word
+#   call the police     phrase; any run of whitespace between words matches
+#   attack*             prefix: attack, attacks, attacked, ...
+# Keyword list strings (e.g. from environment variables) are comma-separated, with an optional
+# ":weight" per entry: "gun:1.0,knife:0.8,help".
+#
+# The audio service runs from its own directory (and its own Docker build context), so it adds
+# this file's directory to sys.path; the Docker images copy this file next to each service.
+
+import re
+
+class KeywordMatch:
+    """One keyword occurrence in a text."""
+    __slots__ = ("keyword", "group", "weight", "start", "end")
+
+    def __init__(self, keyword, group, weight, start, end):
+        self.keyword = keyword # Keyword as configured (e.g. "attack*")
+        self.group = group     # Name of the keyword list it came from
+        self.weight = weight
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"KeywordMatch({self.keyword!r}, group={self.group!r}, weight={self.weight})"
+
+def parse_keyword_list(text, default_weight=1.0):
+    """Parses "kw1,kw2:0.5,..." into a {keyword: weight} dict. Raises ValueError on a bad weight."""
+    keywords = {}
+    for entry in text.split(","):
+        keyword, _, weight = entry.partition(":")
+        keyword = " ".join(keyword.lower().split())
+        if keyword:
+            keywords[keyword] = float(weight) if weight.strip() else default_weight
+    return keywords
+
+def _keyword_pattern(keyword):
+    prefix = keyword.endswith("*")
+    words = keyword.rstrip("*").split()
+    pattern = r"\s+".join(re.escape(word) for word in words)
+    return pattern + r"\w*" if prefix else pattern
+
+class KeywordMatcher:
+    """Matches several named keyword lists against text in a single regex pass.
+
+    keyword_groups maps a group name to a {keyword: weight} dict or an iterable of keywords
+    (weight 1.0). A keyword listed in several groups is reported for the first group only.
+    """
+
+    def __init__(self, keyword_groups):
+        entries = {}
+        for group, keywords in keyword_groups.items():
+            if not isinstance(keywords, dict):
+                keywords = {keyword: 1.0 for keyword in keywords}
+            for keyword, weight in keywords.items():
+                keyword = " ".join(str(keyword).lower().split())
+                if keyword and keyword.rstrip("*") and keyword not in entries:
+                    entries[keyword] = (group, float(weight))
+
+        # Longest keywords first so "package delivery" wins over "package" at the same position
+        self._entries = sorted(entries.items(), key=lambda item: len(item[0].rstrip("*")), reverse=True)
+        self.keywords = frozenset(entries)
+        if self._entries:
+            alternation = "|".join(f"(?P<k{i}>{_keyword_pattern(keyword)})" for i, (keyword, _) in enumerate(self._entries))
+            self._regex = re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", re.IGNORECASE)
+        else:
+            self._regex = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, text):
+        """Returns every non-overlapping keyword match in text, in order of appearance."""
+        if not text or self._regex is None:
+            return []
+        matches = []
+        for match in self._regex.finditer(text):
+            keyword, (group, weight) = self._entries[int(match.lastgroup[1:])]
+            matches.append(KeywordMatch(keyword, group, weight, match.start(), match.end()))
+        return matches
+
+    def search(self, text):
+        """Returns True if any keyword occurs in text."""
+        return bool(text) and self._regex is not None and self._regex.search(text) is not None
+
+    def by_group(self, text):
+        """Returns {group: [distinct keywords in order of first appearance]} for the groups that matched."""
+        groups = {}
+        for match in self.find(text):
+            keywords = groups.setdefault(match.group, [])
+            if match.keyword not in keywords:
+                keywords.append(match.keyword)
+        return groups
@@ -5,11 +5,29 @@
 # exceeds a defined threshold.
 
 import os
+import sys
 import json
 import time
+import signal
+import socket
+import threading
 import paho.mqtt.client as mqtt
 import logging
 
+from scorer_pipeline import WorkerPipeline, extract_partition_key
+from scorer_pending import PendingInquiryStore
+from scorer_journal import PendingJournal
+from scorer_alerts import AlertCoalescer
+from scorer_incidents import IncidentIndex, parse_camera_groups
+from scorer_shards import ShardRouter
+from scorer_enrich import Enricher, load_modules, merge_attributes
+from scorer_rules import RuleEngine
+from scorer_tracks import TrackStore
+from scorer_decode import FrigateEventDecoder, after_fields_for_rules, peek_event_types, peek_significant_change
+from keyword_matcher import parse_keyword_list
+from service_metrics import MetricsRegistry
+from event_trace import new_trace, mark, breakdown
+
 # --- Configuration from Environment Variables ---
 try:
     # MQTT Configuration
@@ -17,6 +35,7 @@ try:
     MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
     MQTT_FRIGATE_TOPIC = os.getenv("MQTT_FRIGATE_TOPIC", "frigate/events/#") # Topic for primary detection events
     MQTT_AUDIO_TOPIC = os.getenv("MQTT_AUDIO_TOPIC", "vz/audio/#") # Topic for audio analysis results
+    MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", "3.1.1") # "3.1.1" or "5"
     MQTT_INQUIRY_TRIGGER_TOPIC_BASE = os.getenv("MQTT_INQUIRY_TRIGGER_TOPIC_BASE", "vz/inquiry") # Base topic to trigger audio inquiry
     MQTT_ALERT_TOPIC = os.getenv("MQTT_ALERT_TOPIC", "vz/alert") # Topic to publish alerts for other services (e.g. Home Assistant)
 
@@ -30,24 +49,107 @@ try:
     SCORE_BONUS_POSE_CROUCH_PRONE = float(os.getenv("SCORE_BONUS_POSE_CROUCH_PRONE", "0.15"))
     SCORE_AUDIO_NEGATIVE_TONE = float(os.getenv("SCORE_AUDIO_NEGATIVE_TONE", "0.3"))
     SCORE_AUDIO_THREAT_KEYWORDS = float(os.getenv("SCORE_AUDIO_THREAT_KEYWORDS", "0.2")) # e.g. "attack", "police"
+    # Whole words/phrases scored by SCORE_AUDIO_THREAT_KEYWORDS ("word*" matches any word starting with "word")
+    AUDIO_THREAT_KEYWORDS = list(parse_keyword_list(os.getenv("AUDIO_THREAT_KEYWORDS", "help,police,intruder,attack")))
     SCORE_AUDIO_EVASIVE_SILENCE = float(os.getenv("SCORE_AUDIO_EVASIVE_SILENCE", "0.1"))
     SCORE_AUDIO_CALM_DELIVERY = float(os.getenv("SCORE_AUDIO_CALM_DELIVERY", "-0.2")) # Negative score for known safe interactions
+    # Alarm as soon as a partial transcript (vz/audio/<id>/partial) alone crosses the alarm threshold
+    AUDIO_PARTIAL_ALARMS = os.getenv("AUDIO_PARTIAL_ALARMS", "true").lower() == "true"
+    # Optional JSON/YAML rules file replacing the SCORE_* weights above; reloaded on SIGHUP
+    SCORING_RULES_FILE = os.getenv("SCORING_RULES_FILE", "")
 
     # GPIO Configuration (if RPi.GPIO is to be used directly here)
     GPIO_PIN_ALARM = int(os.getenv("GPIO_PIN_ALARM", "17"))
     USE_GPIO = os.getenv("USE_GPIO", "true").lower() == "true"
+    # "gpio" drives GPIO_PIN_ALARM from this process; "mqtt" hands alarms to `gpio_relay.py --mqtt` on the host
+    ALARM_RELAY_MODE = os.getenv("ALARM_RELAY_MODE", "gpio").lower()
+    ALARM_RELAY_TOPIC = os.getenv("ALARM_RELAY_TOPIC", "vz/relay/command") # Relay command topic for the "mqtt" mode
+    ALARM_DURATION_SECONDS = float(os.getenv("ALARM_DURATION_SECONDS", "0")) # Turn the alarm off after this long, 0 = stay on
+    # Optional strobe "on_ms,off_ms" (e.g. "500,500") for the "mqtt" mode; empty = steady
+    ALARM_PATTERN = [int(ms) for ms in os.getenv("ALARM_PATTERN", "").split(",") if ms.strip()]
 
     # Event Timeout (for pending audio inquiries)
     EVENT_TIMEOUT_SECONDS = int(os.getenv("EVENT_TIMEOUT_SECONDS", "60"))
+    # What to do when an inquiry times out: "drop", "publish" (to MQTT_TIMEOUT_TOPIC) or "score_as_silence"
+    EVENT_TIMEOUT_ACTION = os.getenv("EVENT_TIMEOUT_ACTION", "drop").lower()
+    MQTT_TIMEOUT_TOPIC = os.getenv("MQTT_TIMEOUT_TOPIC", "vz/timeout") # Topic for timed-out inquiry results
+    PENDING_EVENTS_MAX = int(os.getenv("PENDING_EVENTS_MAX", "1000")) # Hard cap on pending inquiries
+    PENDING_EVENTS_EVICTION = os.getenv("PENDING_EVENTS_EVICTION", "evict_oldest").lower() # evict_oldest or reject_new
+    PENDING_EXPIRY_TICK_SECONDS = float(os.getenv("PENDING_EXPIRY_TICK_SECONDS", "1.0")) # Background expiry interval
+    # Journal that keeps pending inquiries and recent alarms across restarts (empty disables)
+    PENDING_JOURNAL_PATH = os.getenv("PENDING_JOURNAL_PATH", "") # e.g. "/data/scorer/pending.journal"
+    PENDING_JOURNAL_FSYNC_SECONDS = float(os.getenv("PENDING_JOURNAL_FSYNC_SECONDS", "1.0")) # Batched fsync interval, 0 = every write
+    PENDING_JOURNAL_COMPACT_RECORDS = int(os.getenv("PENDING_JOURNAL_COMPACT_RECORDS", "1000")) # Min journal lines before compacting
+
+    # Track State (per Frigate event_id)
+    # "true" rescores every Frigate update (incrementally); "false" only new events and significant_change updates
+    TRACK_ALL_UPDATES = os.getenv("TRACK_ALL_UPDATES", "true").lower() == "true"
+    TRACK_MAX = int(os.getenv("TRACK_MAX", "5000")) # Maximum tracks kept in memory
+    TRACK_IDLE_SECONDS = int(os.getenv("TRACK_IDLE_SECONDS", "600")) # Drop tracks with no update for this long
+
+    # Cross-camera Incidents (events correlated into one incident get one inquiry and one alarm)
+    INCIDENT_WINDOW_SECONDS = float(os.getenv("INCIDENT_WINDOW_SECONDS", "0")) # 0 treats every event on its own
+    INCIDENT_MAX_AGE_SECONDS = float(os.getenv("INCIDENT_MAX_AGE_SECONDS", "300")) # Incidents stop growing after this long
+    INCIDENT_CAMERA_GROUPS = parse_camera_groups(os.getenv("INCIDENT_CAMERA_GROUPS", "")) # "front,porch;back,garden"; empty = all cameras
+    INCIDENT_MATCH_ZONE = os.getenv("INCIDENT_MATCH_ZONE", "false").lower() == "true" # Also require the same zone
+    INCIDENT_REID_FIELD = os.getenv("INCIDENT_REID_FIELD", "") # Optional re-id value in the event data, e.g. "sub_label"
+    INCIDENT_CAMERA_BONUS = float(os.getenv("INCIDENT_CAMERA_BONUS", "0.0")) # Added to the incident score per extra camera
+    INCIDENT_MAX = int(os.getenv("INCIDENT_MAX", "1000")) # Maximum incidents kept in memory
+
+    # Enrichment (attributes from CodeProject.AI for the Frigate snapshot; empty ENRICH_CPAI_URL disables)
+    ENRICH_CPAI_URL = os.getenv("ENRICH_CPAI_URL", "") # e.g. "http://codeprojectai:32168"
+    ENRICH_FRIGATE_URL = os.getenv("ENRICH_FRIGATE_URL", "http://frigate:5000") # Frigate API serving event snapshots
+    ENRICH_MODULES_FILE = os.getenv("ENRICH_MODULES_FILE", "/config/modules.json") # CPAI modules.json; its enabled modules are called
+    ENRICH_LABELS = [l.strip() for l in os.getenv("ENRICH_LABELS", "person").split(",") if l.strip()] # Frigate labels to enrich
+    ENRICH_TIMEOUT_SECONDS = float(os.getenv("ENRICH_TIMEOUT_SECONDS", "2.0")) # Per HTTP request
+    ENRICH_REFRESH_SECONDS = float(os.getenv("ENRICH_REFRESH_SECONDS", "5")) # Minimum time between snapshot fetches per event
+    ENRICH_CACHE_SIZE = int(os.getenv("ENRICH_CACHE_SIZE", "1000")) # Events and snapshot results kept in the LRU caches
+    ENRICH_POOL_SIZE = int(os.getenv("ENRICH_POOL_SIZE", "4")) # Kept-alive connections per server
+
+    # Worker Pipeline Configuration
+    # "inline" runs callbacks on the paho network thread; "pipeline" only enqueues messages there
+    # and hands decode/scoring/publishing to a pool of worker threads partitioned by event ID.
+    SCORER_WORKER_MODE = os.getenv("SCORER_WORKER_MODE", "inline").lower()
+    SCORER_WORKER_COUNT = int(os.getenv("SCORER_WORKER_COUNT", "2"))
+    SCORER_QUEUE_MAXSIZE = int(os.getenv("SCORER_QUEUE_MAXSIZE", "1000")) # Per-worker queue bound
+    SCORER_QUEUE_DROP_POLICY = os.getenv("SCORER_QUEUE_DROP_POLICY", "drop_oldest").lower() # block, drop_newest, drop_oldest
+    SCORER_QUEUE_BLOCK_TIMEOUT = float(os.getenv("SCORER_QUEUE_BLOCK_TIMEOUT", "0.5")) # Seconds, for the "block" policy
+    SCORER_QUEUE_METRICS_INTERVAL = float(os.getenv("SCORER_QUEUE_METRICS_INTERVAL", "30")) # Seconds, 0 disables
+
+    # Sharding (scorers in one group split the events via an MQTT shared subscription; empty group disables)
+    SCORER_SHARD_GROUP = os.getenv("SCORER_SHARD_GROUP", "") # e.g. "scorers"
+    SCORER_SHARD_ID = os.getenv("SCORER_SHARD_ID", "") or socket.gethostname() # Unique per replica
+    SCORER_SHARD_TOPIC_BASE = os.getenv("SCORER_SHARD_TOPIC_BASE", "vz/scorer/shard") # Shard status and forwarding topics
+    SCORER_SHARD_VNODES = int(os.getenv("SCORER_SHARD_VNODES", "64")) # Virtual nodes per shard on the hash ring
+
+    # Alerts
+    ALERT_PAYLOAD = os.getenv("ALERT_PAYLOAD", "compact").lower() # "compact" or "full" (adds original_event_data and trace)
+    ALERT_COALESCE_WINDOW_SECONDS = float(os.getenv("ALERT_COALESCE_WINDOW_SECONDS", "0")) # 0 publishes every alarm
+    ALERT_COALESCE_KEY = [f.strip() for f in os.getenv("ALERT_COALESCE_KEY", "camera").lower().split(",") if f.strip()] # camera, zone, label, event, incident
+    ALERT_RATE_PER_MINUTE = float(os.getenv("ALERT_RATE_PER_MINUTE", "0")) # Max alerts per minute overall, 0 = unlimited
+    ALERT_BURST = int(os.getenv("ALERT_BURST", "5")) # Alerts allowed back to back before the rate applies
+
+    # Payload Decoding
+    SCORER_JSON_BACKEND = os.getenv("SCORER_JSON_BACKEND", "auto").lower() # auto, msgspec, orjson or json
+
+    # Metrics (Prometheus text format on http://<host>:<port>/metrics, optional JSON snapshots on MQTT)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_HTTP_HOST = os.getenv("METRICS_HTTP_HOST", "0.0.0.0")
+    METRICS_HTTP_PORT = int(os.getenv("METRICS_HTTP_PORT", "9101")) # 0 disables the HTTP endpoint
+    METRICS_MQTT_TOPIC = os.getenv("METRICS_MQTT_TOPIC", "") # e.g. "vz/stats/scorer"; empty disables
+    METRICS_MQTT_INTERVAL = float(os.getenv("METRICS_MQTT_INTERVAL", "60")) # Seconds between MQTT snapshots
 
 except ValueError as e:
     logging.error(f"Error reading environment variable: {e}. Please check data types.")
     exit(1)
 
 # --- Logging Setup ---
-logging.basicConfig(level=logging.INFO, format=\'%(asctime)s - %(levelname)s - %(message)s\')
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- GPIO Setup (Conditional) ---
+if USE_GPIO and ALARM_RELAY_MODE == "mqtt":
+    logging.info(f"Alarms are handed to the relay service on {ALARM_RELAY_TOPIC}; GPIO is not used directly.")
+    USE_GPIO = False
 if USE_GPIO:
     try:
         import RPi.GPIO as GPIO
@@ -62,124 +164,308 @@ if USE_GPIO:
         logging.error(f"Error initializing GPIO: {e}")
         USE_GPIO = False
 
-# --- Global State ---
-# Dictionary to store scores and timestamps for events pending audio feedback
-# Key: event_id, Value: {"score": current_score, "timestamp": time.time(), "initial_data": event_data}
-pending_events = {}
-
 # --- MQTT Client Setup ---
-mqtt_client = mqtt.Client()
+mqtt_client = mqtt.Client(protocol=mqtt.MQTTv5 if MQTT_PROTOCOL == "5" else mqtt.MQTTv311)
+
+# --- Metrics ---
+# No-op objects unless METRICS_ENABLED, so the instrumentation below costs next to nothing when off
+metrics = MetricsRegistry(enabled=METRICS_ENABLED)
+handle_seconds = metrics.histogram("scorer_handle_seconds", "Time to handle one MQTT message.", ("kind",))
+stage_seconds = metrics.histogram("scorer_stage_seconds", "Time spent per scoring stage.", ("stage",))
+frigate_events_total = metrics.counter("scorer_frigate_events_total", "Frigate messages by outcome.", ("outcome",))
+decisions_total = metrics.counter("scorer_decisions_total", "Alarms, inquiries, timeouts and evictions.", ("decision",))
+alerts_suppressed_total = metrics.counter("scorer_alerts_suppressed_total", "Alarms merged into a coalesced alert or held by the rate limit.")
+event_latency_seconds = metrics.histogram("scorer_event_latency_seconds", "First traced mark to alarm, by decision path.", ("path",))
+metrics.gauge("scorer_pending_events", "Audio inquiries awaiting a result.", fn=lambda: len(pending_events))
+metrics.gauge("scorer_tracks", "Frigate tracks held in memory.", fn=lambda: len(tracks))
 
 # --- Helper Functions ---
-def trigger_alarm(event_id, final_score, event_data):
-    """Triggers the alarm system (GPIO and/or MQTT alert)."""
+def incident_id_for(event_id):
+    """Returns the ID of the incident an event belongs to, or None."""
+    incident = incidents.get_for_event(event_id) if incidents is not None else None
+    return incident.incident_id if incident else None
+
+def alert_key(event_id, event_data):
+    """Coalescing key for an alarm, from the ALERT_COALESCE_KEY fields."""
+    parts = []
+    for field in ALERT_COALESCE_KEY:
+        if field == "zone":
+            zones = event_data.get("current_zones") or event_data.get("entered_zones") or []
+            value = zones[0] if zones else ""
+        elif field == "event":
+            value = event_id
+        elif field == "incident":
+            value = incident_id_for(event_id) or event_id
+        else:
+            value = event_data.get(field, "")
+        parts.append(f"{field}={value}")
+    return "|".join(parts)
+
+def publish_alert(alert_message):
+    """Publishes an alert (called by the alert coalescer)."""
+    with stage_seconds.labels("publish").time():
+        mqtt_client.publish(MQTT_ALERT_TOPIC, json.dumps(alert_message), qos=1)
+
+alarm_off_timer = None # Turns GPIO_PIN_ALARM off after ALARM_DURATION_SECONDS in the "gpio" mode
+
+def alarm_off():
+    """Turns the local alarm pin off (called by alarm_off_timer)."""
+    try:
+        GPIO.output(GPIO_PIN_ALARM, GPIO.LOW)
+        logging.info(f"GPIO pin {GPIO_PIN_ALARM} set to LOW (Alarm OFF after {ALARM_DURATION_SECONDS}s).")
+    except Exception as e:
+        logging.error(f"Error turning off GPIO alarm: {e}")
+
+def drive_alarm_relay(event_id, trace):
+    """Turns the alarm relay on (directly or via the relay service) and returns the trace marked accordingly."""
+    global alarm_off_timer
+    if ALARM_RELAY_MODE == "mqtt":
+        # gpio_relay.py owns the pin and schedules the pulse or strobe, so this is a single non-blocking publish
+        command = {"pin": GPIO_PIN_ALARM, "action": "on", "seconds": ALARM_DURATION_SECONDS or None, "event_id": event_id}
+        if len(ALARM_PATTERN) == 2:
+            command.update(action="pattern", on_ms=ALARM_PATTERN[0], off_ms=ALARM_PATTERN[1])
+        mqtt_client.publish(ALARM_RELAY_TOPIC, json.dumps(command), qos=1)
+        logging.info(f"Alarm handed to the relay service for event {event_id}: {command}")
+        return mark(trace, "relay_sent")
+    if not USE_GPIO:
+        return trace
+    try:
+        GPIO.output(GPIO_PIN_ALARM, GPIO.HIGH)
+        trace = mark(trace, "gpio_set")
+        logging.info(f"GPIO pin {GPIO_PIN_ALARM} set to HIGH (Alarm ON).")
+        if ALARM_DURATION_SECONDS > 0:
+            if alarm_off_timer:
+                alarm_off_timer.cancel() # A new alarm restarts the countdown
+            alarm_off_timer = threading.Timer(ALARM_DURATION_SECONDS, alarm_off)
+            alarm_off_timer.daemon = True
+            alarm_off_timer.start()
+    except Exception as e:
+        logging.error(f"Error controlling GPIO for alarm: {e}")
+    return trace
+
+def trigger_alarm(event_id, final_score, event_data, trace=None):
+    """Triggers the alarm system (GPIO and/or MQTT alert).
+
+    The relay is driven first so the alert can report the full latency breakdown of the event's trace.
+    The alert itself goes through the coalescer, which may merge it with other alarms for the same key.
+    """
+    logging.warning(f"ALARM TRIGGERED for event {event_id}! Score: {final_score} "
+                    f"({event_data.get('label')} on {event_data.get('camera')}).")
+    logging.debug(f"Alarm event data for {event_id}: {event_data}")
+    track = tracks.get(event_id)
+    if track:
+        track.alarmed = True # Don't raise the alarm again on later updates of the same track
+
+    if pending_journal:
+        pending_journal.record_decision(event_id, "alarm", final_score)
+
+    trace = drive_alarm_relay(event_id, trace)
+
+    trace = mark(trace, "alert_sent")
+    latency = breakdown(trace)
     alert_message = {
+        "type": "alarm",
         "event_id": event_id,
         "final_score": final_score,
         "reason": "Threat score exceeded threshold.",
         "timestamp": time.time(),
-        "original_event_data": event_data
+        "camera": event_data.get("camera"),
+        "label": event_data.get("label"),
+        "sub_label": event_data.get("sub_label"),
+        "zones": event_data.get("current_zones") or [],
+        "incident_id": incident_id_for(event_id),
+        "latency": latency # Per-step milliseconds, see event_trace.breakdown
     }
-    logging.warning(f"ALARM TRIGGERED for event {event_id}! Score: {final_score}. Data: {event_data}")
-    mqtt_client.publish(MQTT_ALERT_TOPIC, json.dumps(alert_message), qos=1)
-
-    if USE_GPIO:
-        try:
-            GPIO.output(GPIO_PIN_ALARM, GPIO.HIGH)
-            logging.info(f"GPIO pin {GPIO_PIN_ALARM} set to HIGH (Alarm ON).")
-            # Potentially add logic to turn off alarm after a period, or via another MQTT command
-        except Exception as e:
-            logging.error(f"Error controlling GPIO for alarm: {e}")
-
-def trigger_audio_inquiry(event_id, current_score, initial_event_data):
+    if ALERT_PAYLOAD == "full":
+        alert_message["original_event_data"] = event_data
+        alert_message["trace"] = trace
+    if not alert_coalescer.submit(alert_key(event_id, event_data), alert_message):
+        alerts_suppressed_total.inc()
+        logging.info(f"Alert for event {event_id} coalesced or rate limited.")
+    decisions_total.labels("alarm").inc()
+    if "total_ms" in latency:
+        steps = latency["steps"]
+        path = "audio" if "audio_round_trip_ms" in latency else "timeout" if "timed_out" in steps else "visual"
+        event_latency_seconds.labels(path).observe(latency["total_ms"] / 1000)
+        logging.info(f"Alarm latency for event {event_id}: {latency}")
+
+def trigger_audio_inquiry(event_id, current_score, initial_event_data, trace=None):
     """Publishes a message to trigger the audio inquiry service."""
     inquiry_topic = f"{MQTT_INQUIRY_TRIGGER_TOPIC_BASE}/{event_id}"
+    trace = mark(trace, "inquiry_sent")
     payload = {
         "event_id": event_id,
         "current_score": current_score,
-        "timestamp": time.time()
+        # Lets the audio service pick a prompt per object type / camera (AUDIO_PROMPT_MAP)
+        "label": initial_event_data.get("label"),
+        "camera": initial_event_data.get("camera"),
+        "incident_id": incident_id_for(event_id),
+        "timestamp": time.time(),
+        "trace": trace # Echoed back (with the audio service's marks) in the audio result
     }
     try:
-        mqtt_client.publish(inquiry_topic, json.dumps(payload), qos=1)
+        # Store event as pending audio feedback before publishing, so a fast reply always finds it
+        if not pending_events.add(event_id, current_score, initial_event_data, trace=trace):
+            logging.warning(f"Audio inquiry for event {event_id} not sent: pending inquiry store is full.")
+            return
+        with stage_seconds.labels("publish").time():
+            mqtt_client.publish(inquiry_topic, json.dumps(payload), qos=1)
+        decisions_total.labels("inquiry").inc()
         logging.info(f"Audio inquiry triggered for event {event_id} on topic {inquiry_topic}.")
-        # Store event as pending audio feedback
-        pending_events[event_id] = {
-            "score": current_score,
-            "timestamp": time.time(),
-            "initial_data": initial_event_data
-        }
     except Exception as e:
+        pending_events.pop(event_id)
         logging.error(f"Failed to publish audio inquiry trigger for event {event_id}: {e}")
 
-def calculate_initial_score(data):
-    """Calculates the initial score based on Frigate/CPAI event data."""
-    score = 0.0
-    label = data.get("label", "")
-    # Basic score for person detection
-    if label == "person":
-        score += SCORE_BASE_PERSON
-
-    # Bonus for weapon detection (from Frigate or CPAI)
-    # This assumes CPAI results might be merged into Frigate events or come as separate events
-    # For simplicity, checking `data.get("attributes", {}).get("weapon")` or similar field
-    if data.get("extras", {}).get("weapon") or data.get("attributes", {}).get("weapon"): # Compatibility with original script
-        score += SCORE_BONUS_WEAPON
-        logging.info(f"Weapon detected, adding bonus: {SCORE_BONUS_WEAPON}")
-
-    # Example: Bonus for clothing attributes (if provided by CPAI and merged)
-    clothing_attributes = data.get("attributes", {}).get("clothing", {})
-    if clothing_attributes.get("mask"): # Assuming boolean
-        score += SCORE_BONUS_CLOTHING_MASK
-        logging.info(f"Mask detected, adding bonus: {SCORE_BONUS_CLOTHING_MASK}")
-    if clothing_attributes.get("hoodie"):
-        score += SCORE_BONUS_CLOTHING_HOODIE
-        logging.info(f"Hoodie detected, adding bonus: {SCORE_BONUS_CLOTHING_HOODIE}")
-
-    # Example: Bonus for pose (if provided by CPAI and merged)
-    pose_attribute = data.get("attributes", {}).get("pose", "")
-    if pose_attribute in ["crouch", "prone"]:
-        score += SCORE_BONUS_POSE_CROUCH_PRONE
-        logging.info(f"Pose 	"{pose_attribute}" detected, adding bonus: {SCORE_BONUS_POSE_CROUCH_PRONE}")
-
-    # Add Frigate's confidence for the primary object if available and relevant
-    # This needs careful tuning; raw confidence might not directly translate to threat.
-    # For now, we rely on specific attribute bonuses.
-    # score += data.get("confidence", 0.0) * 0.1 # Example: Small factor of Frigate confidence
+def default_scoring_rules():
+    """Builds the rules config equivalent to the SCORE_* environment variables."""
+    return {
+        "visual_rules": [
+            {"name": "person", "weight": SCORE_BASE_PERSON, "field": "label", "op": "eq", "value": "person"},
+            # Weapon detection from Frigate or CPAI ("extras" kept for compatibility with the original script)
+            {"name": "weapon", "weight": SCORE_BONUS_WEAPON, "any": [
+                {"field": "extras.weapon", "op": "truthy"},
+                {"field": "attributes.weapon", "op": "truthy"}]},
+            {"name": "clothing_mask", "weight": SCORE_BONUS_CLOTHING_MASK, "field": "attributes.clothing.mask", "op": "truthy"},
+            {"name": "clothing_hoodie", "weight": SCORE_BONUS_CLOTHING_HOODIE, "field": "attributes.clothing.hoodie", "op": "truthy"},
+            {"name": "pose_crouch_prone", "weight": SCORE_BONUS_POSE_CROUCH_PRONE, "field": "attributes.pose", "op": "in",
+             "value": ["crouch", "prone"]},
+        ],
+        "audio_rules": [
+            {"name": "negative_tone", "weight": SCORE_AUDIO_NEGATIVE_TONE, "field": "tone", "op": "eq", "value": "negative"},
+            {"name": "threat_keywords", "weight": SCORE_AUDIO_THREAT_KEYWORDS, "field": "transcript", "op": "keywords",
+             "value": AUDIO_THREAT_KEYWORDS},
+            # e.g. "package delivery", "food delivery"
+            {"name": "calm_delivery", "weight": SCORE_AUDIO_CALM_DELIVERY, "all": [
+                {"field": "transcript", "op": "keywords", "value": ["delivery"]},
+                {"field": "tone", "op": "ne", "value": "negative"}]},
+            # Silence or non-committal response (the audio service reports no speech as tone "silent")
+            {"name": "evasive_silence", "weight": SCORE_AUDIO_EVASIVE_SILENCE, "all": [
+                {"field": "transcript", "op": "empty"},
+                {"field": "tone", "op": "in", "value": ["neutral", "silent"]}]},
+        ],
+    }
+
+# --- Scoring Rules ---
+# Compiled once at startup and on SIGHUP; scoring reads scoring_engine.rules without locking
+try:
+    scoring_engine = RuleEngine(default_scoring_rules(), (SCORE_THRESHOLD_ALARM, SCORE_THRESHOLD_INQUIRY),
+                                rules_file=SCORING_RULES_FILE or None)
+except ValueError as e:
+    logging.error(f"Invalid default scoring rules: {e}")
+    exit(1)
+if SCORING_RULES_FILE and not scoring_engine.reload():
+    logging.error(f"Could not load scoring rules from {SCORING_RULES_FILE}. Exiting.")
+    exit(1)
 
+def calculate_initial_score(data, rules=None):
+    """Calculates the initial score based on Frigate/CPAI event data."""
+    rules = rules or scoring_engine.rules
+    score, matched_rules = rules.score_visual(data)
+    if matched_rules:
+        logging.debug(f"Matched visual scoring rules: {matched_rules}")
     return round(score, 2)
 
+# --- Payload Decoding ---
+# Decodes only the "after" fields the scorer and its rules use; rebuilt when reloaded rules need other fields
+# Plus the incident re-id field, and the snapshot fields that tell enrichment when Frigate's snapshot changed
+EXTRA_AFTER_FIELDS = {INCIDENT_REID_FIELD.split(".", 1)[0]} if INCIDENT_REID_FIELD else set()
+EXTRA_AFTER_FIELDS |= {"snapshot", "snapshot_time"} if ENRICH_CPAI_URL else set()
+try:
+    frigate_decoder = FrigateEventDecoder(SCORER_JSON_BACKEND, after_fields_for_rules(scoring_engine.rules) | EXTRA_AFTER_FIELDS)
+except ValueError as e:
+    logging.error(f"Invalid decoder configuration: {e}")
+    exit(1)
+
+def on_sighup(signum, frame):
+    """Reloads the scoring rules file so weights and thresholds can be tuned without a restart."""
+    global frigate_decoder
+    logging.info("SIGHUP received. Reloading scoring rules...")
+    if scoring_engine.reload():
+        after_fields = after_fields_for_rules(scoring_engine.rules) | EXTRA_AFTER_FIELDS
+        if set(frigate_decoder.after_fields) != after_fields:
+            frigate_decoder = FrigateEventDecoder(frigate_decoder.backend, after_fields)
+
 # --- MQTT Callbacks ---
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         logging.info("Successfully connected to MQTT broker.")
         try:
-            client.subscribe(MQTT_FRIGATE_TOPIC)
+            if shard_router:
+                # Shards share the input topics; each event is then routed to its owner's inbox
+                client.subscribe(shard_router.shared(MQTT_FRIGATE_TOPIC))
+                client.subscribe(shard_router.shared(MQTT_AUDIO_TOPIC))
+                client.subscribe(shard_router.inbox_topic("+"))
+                client.subscribe(shard_router.status_filter())
+                client.publish(shard_router.status_topic(), "online", qos=1, retain=True)
+                logging.info(f"Joined scorer shard group '{SCORER_SHARD_GROUP}' as {SCORER_SHARD_ID}.")
+            else:
+                client.subscribe(MQTT_FRIGATE_TOPIC)
+                client.subscribe(MQTT_AUDIO_TOPIC)
             logging.info(f"Subscribed to Frigate events: {MQTT_FRIGATE_TOPIC}")
-            client.subscribe(MQTT_AUDIO_TOPIC)
             logging.info(f"Subscribed to Audio results: {MQTT_AUDIO_TOPIC}")
         except Exception as e:
             logging.error(f"Error subscribing to topics: {e}")
     else:
         logging.error(f"Failed to connect to MQTT broker, return code: {rc}")
 
-def on_disconnect(client, userdata, rc):
+def on_disconnect(client, userdata, rc, properties=None):
     logging.warning(f"Disconnected from MQTT broker with result code {rc}. Attempting to reconnect...")
     # Implement reconnection logic if paho-mqtt doesn't handle it sufficiently by default
     # For now, relying on paho-mqtt's auto-reconnect if enabled, or eventual container restart.
 
+def start_event_trace(event_id, track, event_data, received_at):
+    """Starts the latency trace for a decision taken on this Frigate message."""
+    marks = [("frigate_received", received_at), ("scored", time.monotonic())]
+    if track.updates > 1:
+        marks.insert(0, ("frigate_new", track.first_seen)) # The decision came on a later update
+    return new_trace(event_id, origin=event_data.get("frame_time"), marks=marks)
+
+def enrich_event(event_id, event_data):
+    """Merges the CPAI attributes of the event's snapshot into event_data (cached, see scorer_enrich.py)."""
+    try:
+        with stage_seconds.labels("enrich").time():
+            found, outcome = enricher.enrich(event_id, event_data)
+    except Exception as e:
+        logging.error(f"Error enriching event {event_id}: {e}")
+        return
+    enrich_total.labels(outcome).inc()
+    if found:
+        event_data["attributes"] = merge_attributes(event_data.get("attributes"), found)
+
 def on_frigate_event(client, userdata, msg):
     """Handles incoming detection events from Frigate (and potentially CPAI)."""
+    received_at = time.monotonic()
     try:
-        data = json.loads(msg.payload.decode())
-        event_id = data.get("id")
-        event_type = data.get("type", "unknown") # e.g., "new", "update", "end"
+        # Skip events that would be discarded anyway without decoding them
+        event_types = peek_event_types(msg.payload)
+        if not event_types & {"new", "update", "end"}:
+            frigate_events_total.labels("skipped").inc()
+            return
+        if event_types == {"update"} and not TRACK_ALL_UPDATES and not peek_significant_change(msg.payload):
+            frigate_events_total.labels("skipped").inc()
+            return
 
-        logging.info(f"Received Frigate event ({event_type}) for ID {event_id}: {data}")
+        with stage_seconds.labels("decode").time():
+            event = frigate_decoder.decode(msg.payload)
+        event_id = event.id
+        event_type = event.type # e.g., "new", "update", "end"
+
+        if event_type == "new":
+            logging.info(f"Received Frigate event ({event_type}) for ID {event_id}.")
+        logging.debug(f"Frigate event ({event_type}) for ID {event_id}: {event.after}")
+
+        if event_type == "end":
+            track = tracks.end(event_id)
+            if enricher is not None:
+                enricher.forget(event_id)
+            frigate_events_total.labels("ended").inc()
+            if track:
+                logging.info(f"Event {event_id} ended after {track.updates} update(s). Last score: {track.score}")
+            return
 
-        # Process only new events or significant updates to avoid redundant scoring
-        # The example focuses on initial detection and audio follow-up.
-        # More complex state management per event_id might be needed for continuous updates.
-        if event_type == "new" or (event_type == "update" and data.get("significant_change", False)):
+        # Score new events and updates. Updates are rescored incrementally against the track's
+        # previous attribute vector; with TRACK_ALL_UPDATES=false only significant changes are scored.
+        if event_type == "new" or (event_type == "update" and (TRACK_ALL_UPDATES or event.significant_change)):
             if not event_id:
                 logging.warning("Event received without an ID. Skipping.")
                 return
@@ -187,21 +473,48 @@ def on_frigate_event(client, userdata, msg):
             # Clean up old pending events to prevent memory leaks
             cleanup_pending_events()
 
-            if event_id in pending_events:
-                logging.info(f"Event {event_id} is already pending audio inquiry. Ignoring new Frigate event for now.")
+            rules = scoring_engine.rules
+            event_data = event.after # Only the fields selected by the decoder
+            track = tracks.touch(event_id)
+            if enricher is not None and event_data.get("label") in ENRICH_LABELS:
+                enrich_event(event_id, event_data)
+            with stage_seconds.labels("score").time():
+                track.visual_score = rules.rescore_visual(event_data, track.visual_score)
+            current_score = round(track.visual_score.score, 2)
+            if track.updates > 1 and current_score == track.score:
+                frigate_events_total.labels("unchanged").inc()
+                return # Nothing relevant to scoring changed since the last update
+            frigate_events_total.labels("scored").inc()
+            track.score = current_score
+            logging.info(f"Score for event {event_id} ({event_type}): {current_score}")
+
+            # With incidents enabled, decisions use the incident's aggregated score and are taken once per incident
+            incident = incidents.link(event_id, event_data, current_score) if incidents is not None else None
+            decision_score = incident.score(INCIDENT_CAMERA_BONUS) if incident else current_score
+            inquiry_event_id = incident.inquiry_event_id or event_id if incident else event_id
+
+            if track.alarmed or (incident and incident.alarmed):
                 return
-
-            current_score = calculate_initial_score(data.get("after", {})) # Frigate events often have before/after
-            logging.info(f"Initial score for event {event_id}: {current_score}")
-
-            if current_score >= SCORE_THRESHOLD_ALARM:
-                trigger_alarm(event_id, current_score, data.get("after", {}))
-            elif current_score >= SCORE_THRESHOLD_INQUIRY:
-                trigger_audio_inquiry(event_id, current_score, data.get("after", {}))
+            if decision_score >= rules.alarm_threshold:
+                if incident and not incidents.claim_alarm(incident):
+                    return # Another event of the incident raised the alarm first
+                if pending_events.pop(inquiry_event_id):
+                    logging.info(f"Event {event_id} crossed the alarm threshold while pending audio inquiry. Escalating.")
+                trigger_alarm(event_id, decision_score, event_data, start_event_trace(event_id, track, event_data, received_at))
+            elif inquiry_event_id in pending_events:
+                # Keep the pending inquiry's base score in step with the latest visual score
+                pending_events.update_score(inquiry_event_id, decision_score)
+            elif decision_score >= rules.inquiry_threshold and not track.inquired:
+                track.inquired = True
+                if incident and not incidents.claim_inquiry(incident, event_id):
+                    logging.info(f"Event {event_id} belongs to incident {incident.incident_id}, already inquired via event "
+                                 f"{incident.inquiry_event_id}. No new inquiry.")
+                    return
+                trigger_audio_inquiry(event_id, decision_score, event_data, start_event_trace(event_id, track, event_data, received_at))
             else:
-                logging.info(f"Event {event_id} score {current_score} is below inquiry threshold. No action.")
+                logging.info(f"Event {event_id} score {decision_score} is below inquiry threshold. No action.")
 
-    except json.JSONDecodeError:
+    except ValueError:
         logging.error(f"Failed to decode JSON from MQTT message: {msg.payload}")
     except Exception as e:
         logging.error(f"Error processing Frigate event: {e}")
@@ -209,7 +522,7 @@ def on_frigate_event(client, userdata, msg):
 def on_audio_result(client, userdata, msg):
     """Handles incoming audio analysis results from the audio service."""
     try:
-        audio_data = json.loads(msg.payload.decode())
+        audio_data = frigate_decoder.loads(msg.payload)
         event_id = audio_data.get("id")
         transcript = audio_data.get("transcript", "").lower()
         tone = audio_data.get("tone", "neutral").lower()
@@ -220,68 +533,379 @@ def on_audio_result(client, userdata, msg):
             logging.warning("Audio result received without an event ID. Skipping.")
             return
 
-        if event_id in pending_events:
-            current_score = pending_events[event_id]["score"]
-            initial_event_data = pending_events[event_id]["initial_data"]
+        if audio_data.get("partial"):
+            handle_partial_audio_result(event_id, transcript, tone, audio_data.get("trace"))
+            return
+
+        pending_event = pending_events.pop(event_id)
+
+        if pending_event:
+            # The audio service returns the trace with its own marks; older versions don't
+            trace = mark(audio_data.get("trace") or pending_event.get("trace"), "audio_received")
+            current_score = pending_event["score"]
+            initial_event_data = pending_event["initial_data"]
             logging.info(f"Updating score for event {event_id} based on audio. Initial score: {current_score}")
 
             # Adjust score based on audio
-            if tone == "negative":
-                current_score += SCORE_AUDIO_NEGATIVE_TONE
-                logging.info(f"Negative tone detected. Score +{SCORE_AUDIO_NEGATIVE_TONE}")
-            
-            # Example: Check for specific keywords
-            if any(word in transcript for word in ["help", "police", "intruder", "attack"]):
-                current_score += SCORE_AUDIO_THREAT_KEYWORDS
-                logging.info(f"Threat keywords detected. Score +{SCORE_AUDIO_THREAT_KEYWORDS}")
-            
-            if "delivery" in transcript and tone != "negative": # e.g. "package delivery", "food delivery"
-                current_score += SCORE_AUDIO_CALM_DELIVERY # Negative adjustment
-                logging.info(f"Calm delivery mentioned. Score {SCORE_AUDIO_CALM_DELIVERY}")
-            
-            if not transcript.strip() and tone == "neutral": # Check for silence or non-committal response
-                current_score += SCORE_AUDIO_EVASIVE_SILENCE
-                logging.info(f"Evasive silence or no clear response. Score +{SCORE_AUDIO_EVASIVE_SILENCE}")
-
-            current_score = round(current_score, 2)
-            logging.info(f"Score for event {event_id} after audio analysis: {current_score}")
-
-            if current_score >= SCORE_THRESHOLD_ALARM:
-                trigger_alarm(event_id, current_score, initial_event_data)
+            rules = scoring_engine.rules
+            score_delta, matched_rules = rules.score_audio({"transcript": transcript, "tone": tone})
+            current_score = round(current_score + score_delta, 2)
+            logging.info(f"Score for event {event_id} after audio analysis: {current_score} (matched: {matched_rules})")
+
+            if current_score >= rules.alarm_threshold:
+                if claim_incident_alarm(event_id):
+                    trigger_alarm(event_id, current_score, initial_event_data, trace)
             else:
                 logging.info(f"Event {event_id} score {current_score} after audio is below alarm threshold. No alarm.")
-            
-            # Remove event from pending list after processing
-            del pending_events[event_id]
+        elif pending_journal and event_id in pending_journal.decisions:
+            logging.info(f"Received audio result for event {event_id}, already decided ({pending_journal.decisions[event_id]['kind']}). Ignoring.")
         else:
             logging.warning(f"Received audio result for unknown or timed-out event ID: {event_id}. Ignoring.")
 
-    except json.JSONDecodeError:
+    except ValueError:
         logging.error(f"Failed to decode JSON from audio MQTT message: {msg.payload}")
     except Exception as e:
         logging.error(f"Error processing audio result: {e}")
 
+def handle_partial_audio_result(event_id, transcript, tone, trace=None):
+    """Raises the alarm early if a partial transcript already pushes a pending event over the alarm threshold.
+
+    Partials never lower a score or settle an inquiry on their own; otherwise the final result decides.
+    """
+    if not AUDIO_PARTIAL_ALARMS:
+        return
+    pending_event = pending_events.get(event_id)
+    if not pending_event:
+        logging.debug(f"Partial audio result for event {event_id} with no pending inquiry. Ignoring.")
+        return
+
+    rules = scoring_engine.rules
+    score_delta, matched_rules = rules.score_audio({"transcript": transcript, "tone": tone})
+    current_score = round(pending_event["score"] + score_delta, 2)
+    if current_score < rules.alarm_threshold:
+        return
+    if pending_events.pop(event_id) is None:
+        return # The final result or a timeout settled the inquiry first
+    if not claim_incident_alarm(event_id):
+        return
+    logging.info(f"Partial audio result for event {event_id} raised score to {current_score} (matched: {matched_rules}). Alarming early.")
+    trace = mark(trace or pending_event.get("trace"), "audio_received")
+    trigger_alarm(event_id, current_score, pending_event["initial_data"], trace)
+
+def claim_incident_alarm(event_id):
+    """Returns False if the event's incident has already raised its alarm (always True without incidents)."""
+    incident = incidents.get_for_event(event_id) if incidents is not None else None
+    return incident is None or incidents.claim_alarm(incident)
+
 def cleanup_pending_events():
-    """Removes events from pending_events if they have timed out."""
-    now = time.time()
-    timed_out_ids = []
-    for event_id, data in pending_events.items():
-        if now - data["timestamp"] > EVENT_TIMEOUT_SECONDS:
-            timed_out_ids.append(event_id)
-            logging.info(f"Event {event_id} timed out waiting for audio response. Removing from pending.")
-    
-    for event_id in timed_out_ids:
-        del pending_events[event_id]
+    """Removes events from pending_events if they have timed out (also run by the store's background tick)."""
+    pending_events.expire()
+
+def publish_timeout_result(event_id, entry, reason):
+    """Publishes an inquiry that ended without an audio response to MQTT_TIMEOUT_TOPIC."""
+    payload = {
+        "event_id": event_id,
+        "score": entry["score"],
+        "reason": reason,
+        "inquiry_timestamp": entry["timestamp"],
+        "timestamp": time.time()
+    }
+    mqtt_client.publish(MQTT_TIMEOUT_TOPIC, json.dumps(payload), qos=1)
+    logging.info(f"Published {reason} result for event {event_id} to {MQTT_TIMEOUT_TOPIC}.")
+
+def handle_pending_timeout(event_id, entry):
+    """Applies EVENT_TIMEOUT_ACTION to an inquiry that timed out waiting for audio."""
+    logging.info(f"Event {event_id} timed out waiting for audio response. Removing from pending.")
+    decisions_total.labels("timeout").inc()
+    try:
+        if EVENT_TIMEOUT_ACTION == "publish":
+            publish_timeout_result(event_id, entry, "audio_inquiry_timeout")
+        elif EVENT_TIMEOUT_ACTION == "score_as_silence":
+            # No reply at all is treated like an evasive, silent response
+            rules = scoring_engine.rules
+            score_delta, _ = rules.score_audio({"transcript": "", "tone": "silent"})
+            final_score = round(entry["score"] + score_delta, 2)
+            logging.info(f"Scoring timed-out event {event_id} as silence. Score: {final_score}")
+            if final_score >= rules.alarm_threshold and claim_incident_alarm(event_id):
+                trigger_alarm(event_id, final_score, entry["initial_data"], mark(entry.get("trace"), "timed_out"))
+    except Exception as e:
+        logging.error(f"Error applying timeout action for event {event_id}: {e}")
+
+def handle_pending_eviction(event_id, entry):
+    """Handles an inquiry evicted from a full pending store (PENDING_EVENTS_MAX) before its timeout."""
+    # The person may still be answering, so an eviction is never scored as silence
+    logging.warning(f"Event {event_id} evicted from pending before its audio response arrived.")
+    decisions_total.labels("evicted").inc()
+    try:
+        if EVENT_TIMEOUT_ACTION == "publish":
+            publish_timeout_result(event_id, entry, "pending_capacity_evicted")
+    except Exception as e:
+        logging.error(f"Error publishing eviction of event {event_id}: {e}")
+
+# --- Pending Inquiry State ---
+# Events pending audio feedback, keyed by event_id and indexed by deadline
+# Value: {"score": current_score, "timestamp": time.time(), "deadline": ..., "expires_at": ..., "initial_data": event_data, "trace": ...}
+# With PENDING_JOURNAL_PATH, changes (and alarm decisions) are journaled and restored on startup
+pending_journal = None
+if PENDING_JOURNAL_PATH:
+    pending_journal = PendingJournal(PENDING_JOURNAL_PATH,
+                                     fsync_interval=PENDING_JOURNAL_FSYNC_SECONDS,
+                                     compact_min_records=PENDING_JOURNAL_COMPACT_RECORDS,
+                                     decision_retention_seconds=TRACK_IDLE_SECONDS)
+try:
+    pending_events = PendingInquiryStore(timeout_seconds=EVENT_TIMEOUT_SECONDS,
+                                         max_size=PENDING_EVENTS_MAX,
+                                         eviction_policy=PENDING_EVENTS_EVICTION,
+                                         on_expire=handle_pending_timeout,
+                                         on_evict=handle_pending_eviction,
+                                         journal=pending_journal)
+except ValueError as e:
+    logging.error(f"Invalid pending inquiry configuration: {e}")
+    exit(1)
+
+# --- Incidents ---
+# Links Frigate events across cameras into incidents; None when INCIDENT_WINDOW_SECONDS is 0
+incidents = None
+if INCIDENT_WINDOW_SECONDS > 0:
+    incidents = IncidentIndex(window_seconds=INCIDENT_WINDOW_SECONDS,
+                              max_age_seconds=INCIDENT_MAX_AGE_SECONDS,
+                              camera_groups=INCIDENT_CAMERA_GROUPS,
+                              match_zone=INCIDENT_MATCH_ZONE,
+                              reid_field=INCIDENT_REID_FIELD or None,
+                              max_incidents=INCIDENT_MAX)
+    metrics.gauge("scorer_incidents", "Cross-camera incidents held in memory.", fn=lambda: len(incidents))
+
+# --- Alert Coalescing ---
+# Merges alarms with the same ALERT_COALESCE_KEY within the window and caps the overall alert rate
+alert_coalescer = AlertCoalescer(publish_alert,
+                                 window_seconds=ALERT_COALESCE_WINDOW_SECONDS,
+                                 rate_per_minute=ALERT_RATE_PER_MINUTE,
+                                 burst=ALERT_BURST)
+
+# --- Track State ---
+# Last scored attribute vector and decisions per Frigate event_id, for incremental rescoring of updates
+tracks = TrackStore(max_tracks=TRACK_MAX, idle_timeout_seconds=TRACK_IDLE_SECONDS)
+
+# --- Enrichment ---
+# Fetches each event's snapshot from Frigate and merges CPAI module results into its attributes; None when disabled
+enricher = None
+if ENRICH_CPAI_URL:
+    try:
+        enricher = Enricher(ENRICH_FRIGATE_URL, ENRICH_CPAI_URL, load_modules(ENRICH_MODULES_FILE),
+                            timeout=ENRICH_TIMEOUT_SECONDS,
+                            refresh_seconds=ENRICH_REFRESH_SECONDS,
+                            cache_size=ENRICH_CACHE_SIZE,
+                            pool_size=ENRICH_POOL_SIZE)
+    except (OSError, ValueError) as e:
+        logging.error(f"Invalid enrichment configuration: {e}")
+        exit(1)
+    enrich_total = metrics.counter("scorer_enrich_total", "Enrichment lookups by outcome (cached, snapshot_cached, analysed, no_snapshot, failed).", ("outcome",))
+    metrics.gauge("scorer_enrich_cached_events", "Events with cached enrichment results.", fn=lambda: len(enricher.events))
+
+# --- Sharding ---
+# With SCORER_SHARD_GROUP set, routes each Frigate event and audio result to the shard owning its event ID
+shard_router = None
+if SCORER_SHARD_GROUP:
+    if INCIDENT_WINDOW_SECONDS > 0:
+        # Shards are chosen by event ID, so the events of one incident would be correlated on different replicas
+        logging.error("INCIDENT_WINDOW_SECONDS can't be used with SCORER_SHARD_GROUP: cross-camera incidents need every "
+                      "event on one scorer. Disable one of them.")
+        exit(1)
+    try:
+        shard_router = ShardRouter(SCORER_SHARD_ID, SCORER_SHARD_GROUP, SCORER_SHARD_TOPIC_BASE, SCORER_SHARD_VNODES)
+    except ValueError as e:
+        logging.error(f"Invalid sharding configuration: {e}")
+        exit(1)
+    shard_messages_total = metrics.counter("scorer_shard_messages_total", "Shared-subscription messages handled locally or forwarded, and events handed over.", ("route",))
+    metrics.gauge("scorer_shards", "Scorer shards currently online, including this one.", fn=lambda: len(shard_router.members))
+
+def route_to_owner(kind, callback):
+    """Wraps a message callback so messages for events owned by another shard are forwarded to it instead."""
+    def on_message(client, userdata, msg):
+        if shard_router.route(kind, extract_partition_key(msg), msg.payload, mqtt_client.publish):
+            shard_messages_total.labels("local").inc()
+            callback(client, userdata, msg)
+        else:
+            shard_messages_total.labels("forwarded").inc()
+    return on_message
+
+def on_shard_status(client, userdata, msg):
+    if shard_router.handle_status(msg.topic, msg.payload):
+        hand_over_events()
+
+def hand_over_events():
+    """After a membership change, moves the tracks and pending inquiries of events now owned by another shard to it.
+
+    Audio results are routed to the new owner from now on, so a pending inquiry left here would be lost.
+    """
+    moved = 0
+    for event_id in dict.fromkeys(tracks.event_ids() + pending_events.event_ids()):
+        owner = shard_router.owner(event_id)
+        if owner == SCORER_SHARD_ID:
+            continue
+        track, entry = tracks.pop(event_id), pending_events.pop(event_id)
+        state = {"id": event_id}
+        if track:
+            state["track"] = {"score": track.score, "alarmed": track.alarmed, "inquired": track.inquired}
+        if entry:
+            state["pending"] = {key: value for key, value in entry.items() if key != "deadline"} # deadline is our monotonic clock
+        mqtt_client.publish(shard_router.inbox_topic("handover", owner), json.dumps(state, default=str), qos=1)
+        moved += 1
+    if moved:
+        shard_messages_total.labels("handed_over").inc(moved)
+        logging.info(f"Handed {moved} event(s) over to their new shard owners.")
+
+def on_shard_handover(client, userdata, msg):
+    """Takes over the track and pending inquiry of an event from its previous shard owner."""
+    try:
+        state = json.loads(msg.payload)
+        event_id = state["id"]
+        if "track" in state:
+            track = tracks.touch(event_id)
+            track.score = state["track"]["score"]
+            track.alarmed = track.alarmed or state["track"]["alarmed"]
+            track.inquired = track.inquired or state["track"]["inquired"]
+        if "pending" in state:
+            pending = dict(state["pending"])
+            remaining = pending.pop("expires_at", time.time()) - time.time()
+            pending_events.add(event_id, pending.pop("score"), pending.pop("initial_data", {}),
+                               timeout_seconds=max(0.0, remaining), **pending)
+        logging.info(f"Took over event {event_id} from another shard.")
+    except (ValueError, KeyError, TypeError) as e:
+        logging.error(f"Invalid shard handover message on {msg.topic}: {e}")
+
+def register_callbacks(client, frigate_callback, audio_callback):
+    """Adds the topic callbacks (and, when sharded, the routing, inbox and membership ones) to an MQTT client."""
+    if shard_router:
+        client.will_set(shard_router.status_topic(), "offline", qos=1, retain=True)
+        client.message_callback_add(MQTT_FRIGATE_TOPIC, route_to_owner("frigate", frigate_callback))
+        client.message_callback_add(MQTT_AUDIO_TOPIC, route_to_owner("audio", audio_callback))
+        # Forwarded messages are already on their owner and are handled as they are
+        client.message_callback_add(shard_router.inbox_topic("frigate"), frigate_callback)
+        client.message_callback_add(shard_router.inbox_topic("audio"), audio_callback)
+        client.message_callback_add(shard_router.inbox_topic("handover"), on_shard_handover)
+        client.message_callback_add(shard_router.status_filter(), on_shard_status)
+    else:
+        client.message_callback_add(MQTT_FRIGATE_TOPIC, frigate_callback)
+        client.message_callback_add(MQTT_AUDIO_TOPIC, audio_callback)
+
+def set_clock(clock):
+    """Replaces the monotonic clock of every time-based store (pending inquiries, tracks, incidents, alert windows).
+
+    Lets scorer_instance.py drive timeouts deterministically with a simulated clock. Call before any event is handled.
+    """
+    pending_events.clock = clock
+    tracks.clock = clock
+    if incidents is not None:
+        incidents.clock = clock
+    if enricher is not None:
+        enricher.clock = clock
+    alert_coalescer.set_clock(clock)
+
+def restore_pending_state():
+    """Reloads pending inquiries and recent alarms from the journal, so a restart doesn't drop or repeat them."""
+    global pending_journal
+    started = time.perf_counter()
+    try:
+        restored = pending_events.restore()
+    except OSError as e:
+        logging.error(f"Could not restore pending inquiries from {PENDING_JOURNAL_PATH}: {e}. Continuing without a journal.")
+        pending_events.journal = pending_journal = None
+        return
+    # Tracks aren't journaled; recreate enough of them that later updates don't repeat a decision
+    for event_id in pending_events.event_ids():
+        tracks.touch(event_id).inquired = True
+    for event_id, decision in pending_journal.decisions.items():
+        if decision.get("kind") == "alarm":
+            tracks.touch(event_id).alarmed = True
+    pending_journal.start()
+    logging.info(f"Restored {restored} pending inquiry(ies) and {len(pending_journal.decisions)} recent decision(s) "
+                 f"from {PENDING_JOURNAL_PATH} in {(time.perf_counter() - started) * 1000:.1f} ms.")
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    # Offline tools: `scorer.py bench ...` replays a capture, `scorer.py record ...` captures one
+    if len(sys.argv) > 1 and sys.argv[1] in ("bench", "record"):
+        import scorer_bench
+        sys.exit(scorer_bench.main(sys.modules[__name__], sys.argv[1:]))
+    # `scorer.py simulate ...` pushes synthetic events through an in-process instance on a simulated clock
+    if len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        import scorer_instance
+        sys.exit(scorer_instance.main(sys.argv[2:]))
+    # `scorer.py latency ...` reports percentiles of the latency breakdowns in alerts
+    if len(sys.argv) > 1 and sys.argv[1] == "latency":
+        import scorer_latency
+        sys.exit(scorer_latency.main(sys.modules[__name__], sys.argv[2:]))
+    # `scorer.py enrich ...` runs the CPAI enrichment on one snapshot
+    if len(sys.argv) > 1 and sys.argv[1] == "enrich":
+        import scorer_enrich
+        sys.exit(scorer_enrich.main(sys.modules[__name__], sys.argv[2:]))
+
     logging.info("Starting Scorer Service...")
 
     mqtt_client.on_connect = on_connect
     mqtt_client.on_disconnect = on_disconnect
+
+    if EVENT_TIMEOUT_ACTION not in ("drop", "publish", "score_as_silence"):
+        logging.error(f"Unknown EVENT_TIMEOUT_ACTION '{EVENT_TIMEOUT_ACTION}'. Expected 'drop', 'publish' or 'score_as_silence'.")
+        exit(1)
+    signal.signal(signal.SIGHUP, on_sighup)
+
+    if pending_journal:
+        restore_pending_state()
+
+    if ALERT_PAYLOAD not in ("compact", "full"):
+        logging.error(f"Unknown ALERT_PAYLOAD '{ALERT_PAYLOAD}'. Expected 'compact' or 'full'.")
+        exit(1)
+    if set(ALERT_COALESCE_KEY) - {"camera", "zone", "label", "event", "incident"}:
+        logging.error(f"Invalid ALERT_COALESCE_KEY {ALERT_COALESCE_KEY}. Expected fields among camera, zone, label, event, incident.")
+        exit(1)
+    if MQTT_PROTOCOL not in ("3.1.1", "5"):
+        logging.error(f"Unknown MQTT_PROTOCOL '{MQTT_PROTOCOL}'. Expected '3.1.1' or '5'.")
+        exit(1)
+    if ALARM_RELAY_MODE not in ("gpio", "mqtt") or ALARM_PATTERN and (len(ALARM_PATTERN) != 2 or min(ALARM_PATTERN) <= 0):
+        logging.error(f"Invalid ALARM_RELAY_MODE '{ALARM_RELAY_MODE}' or ALARM_PATTERN {ALARM_PATTERN}. Expected 'gpio' or 'mqtt' and 'on_ms,off_ms'.")
+        exit(1)
+
+    # Expire pending inquiries on a fixed tick, independent of incoming traffic
+    pending_events.start(PENDING_EXPIRY_TICK_SECONDS)
+    alert_coalescer.start(min(1.0, ALERT_COALESCE_WINDOW_SECONDS / 4) if ALERT_COALESCE_WINDOW_SECONDS > 0 else 1.0)
+
+    worker_pipeline = None
+    if SCORER_WORKER_MODE == "pipeline":
+        try:
+            worker_pipeline = WorkerPipeline(worker_count=SCORER_WORKER_COUNT,
+                                             queue_maxsize=SCORER_QUEUE_MAXSIZE,
+                                             drop_policy=SCORER_QUEUE_DROP_POLICY,
+                                             block_timeout=SCORER_QUEUE_BLOCK_TIMEOUT,
+                                             metrics_interval=SCORER_QUEUE_METRICS_INTERVAL)
+        except ValueError as e:
+            logging.error(f"Invalid worker pipeline configuration: {e}")
+            exit(1)
+        worker_pipeline.start()
+        frigate_callback = worker_pipeline.wrap(handle_seconds.labels("frigate").wrap(on_frigate_event))
+        audio_callback = worker_pipeline.wrap(handle_seconds.labels("audio").wrap(on_audio_result))
+        metrics.gauge("scorer_queue_depth", "Messages queued for the worker pipeline.",
+                      fn=lambda: sum(worker_pipeline.stats()["queue_depths"]))
+    elif SCORER_WORKER_MODE == "inline":
+        frigate_callback = handle_seconds.labels("frigate").wrap(on_frigate_event)
+        audio_callback = handle_seconds.labels("audio").wrap(on_audio_result)
+        if enricher is not None:
+            logging.warning("Enrichment makes HTTP calls while handling Frigate events; use SCORER_WORKER_MODE=pipeline "
+                            "so they don't hold up the MQTT network thread.")
+    else:
+        logging.error(f"Unknown SCORER_WORKER_MODE '{SCORER_WORKER_MODE}'. Expected 'inline' or 'pipeline'.")
+        exit(1)
+
     # Using message_callback_add for topic-specific callbacks
-    mqtt_client.message_callback_add(MQTT_FRIGATE_TOPIC, on_frigate_event)
-    mqtt_client.message_callback_add(MQTT_AUDIO_TOPIC, on_audio_result)
+    register_callbacks(mqtt_client, frigate_callback, audio_callback)
+
+    try:
+        metrics.start_http_server(METRICS_HTTP_PORT, METRICS_HTTP_HOST)
+    except OSError as e:
+        logging.error(f"Could not start metrics endpoint on port {METRICS_HTTP_PORT}: {e}")
+    if METRICS_MQTT_TOPIC:
+        metrics.start_publisher(lambda snapshot: mqtt_client.publish(METRICS_MQTT_TOPIC, snapshot), METRICS_MQTT_INTERVAL)
 
     try:
         mqtt_client.connect(MQTT_HOST, MQTT_PORT, 60)
@@ -291,6 +915,17 @@ if __name__ == "__main__":
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
     finally:
+        if worker_pipeline:
+            worker_pipeline.stop()
+        pending_events.stop()
+        alert_coalescer.stop() # Publishes any alerts still being coalesced
+        if pending_journal:
+            pending_journal.stop()
+        metrics.stop()
+        if enricher is not None:
+            enricher.close()
+        if alarm_off_timer:
+            alarm_off_timer.cancel()
         if USE_GPIO:
             GPIO.cleanup() # Clean up GPIO resources on exit
         logging.info("Scorer service stopped.")
@@ -0,0 +1,228 @@
+# scorer_alerts.py
+# Alert coalescing and rate limiting for scorer.py's trigger_alarm.
+# One intruder seen by several cameras, or a track that keeps crossing the threshold, would
+# otherwise publish a burst of near-identical alerts to vz/alert. Alarms are grouped by a key
+# (built from camera, zone, label and/or event ID): the first alarm for a key is published at
+# once, and further alarms for the same key within window_seconds are merged into a single
+# "coalesced" alert (highest score, the alarms merged, how many were suppressed) published when
+# the window closes. A token bucket caps the total alert rate; alarms that find it empty are held
+# in their key's window instead of being published immediately.
+# Only the MQTT alert is coalesced; the scorer still drives the GPIO pin for every alarm.
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+class TokenBucket:
+    """Classic token bucket. A rate of 0 disables limiting."""
+
+    def __init__(self, rate_per_second, burst, clock=time.monotonic):
+        self.rate = rate_per_second
+        self.capacity = max(1.0, float(burst))
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def take(self):
+        """Takes a token if one is available. Not thread-safe; callers hold their own lock."""
+        if self.rate <= 0:
+            return True
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+class _Window:
+    __slots__ = ("key", "deadline", "alarms", "merged", "max_score", "first")
+
+    def __init__(self, key, deadline):
+        self.key = key
+        self.deadline = deadline
+        self.alarms = []     # Compact alarm summaries merged into this window (capped)
+        self.merged = 0      # Alarms merged, including those beyond the cap
+        self.max_score = None
+        self.first = None    # The held alert when the window opened without publishing
+
+class AlertCoalescer:
+    """Merges correlated alarms per key within a time window and rate-limits published alerts.
+
+    publish_fn(alert) is called with alert dicts, always outside the internal lock. With
+    window_seconds 0 and rate_per_minute 0 every alarm is published unchanged.
+    """
+
+    def __init__(self, publish_fn, window_seconds=0.0, rate_per_minute=0.0, burst=5, max_keys=1000,
+                 max_listed=50, clock=time.monotonic):
+        self.publish_fn = publish_fn
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.max_listed = max_listed # Alarms listed individually in a coalesced alert
+        self.clock = clock
+        self._bucket = TokenBucket(rate_per_minute / 60.0, burst, clock)
+        self._windows = OrderedDict() # key -> _Window, in opening order
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.published_count = 0
+        self.coalesced_count = 0 # Coalesced alerts published
+        self.suppressed_count = 0 # Alarms not published on their own
+        self.dropped_count = 0 # Alarms lost because max_keys windows were full and the rate limit was reached
+
+    def submit(self, key, alert):
+        """Offers an alert for key. Returns True if it was published immediately."""
+        flushed = []
+        with self._lock:
+            now = self.clock()
+            window = self._windows.get(key)
+            if window is not None and window.deadline > now:
+                self._merge_locked(window, alert)
+                self.suppressed_count += 1
+                return False
+            if window is not None:
+                # Expired but not yet flushed by the tick: it needs a token like any other alert
+                if window.merged and not self._bucket.take():
+                    window.deadline = now + max(self.window_seconds, 1.0) # Rate limited: keep collecting
+                    self._merge_locked(window, alert)
+                    self.suppressed_count += 1
+                    return False
+                flushed.append(self._windows.pop(key))
+            publish = self._bucket.take()
+            if self.window_seconds > 0 or not publish:
+                window = _Window(key, now + max(self.window_seconds, 1.0))
+                if not publish:
+                    window.first = alert
+                    self._merge_locked(window, alert)
+                    self.suppressed_count += 1
+                self._windows[key] = window
+                flushed.extend(self._evict_overflow_locked())
+        for old in flushed:
+            self._publish_window(old)
+        if publish:
+            self._publish(alert)
+        return publish
+
+    def flush_due(self, flush_all=False):
+        """Publishes coalesced alerts for windows that have closed (or all of them)."""
+        due = []
+        with self._lock:
+            now = self.clock()
+            for key, window in list(self._windows.items()):
+                if flush_all or window.deadline <= now:
+                    due.append(self._windows.pop(key))
+        for window in due:
+            if not flush_all and window.merged and not self._take_token():
+                # Rate limited: keep collecting for another window rather than exceed the rate
+                with self._lock:
+                    window.deadline = self.clock() + max(self.window_seconds, 1.0)
+                    current = self._windows.get(window.key)
+                    if current is None:
+                        self._windows[window.key] = window
+                    else:
+                        self._absorb_locked(current, window) # submit() opened a new window meanwhile
+                continue
+            self._publish_window(window)
+
+    def start(self, tick_seconds=1.0):
+        """Starts the background thread that publishes coalesced alerts as windows close."""
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._tick_loop, args=(tick_seconds,), name="scorer-alert-coalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the tick and publishes whatever is still being coalesced."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.flush_due(flush_all=True)
+
+    def set_clock(self, clock):
+        """Replaces the clock of the windows and the rate limit (e.g. with a simulated one)."""
+        with self._lock:
+            self.clock = self._bucket.clock = clock
+            self._bucket._updated = clock()
+
+    def stats(self):
+        return {
+            "published": self.published_count,
+            "coalesced": self.coalesced_count,
+            "suppressed": self.suppressed_count,
+            "dropped": self.dropped_count,
+            "open_windows": len(self._windows),
+        }
+
+    def _take_token(self):
+        with self._lock:
+            return self._bucket.take()
+
+    def _evict_overflow_locked(self):
+        """Closes windows beyond max_keys. Returns those to publish; each has already taken a token."""
+        flushed = []
+        while len(self._windows) > self.max_keys:
+            # Windows with nothing merged have nothing to publish; close those first
+            key = next((key for key, window in self._windows.items() if not window.merged), None)
+            if key is not None:
+                del self._windows[key]
+                continue
+            _, oldest = self._windows.popitem(last=False)
+            if self._bucket.take():
+                flushed.append(oldest)
+            else:
+                self.dropped_count += oldest.merged
+                logging.warning(f"Too many alert windows ({self.max_keys}) and alert rate limit reached. "
+                                f"Dropped {oldest.merged} coalesced alarm(s) for {oldest.key}.")
+        return flushed
+
+    def _absorb_locked(self, window, older):
+        """Merges the alarms of an older window for the same key into window."""
+        window.merged += older.merged
+        if older.max_score is not None and (window.max_score is None or older.max_score > window.max_score):
+            window.max_score = older.max_score
+        window.alarms = (older.alarms + window.alarms)[:self.max_listed]
+        window.first = None # More than one alarm now: published as a coalesced alert
+
+    def _merge_locked(self, window, alert):
+        window.merged += 1
+        score = alert.get("final_score")
+        if isinstance(score, (int, float)) and (window.max_score is None or score > window.max_score):
+            window.max_score = score
+        if len(window.alarms) < self.max_listed:
+            window.alarms.append({"event_id": alert.get("event_id"), "score": score, "camera": alert.get("camera")})
+
+    def _publish_window(self, window):
+        if not window.merged:
+            return
+        if window.first is not None and window.merged == 1:
+            self._publish(window.first) # Held by the rate limit and nothing else arrived: publish it as is
+            return
+        alert = {
+            "type": "coalesced",
+            "key": window.key,
+            "event_id": window.alarms[0]["event_id"],
+            "final_score": window.max_score,
+            "reason": "Threat score exceeded threshold (coalesced).",
+            "timestamp": time.time(),
+            "alarms": window.alarms,
+            "suppressed": window.merged,
+        }
+        self.coalesced_count += 1
+        self._publish(alert)
+
+    def _publish(self, alert):
+        self.published_count += 1
+        try:
+            self.publish_fn(alert)
+        except Exception as e:
+            logging.error(f"Error publishing alert for event {alert.get('event_id')}: {e}")
+
+    def _tick_loop(self, tick_seconds):
+        while not self._stop_event.wait(tick_seconds):
+            try:
+                self.flush_due()
+            except Exception as e:
+                logging.error(f"Error flushing coalesced alerts: {e}")
@@ -0,0 +1,292 @@
+# scorer_bench.py
+# Replay and benchmark harness for scorer.py.
+# Replays a JSONL capture of frigate/events/# and vz/audio/# messages through the scorer's own
+# on_frigate_event / on_audio_result callbacks with an in-process fake MQTT client, and reports
+# throughput, decision latency, pending state growth and differences against a golden file.
+#
+# Usage (run through scorer.py so the same configuration and module state are used):
+#   python scorer.py record --output capture.jsonl [--duration 600]
+#   python scorer.py bench --capture capture.jsonl [--speed 0|1|N] [--workers N]
+#                          [--golden golden.jsonl] [--write-golden golden.jsonl]
+#
+# Capture format: one JSON object per line, {"ts": <unix time>, "topic": "...", "payload": <object or string>}.
+# Decisions (golden) format: one JSON object per line, {"kind": "alert|inquiry|timeout", "event_id": "...", "score": 0.8}.
+
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+import logging
+
+class FakeMessage:
+    """Minimal stand-in for paho's MQTTMessage."""
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+class FakeMQTTClient:
+    """In-process MQTT client stand-in that records everything the scorer publishes."""
+
+    def __init__(self):
+        self.published = [] # (perf_counter, topic, payload)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self._lock:
+            self.published.append((time.perf_counter(), topic, payload))
+        self._local.count = getattr(self._local, "count", 0) + 1
+
+    def thread_publish_count(self):
+        """Number of publishes made so far from the calling thread."""
+        return getattr(self._local, "count", 0)
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+def load_capture(path):
+    """Reads a JSONL capture into a list of (ts, topic, payload_bytes)."""
+    messages = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                payload = record["payload"]
+                if not isinstance(payload, str):
+                    payload = json.dumps(payload)
+                messages.append((float(record.get("ts", 0.0)), record["topic"], payload.encode()))
+            except (ValueError, KeyError) as e:
+                logging.error(f"Skipping malformed capture line {line_number}: {e}")
+    return messages
+
+def _topic_matches(topic, pattern):
+    """MQTT wildcard match ('+' and '#')."""
+    topic_parts = topic.split("/")
+    pattern_parts = pattern.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(topic_parts) == len(pattern_parts)
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def extract_decisions(scorer, published):
+    """Turns recorded publishes into comparable decision records."""
+    decisions = []
+    for _, topic, payload in published:
+        try:
+            data = json.loads(payload)
+        except (TypeError, ValueError):
+            continue
+        if topic == scorer.MQTT_ALERT_TOPIC and data.get("type") == "coalesced":
+            # One record per alarm merged into the alert (up to the coalescer's listing cap)
+            for alarm in data.get("alarms", []):
+                decisions.append({"kind": "alert", "event_id": alarm.get("event_id"), "score": alarm.get("score")})
+        elif topic == scorer.MQTT_ALERT_TOPIC:
+            decisions.append({"kind": "alert", "event_id": data.get("event_id"), "score": data.get("final_score")})
+        elif topic.startswith(scorer.MQTT_INQUIRY_TRIGGER_TOPIC_BASE + "/"):
+            decisions.append({"kind": "inquiry", "event_id": data.get("event_id"), "score": data.get("current_score")})
+        elif topic == scorer.MQTT_TIMEOUT_TOPIC:
+            decisions.append({"kind": "timeout", "event_id": data.get("event_id"), "score": data.get("score")})
+    return decisions
+
+def diff_decisions(expected, actual):
+    """Compares decision lists keyed by (kind, event_id). Returns a list of human-readable differences."""
+    expected_map = {(d["kind"], d["event_id"]): d.get("score") for d in expected}
+    actual_map = {(d["kind"], d["event_id"]): d.get("score") for d in actual}
+    differences = []
+    for key in sorted(expected_map.keys() - actual_map.keys(), key=str):
+        differences.append(f"missing {key[0]} for event {key[1]} (expected score {expected_map[key]})")
+    for key in sorted(actual_map.keys() - expected_map.keys(), key=str):
+        differences.append(f"unexpected {key[0]} for event {key[1]} (score {actual_map[key]})")
+    for key in sorted(expected_map.keys() & actual_map.keys(), key=str):
+        if expected_map[key] != actual_map[key]:
+            differences.append(f"{key[0]} for event {key[1]}: score {actual_map[key]}, expected {expected_map[key]}")
+    return differences
+
+def run_bench(scorer, messages, speed=0.0, workers=0):
+    """Replays messages through the scorer callbacks. speed: 0 = max, 1 = recorded pace, N = N times faster."""
+    fake_client = FakeMQTTClient()
+    scorer.mqtt_client = fake_client
+    scorer.USE_GPIO = False # Never drive real hardware from a replay
+
+    routes = ((scorer.MQTT_FRIGATE_TOPIC, scorer.on_frigate_event), (scorer.MQTT_AUDIO_TOPIC, scorer.on_audio_result))
+    latencies = []
+    decision_latencies = []
+    latency_lock = threading.Lock()
+    pending_peak = 0
+
+    def timed(handler, enqueued_at):
+        def run(client, userdata, msg):
+            publishes_before = fake_client.thread_publish_count()
+            handler(client, userdata, msg)
+            latency = time.perf_counter() - enqueued_at
+            with latency_lock:
+                latencies.append(latency)
+                if fake_client.thread_publish_count() != publishes_before:
+                    decision_latencies.append(latency)
+        return run
+
+    pipeline = None
+    if workers > 0:
+        from scorer_pipeline import WorkerPipeline, DROP_POLICY_BLOCK
+        pipeline = WorkerPipeline(worker_count=workers, queue_maxsize=scorer.SCORER_QUEUE_MAXSIZE,
+                                  drop_policy=DROP_POLICY_BLOCK, block_timeout=60.0, metrics_interval=0)
+        pipeline.start()
+
+    rss_start_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pending_start = len(scorer.pending_events)
+    first_ts = messages[0][0] if messages else 0.0
+    replay_start = time.perf_counter()
+    skipped = 0
+
+    for ts, topic, payload in messages:
+        if speed > 0:
+            target = replay_start + (ts - first_ts) / speed
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        handler = next((h for pattern, h in routes if _topic_matches(topic, pattern)), None)
+        if handler is None:
+            skipped += 1
+            continue
+        msg = FakeMessage(topic, payload)
+        callback = timed(handler, time.perf_counter())
+        if pipeline:
+            pipeline.submit(callback, fake_client, None, msg)
+        else:
+            callback(fake_client, None, msg)
+            pending_peak = max(pending_peak, len(scorer.pending_events))
+
+    if pipeline:
+        pipeline.wait_idle()
+        pipeline.stop()
+    scorer.alert_coalescer.flush_due(flush_all=True) # Alerts still being coalesced count as decisions
+    elapsed = time.perf_counter() - replay_start
+
+    latencies.sort()
+    decision_latencies.sort()
+    processed = len(latencies)
+    return {
+        "messages": processed,
+        "skipped_topics": skipped,
+        "elapsed_seconds": round(elapsed, 4),
+        "events_per_second": round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "decisions": len(decision_latencies),
+        "decision_latency_p50_ms": round(_percentile(decision_latencies, 0.50) * 1000, 3),
+        "decision_latency_p99_ms": round(_percentile(decision_latencies, 0.99) * 1000, 3),
+        "pending_events_start": pending_start,
+        "pending_events_peak": max(pending_peak, len(scorer.pending_events)),
+        "pending_events_end": len(scorer.pending_events),
+        "tracks_end": len(scorer.tracks),
+        "max_rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start_kb,
+    }, fake_client.published
+
+def run_record(scorer, output_path, duration):
+    """Captures live frigate and audio messages from the broker into a JSONL file for later replay."""
+    import paho.mqtt.client as mqtt
+
+    output = open(output_path, "a")
+    count = [0]
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(scorer.MQTT_FRIGATE_TOPIC)
+            client.subscribe(scorer.MQTT_AUDIO_TOPIC)
+            logging.info(f"Recording {scorer.MQTT_FRIGATE_TOPIC} and {scorer.MQTT_AUDIO_TOPIC} to {output_path}...")
+        else:
+            logging.error(f"Failed to connect to MQTT broker, return code: {rc}")
+
+    def on_message(client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload.decode())
+        except (UnicodeDecodeError, ValueError):
+            payload = msg.payload.decode(errors="replace")
+        output.write(json.dumps({"ts": time.time(), "topic": msg.topic, "payload": payload}) + "\n")
+        count[0] += 1
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    try:
+        client.connect(scorer.MQTT_HOST, scorer.MQTT_PORT, 60)
+        client.loop_start()
+        if duration > 0:
+            time.sleep(duration)
+        else:
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        output.close()
+        logging.info(f"Recorded {count[0]} message(s) to {output_path}.")
+    return 0
+
+def main(scorer, argv):
+    """Entry point for `scorer.py bench` and `scorer.py record`. Returns a process exit code."""
+    parser = argparse.ArgumentParser(prog="scorer.py", description="Scorer replay benchmark and capture tool.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bench = subparsers.add_parser("bench", help="Replay a JSONL capture through the scorer callbacks.")
+    bench.add_argument("--capture", required=True, help="JSONL capture of frigate/events/# and vz/audio/# messages.")
+    bench.add_argument("--speed", type=float, default=0.0,
+                       help="0 = as fast as possible (default), 1 = recorded pace, N = N times faster.")
+    bench.add_argument("--workers", type=int, default=0,
+                       help="Replay through the worker pipeline with N workers (0 = inline, default).")
+    bench.add_argument("--golden", help="Golden decisions file to compare alarm/inquiry decisions against.")
+    bench.add_argument("--write-golden", help="Write this run's decisions to the given file.")
+    bench.add_argument("--log-level", default="ERROR", help="Scorer log level during the replay. Default: ERROR")
+
+    record = subparsers.add_parser("record", help="Capture live MQTT messages into a JSONL file.")
+    record.add_argument("--output", required=True, help="JSONL file to append captured messages to.")
+    record.add_argument("--duration", type=float, default=0.0, help="Seconds to record (0 = until interrupted).")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        return run_record(scorer, args.output, args.duration)
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    messages = load_capture(args.capture)
+    if not messages:
+        print(f"No messages found in {args.capture}.", file=sys.stderr)
+        return 1
+
+    report, published = run_bench(scorer, messages, speed=args.speed, workers=args.workers)
+    decisions = extract_decisions(scorer, published)
+    print(json.dumps(report, indent=2))
+
+    if args.write_golden:
+        with open(args.write_golden, "w") as f:
+            for decision in decisions:
+                f.write(json.dumps(decision) + "\n")
+        print(f"Wrote {len(decisions)} decision(s) to {args.write_golden}.")
+
+    if args.golden:
+        with open(args.golden, "r") as f:
+            expected = [json.loads(line) for line in f if line.strip()]
+        differences = diff_decisions(expected, decisions)
+        if differences:
+            print(f"{len(differences)} decision difference(s) against {args.golden}:")
+            for difference in differences:
+                print(f"  {difference}")
+            return 1
+        print(f"Decisions match {args.golden} ({len(decisions)} decision(s)).")
+    return 0
@@ -0,0 +1,213 @@
+# scorer_broker.py
+# In-memory MQTT broker stand-in for running scorer instances (scorer_instance.py) without Mosquitto.
+# LocalClient implements the part of paho's Client API the scorer uses (connect, subscribe,
+# publish, message_callback_add, on_connect/on_message), so scorer.py's callbacks run unchanged.
+#
+# Delivery is deterministic: publish() only queues the message, and run_until_idle() delivers
+# queued messages one at a time, in publish order, on the calling thread, including anything the
+# subscribers publish while handling them. Topic filters support the '+' and '#' wildcards and
+# shared subscriptions ($share/<group>/<filter>: each message goes to one member of the group, in
+# turn); retained messages are delivered to new subscriptions, and a client's will is published
+# when it crash()es.
+
+import threading
+import itertools
+from collections import deque
+
+class LocalMessage:
+    """Minimal stand-in for paho's MQTTMessage."""
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+class PublishInfo:
+    """Stand-in for paho's MQTTMessageInfo; local publishes always succeed."""
+    __slots__ = ("rc", "mid")
+
+    def __init__(self, mid):
+        self.rc = 0
+        self.mid = mid
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+    def is_published(self):
+        return True
+
+def topic_matches(topic, topic_filter):
+    """MQTT wildcard match ('+' and '#')."""
+    topic_parts = topic.split("/")
+    filter_parts = topic_filter.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(topic_parts) == len(filter_parts)
+
+class LocalBroker:
+    """Routes messages between LocalClients in one process. Keeps a log of every publish if record is set."""
+
+    def __init__(self, record=True):
+        self.record = record
+        self.published = [] # (topic, payload bytes) in publish order, when recording
+        self._subscriptions = [] # (client, topic_filter as subscribed, filter to match, share group or None)
+        self._share_turns = {}   # (group, filter) -> deliveries so far, for round-robin
+        self._retained = {}      # topic -> LocalMessage
+        self._queue = deque()
+        self._mids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.delivered_count = 0
+
+    def client(self, client_id=""):
+        """Creates a LocalClient attached to this broker."""
+        return LocalClient(self, client_id)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """Queues a message for delivery (also used by LocalClient.publish). Returns its mid."""
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode()
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode()
+        with self._lock:
+            message = LocalMessage(topic, payload, qos, retain, next(self._mids))
+            if retain:
+                if payload:
+                    self._retained[topic] = message
+                else:
+                    self._retained.pop(topic, None) # An empty retained message clears the topic
+            if self.record:
+                self.published.append((topic, payload))
+            self._queue.append(message)
+            return message.mid
+
+    def pending(self):
+        """Number of messages queued for delivery."""
+        return len(self._queue)
+
+    def run_until_idle(self, max_messages=None):
+        """Delivers queued messages (and those published meanwhile) until the queue is empty. Returns the count."""
+        delivered = 0
+        while max_messages is None or delivered < max_messages:
+            with self._lock:
+                if not self._queue:
+                    break
+                message = self._queue.popleft()
+                targets, groups = [], {}
+                for client, _, topic_filter, group in self._subscriptions:
+                    if topic_matches(message.topic, topic_filter):
+                        if group is None:
+                            targets.append(client)
+                        else:
+                            groups.setdefault((group, topic_filter), []).append(client)
+                for key, members in groups.items():
+                    turn = self._share_turns.get(key, 0)
+                    self._share_turns[key] = turn + 1
+                    targets.append(members[turn % len(members)])
+            # A message reaches each subscribed client once, however many of its filters match (like Mosquitto)
+            for client in dict.fromkeys(targets):
+                client._deliver(message)
+            delivered += 1
+        self.delivered_count += delivered
+        return delivered
+
+    def _subscribe(self, client, topic_filter):
+        group, match_filter = None, topic_filter
+        if topic_filter.startswith("$share/"):
+            _, group, match_filter = topic_filter.split("/", 2)
+        with self._lock:
+            if not any(c is client and f == topic_filter for c, f, _, _ in self._subscriptions):
+                self._subscriptions.append((client, topic_filter, match_filter, group))
+            if group is not None:
+                return # Retained messages are not sent to shared subscriptions
+            retained = [message for topic, message in self._retained.items() if topic_matches(topic, match_filter)]
+        for message in retained:
+            client._deliver(LocalMessage(message.topic, message.payload, message.qos, True, message.mid))
+
+    def _unsubscribe(self, client, topic_filter=None):
+        with self._lock:
+            self._subscriptions = [subscription for subscription in self._subscriptions
+                                   if subscription[0] is not client or (topic_filter is not None and subscription[1] != topic_filter)]
+
+class LocalClient:
+    """paho.mqtt.client.Client stand-in connected to a LocalBroker."""
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.userdata = None
+        self.connected = False
+        self._will = None    # (topic, payload, qos, retain), published by crash()
+        self._callbacks = [] # (topic_filter, callback), as added by message_callback_add
+
+    def connect(self, host=None, port=None, keepalive=60):
+        """Connects immediately and calls on_connect (rc 0) on the calling thread."""
+        self.connected = True
+        if self.on_connect:
+            self.on_connect(self, self.userdata, {"session present": 0}, 0)
+        return 0
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self._will = (topic, payload, qos, retain)
+
+    def crash(self):
+        """Drops the connection without a clean disconnect: the will is published and no callback is called."""
+        self.broker._unsubscribe(self)
+        self.connected = False
+        if self._will:
+            self.broker.publish(*self._will)
+
+    def disconnect(self):
+        self.broker._unsubscribe(self)
+        self.connected = False
+        if self.on_disconnect:
+            self.on_disconnect(self, self.userdata, 0)
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        self.broker._subscribe(self, topic)
+        return (0, 0)
+
+    def unsubscribe(self, topic):
+        self.broker._unsubscribe(self, topic)
+        return (0, 0)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return PublishInfo(self.broker.publish(topic, payload, qos, retain))
+
+    def message_callback_add(self, sub, callback):
+        self.message_callback_remove(sub)
+        self._callbacks.append((sub, callback))
+
+    def message_callback_remove(self, sub):
+        self._callbacks = [(f, c) for f, c in self._callbacks if f != sub]
+
+    # Network loop methods are no-ops: the broker delivers from run_until_idle()
+    def loop_start(self):
+        pass
+
+    def loop_stop(self, force=False):
+        pass
+
+    def loop(self, timeout=1.0):
+        return 0
+
+    def _deliver(self, message):
+        # Like paho: every matching message_callback_add callback, or on_message if none matched
+        matched = False
+        for topic_filter, callback in list(self._callbacks):
+            if topic_matches(message.topic, topic_filter):
+                matched = True
+                callback(self, self.userdata, message)
+        if not matched and self.on_message:
+            self.on_message(self, self.userdata, message)
@@ -0,0 +1,122 @@
+# scorer_decode.py
+# Fast, lazy decoding of Frigate event payloads for scorer.py.
+# Frigate payloads carry large before/after blocks (boxes, regions, path data, snapshot metadata)
+# of which the scorer reads only a handful of fields. This module:
+#   * peeks at the raw bytes for the event "type" so discarded events are never JSON-decoded,
+#   * decodes with msgspec (only the needed fields), orjson, or the stdlib json module, whichever
+#     is available/configured, and
+#   * returns a small __slots__ FrigateEvent instead of the full dict.
+
+import re
+import json
+import logging
+
+# Optional fast decoder backends
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ("auto", "msgspec", "orjson", "json")
+
+# Fields of the "after" block kept by default, in addition to any the scoring rules read
+DEFAULT_AFTER_FIELDS = ("id", "camera", "label", "sub_label", "score", "top_score", "current_zones",
+                        "entered_zones", "has_snapshot", "attributes", "extras",
+                        "frame_time") # Detection time, the origin of the event's latency trace
+
+_TYPE_PATTERN = re.compile(rb'"type"\s*:\s*"([^"]*)"')
+_SIGNIFICANT_CHANGE_PATTERN = re.compile(rb'"significant_change"\s*:\s*true')
+
+class FrigateEvent:
+    """The parts of a Frigate event message the scorer uses."""
+    __slots__ = ("id", "type", "after", "significant_change")
+
+    def __init__(self, event_id, event_type, after, significant_change):
+        self.id = event_id
+        self.type = event_type
+        self.after = after # Dict with only the selected "after" fields
+        self.significant_change = significant_change
+
+def peek_event_types(payload):
+    """Returns every "type" value in the raw payload without decoding it.
+
+    Only the top-level "type" is the event type, but nested blocks are not parsed here, so callers
+    should skip a message only if none of the returned values is one they handle.
+    """
+    return {match.decode() for match in _TYPE_PATTERN.findall(payload)}
+
+def peek_significant_change(payload):
+    """Returns True if the raw payload flags a significant change."""
+    return _SIGNIFICANT_CHANGE_PATTERN.search(payload) is not None
+
+class FrigateEventDecoder:
+    """Decodes Frigate event payloads into FrigateEvent objects with the configured backend."""
+
+    def __init__(self, backend="auto", after_fields=DEFAULT_AFTER_FIELDS):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown JSON backend '{backend}'. Expected one of {BACKENDS}.")
+        if backend == "auto":
+            backend = "msgspec" if msgspec else "orjson" if orjson else "json"
+        elif backend == "msgspec" and msgspec is None:
+            logging.warning("msgspec not installed. Falling back to the stdlib json decoder.")
+            backend = "json"
+        elif backend == "orjson" and orjson is None:
+            logging.warning("orjson not installed. Falling back to the stdlib json decoder.")
+            backend = "json"
+        self.backend = backend
+        self.after_fields = tuple(sorted(set(after_fields)))
+
+        if backend == "msgspec":
+            # Unlisted fields (box, region, path_data, the whole "before" block, ...) are skipped, not decoded
+            after_struct = msgspec.defstruct("FrigateAfter", [(name, object, msgspec.UNSET) for name in self.after_fields])
+            event_struct = msgspec.defstruct("FrigateEventMessage", [
+                ("id", object, None),
+                ("type", object, "unknown"),
+                ("significant_change", object, False),
+                ("after", after_struct, msgspec.field(default_factory=after_struct)),
+            ])
+            self._msgspec_decoder = msgspec.json.Decoder(event_struct)
+            self._generic_decoder = msgspec.json.Decoder()
+            self.decode = self._decode_msgspec
+        else:
+            self._loads = orjson.loads if backend == "orjson" else json.loads
+            self.decode = self._decode_dict
+
+    def loads(self, payload):
+        """Decodes any JSON payload into Python objects. Raises ValueError on invalid JSON."""
+        if self.backend == "msgspec":
+            try:
+                return self._generic_decoder.decode(payload)
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e))
+        return self._loads(payload)
+
+    def _decode_msgspec(self, payload):
+        try:
+            message = self._msgspec_decoder.decode(payload)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            raise ValueError(str(e))
+        after_struct = message.after
+        after = {}
+        for name in self.after_fields:
+            value = getattr(after_struct, name)
+            if value is not msgspec.UNSET:
+                after[name] = value
+        return FrigateEvent(message.id or after.get("id"), message.type, after, bool(message.significant_change))
+
+    def _decode_dict(self, payload):
+        data = self._loads(payload)
+        if not isinstance(data, dict):
+            raise ValueError("Frigate event payload is not a JSON object.")
+        full_after = data.get("after") or {}
+        after = {name: full_after[name] for name in self.after_fields if name in full_after}
+        return FrigateEvent(data.get("id") or after.get("id"), data.get("type", "unknown"), after,
+                            bool(data.get("significant_change", False)))
+
+def after_fields_for_rules(rules):
+    """Returns the "after" fields to decode: the defaults plus every top-level field the visual rules read."""
+    return set(DEFAULT_AFTER_FIELDS) | {path.split(".", 1)[0] for path in rules.visual_field_paths}
@@ -0,0 +1,424 @@
+# scorer_enrich.py
+# Attribute enrichment of Frigate events with CodeProject.AI (CPAI) for scorer.py.
+# The scoring rules read `attributes.weapon`, `attributes.clothing.*` and `attributes.pose`, which
+# Frigate itself does not produce. The Enricher fetches the event's snapshot from Frigate's API
+# (/api/events/<id>/snapshot.jpg), sends it to each enabled module of CPAI's modules.json and
+# merges the predictions into the event's attributes before it is scored.
+#
+# Frigate sends many updates per tracked object, so results are cached:
+#   * per event_id: the snapshot last analysed (its frame_time when Frigate reports one) and the
+#     attributes found. Updates with the same snapshot, or within refresh_seconds of the last
+#     fetch, reuse them without any HTTP call;
+#   * per snapshot digest (blake2b of the JPEG): the attributes, so a re-fetched snapshot that has
+#     not changed does not run the models again.
+# Both caches are LRUs bounded by cache_size and shared by every worker thread. HTTP connections to
+# Frigate and CPAI are kept alive in small per-host pools. Failures are logged and the event is
+# scored without (or with its previous) enrichment; they are retried after refresh_seconds. Events
+# are not enriched while Frigate reports has_snapshot false, and a 404 for a snapshot is cached for
+# the event until Frigate reports a different snapshot.
+#
+# Module entries (config/modules.json, // comments allowed) may set "route" (the CPAI API path) and
+# "attribute" ("weapon", "clothing" or "pose") when the defaults derived from the module name don't fit:
+#   {"module": "objectdetection.weapons.onnx", "enabled": true, "route": "/v1/vision/custom/weapons", "attribute": "weapon"}
+#
+# Usage (check the configuration against the running services):
+#   python scorer.py enrich --event-id <frigate event id> [--json]
+#   python scorer.py enrich --image snapshot.jpg [--json]
+
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import hashlib
+import argparse
+import threading
+import http.client
+import urllib.parse
+import logging
+from collections import OrderedDict
+
+ATTRIBUTES = ("weapon", "clothing", "pose")
+# Labels that count as a weapon for generic object detectors (COCO models know "knife" only)
+WEAPON_LABELS = frozenset(("weapon", "gun", "pistol", "handgun", "rifle", "knife"))
+GENERIC_DETECTORS = ("yolov5", "yolov8", "yolo", "ipcam-general")
+
+class EnrichmentError(Exception):
+    """Raised when the snapshot or a module result can't be obtained."""
+
+class SnapshotMissing(EnrichmentError):
+    """Raised when Frigate has no snapshot for the event (HTTP 404)."""
+
+# --- HTTP ---
+class HTTPConnectionPool:
+    """Keep-alive HTTP(S) connections to one server, shared by any number of threads."""
+
+    def __init__(self, base_url, size=4, timeout=2.0):
+        parsed = urllib.parse.urlsplit(base_url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"Invalid URL '{base_url}'. Expected http(s)://host[:port].")
+        self.base_url = base_url.rstrip("/")
+        self.base_path = parsed.path.rstrip("/")
+        self._connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size) # Most recently used first, so stale connections age out
+        self.created_count = 0
+
+    def request(self, method, path, body=None, headers=None):
+        """Sends one request and returns (status, body bytes). Raises EnrichmentError on connection errors."""
+        connection, reused = self._get()
+        try:
+            return self._send(connection, method, path, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            if not reused:
+                raise EnrichmentError(f"{method} {self.base_url}{path} failed: {e}")
+        # A kept-alive connection may have been closed by the server meanwhile; retry once on a new one
+        connection = self._new()
+        try:
+            return self._send(connection, method, path, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise EnrichmentError(f"{method} {self.base_url}{path} failed: {e}")
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _send(self, connection, method, path, body, headers):
+        connection.request(method, self.base_path + path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        data = response.read()
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self._idle.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        return response.status, data
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new(), False
+
+    def _new(self):
+        self.created_count += 1
+        return self._connection_class(self._host, self._port, timeout=self.timeout)
+
+def encode_multipart(fields, files):
+    """Builds a multipart/form-data body. files maps field name -> (filename, bytes, content type)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data, content_type) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+# --- Caching ---
+class LRUCache:
+    """Thread-safe mapping bounded to max_entries, least recently used first out."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted_count += 1
+
+    def pop(self, key):
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evicted": self.evicted_count}
+
+class SnapshotEntry:
+    """The last enrichment of one event."""
+    __slots__ = ("snapshot_key", "digest", "attributes", "checked_at", "complete", "missing")
+
+    def __init__(self, snapshot_key, digest, attributes, checked_at, complete, missing=False):
+        self.snapshot_key = snapshot_key # Frigate's snapshot frame_time, or None if it doesn't report one
+        self.digest = digest             # blake2b of the analysed JPEG
+        self.attributes = attributes     # Attributes found (may be empty)
+        self.checked_at = checked_at     # When the snapshot was last fetched (or the fetch failed)
+        self.complete = complete         # Every module answered
+        self.missing = missing           # Frigate had no snapshot (404); not asked again until it reports a new one
+
+# --- Modules ---
+def load_modules(path):
+    """Reads the enabled modules of a CPAI modules.json (// comments allowed) as dicts with route and attribute.
+
+    Modules without a known route or attribute mapping are skipped with a warning. Raises ValueError
+    if the file can't be parsed.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    # Drop // comments outside strings, and trailing commas the CPAI example tolerates
+    text = re.sub(r'("(?:\\.|[^"\\])*")|//[^\n]*', lambda m: m.group(1) or "", text)
+    text = re.sub(r",(\s*[\]}])", r"\1", text)
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid modules file {path}: {e}")
+    if isinstance(entries, dict):
+        entries = entries.get("modules", [])
+    modules = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("enabled", True):
+            continue
+        name = str(entry.get("module", ""))
+        route, attribute = module_route(name, entry.get("route")), entry.get("attribute") or module_attribute(name)
+        if not route or attribute not in ATTRIBUTES:
+            logging.warning(f"CPAI module '{name}' has no known route or attribute; it is not used for enrichment.")
+            continue
+        properties = entry.get("properties") or {}
+        try:
+            min_confidence = float(properties.get("MinConfidence", 0.4))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid MinConfidence for CPAI module '{name}' in {path}.")
+        labels = entry.get("labels")
+        if labels is None and attribute == "weapon" and "weapon" not in name:
+            labels = WEAPON_LABELS # A generic detector: only its weapon classes count
+        modules.append({"name": name, "route": route, "attribute": attribute, "min_confidence": min_confidence,
+                        "labels": frozenset(label.lower() for label in labels) if labels else None})
+    return modules
+
+def module_route(name, route=None):
+    """CPAI API path for a module name like "objectdetection.weapons.onnx" ("kind.model.format")."""
+    if route:
+        return route
+    parts = name.lower().split(".")
+    kind, model = parts[0], parts[1] if len(parts) > 1 else ""
+    if kind == "objectdetection" and (not model or model in GENERIC_DETECTORS):
+        return "/v1/vision/detection"
+    if kind in ("objectdetection", "classification", "pose") and model:
+        return f"/v1/vision/custom/{model}"
+    return None
+
+def module_attribute(name):
+    """Attribute a module's predictions are merged into, guessed from its name."""
+    name = name.lower()
+    for attribute in ATTRIBUTES:
+        if attribute in name:
+            return attribute
+    return "weapon" if name.startswith("objectdetection.") else None
+
+def predictions_to_attributes(module, result):
+    """Turns one CPAI response ({"success", "predictions": [{"label", "confidence"}, ...]}) into attributes."""
+    if not result.get("success", True):
+        raise EnrichmentError(f"CPAI module {module['name']}: {result.get('error', 'unsuccessful')}")
+    predictions = [p for p in result.get("predictions") or []
+                   if isinstance(p, dict) and p.get("label") and float(p.get("confidence", 1.0)) >= module["min_confidence"]]
+    if module["labels"] is not None:
+        predictions = [p for p in predictions if str(p["label"]).lower() in module["labels"]]
+    if not predictions:
+        return {}
+    if module["attribute"] == "weapon":
+        return {"weapon": True}
+    if module["attribute"] == "clothing":
+        return {"clothing": {str(p["label"]).lower(): True for p in predictions}}
+    best = max(predictions, key=lambda p: float(p.get("confidence", 0.0)))
+    return {"pose": str(best["label"]).lower()}
+
+def merge_attributes(attributes, found):
+    """Merges enrichment results into an event's attributes without clearing what Frigate already set."""
+    merged = dict(attributes) if isinstance(attributes, dict) else {}
+    for name, value in found.items():
+        if name == "clothing":
+            clothing = merged.get("clothing")
+            merged["clothing"] = {**(clothing if isinstance(clothing, dict) else {}), **value}
+        elif name == "weapon":
+            merged["weapon"] = merged.get("weapon") or value
+        else:
+            merged[name] = value
+    return merged
+
+def snapshot_key(event_data):
+    """Identifies the snapshot Frigate currently holds for an event, if its payload says."""
+    snapshot = event_data.get("snapshot")
+    if isinstance(snapshot, dict) and snapshot.get("frame_time") is not None:
+        return snapshot["frame_time"]
+    return event_data.get("snapshot_time")
+
+# --- Enricher ---
+class Enricher:
+    """Fetches Frigate snapshots, runs the CPAI modules on them and caches the resulting attributes."""
+
+    def __init__(self, frigate_url, cpai_url, modules, timeout=2.0, refresh_seconds=5.0, cache_size=1000,
+                 pool_size=4, snapshot_query="crop=1&quality=90", clock=time.monotonic):
+        if not modules:
+            raise ValueError("No usable CPAI modules configured.")
+        if refresh_seconds < 0 or cache_size < 1 or pool_size < 1:
+            raise ValueError("refresh_seconds must be >= 0, cache_size and pool_size >= 1.")
+        self.modules = modules
+        self.refresh_seconds = refresh_seconds
+        self.snapshot_query = snapshot_query
+        self.clock = clock
+        self.frigate = HTTPConnectionPool(frigate_url, pool_size, timeout)
+        self.cpai = HTTPConnectionPool(cpai_url, pool_size, timeout)
+        self.events = LRUCache(cache_size)  # event_id -> SnapshotEntry
+        self.results = LRUCache(cache_size) # snapshot digest -> attributes
+        self.fetch_count = 0
+        self.model_run_count = 0
+        self.failed_count = 0
+        self.no_snapshot_count = 0
+
+    def enrich(self, event_id, event_data):
+        """Returns (attributes found for the event, outcome).
+
+        outcome is "cached" (no HTTP call), "snapshot_cached" (same image as analysed before),
+        "analysed" (models ran), "no_snapshot" (Frigate has none yet) or "failed" (previous
+        attributes, if any, are returned).
+        """
+        key = snapshot_key(event_data)
+        now = self.clock()
+        entry = self.events.get(event_id)
+        if event_data.get("has_snapshot") is False:
+            # Frigate hasn't saved a snapshot for the event yet; asking for one would only 404
+            self.no_snapshot_count += 1
+            return (entry.attributes if entry else {}), "no_snapshot"
+        if entry and entry.missing and key == entry.snapshot_key:
+            return entry.attributes, "no_snapshot"
+        if entry and (now - entry.checked_at < self.refresh_seconds
+                      or entry.complete and key is not None and key == entry.snapshot_key):
+            return entry.attributes, "cached"
+
+        previous = entry.attributes if entry else {}
+        try:
+            image = self.fetch_snapshot(event_id)
+        except SnapshotMissing as e:
+            self.no_snapshot_count += 1
+            logging.debug(f"Enrichment of event {event_id} skipped: {e}")
+            self.events.put(event_id, SnapshotEntry(key, entry.digest if entry else None, previous, now, False, missing=True))
+            return previous, "no_snapshot"
+        except EnrichmentError as e:
+            self.failed_count += 1
+            logging.warning(f"Enrichment of event {event_id} failed: {e}")
+            self.events.put(event_id, SnapshotEntry(None, entry.digest if entry else None, previous, now, False))
+            return previous, "failed"
+
+        digest = hashlib.blake2b(image, digest_size=16).digest()
+        attributes = self.results.get(digest)
+        if attributes is not None:
+            self.events.put(event_id, SnapshotEntry(key, digest, attributes, now, True))
+            return attributes, "snapshot_cached"
+
+        attributes, complete = self.analyse(image, event_id)
+        if complete:
+            self.results.put(digest, attributes)
+        self.events.put(event_id, SnapshotEntry(key, digest, attributes, now, complete))
+        return attributes, "analysed" if complete else "failed"
+
+    def forget(self, event_id):
+        """Drops an ended event's entry; its results stay cached by snapshot digest."""
+        self.events.pop(event_id)
+
+    def fetch_snapshot(self, event_id):
+        self.fetch_count += 1
+        path = f"/api/events/{urllib.parse.quote(event_id, safe='')}/snapshot.jpg"
+        status, data = self.frigate.request("GET", f"{path}?{self.snapshot_query}" if self.snapshot_query else path)
+        if status == 404:
+            raise SnapshotMissing(f"Frigate has no snapshot for event {event_id}")
+        if status != 200 or not data:
+            raise EnrichmentError(f"Frigate snapshot for event {event_id}: HTTP {status}")
+        return data
+
+    def analyse(self, image, event_id=""):
+        """Runs every module on a JPEG. Returns (attributes, complete), complete being False if a module failed."""
+        self.model_run_count += 1
+        attributes, complete = {}, True
+        for module in self.modules:
+            body, content_type = encode_multipart({"min_confidence": module["min_confidence"]},
+                                                  {"image": ("snapshot.jpg", image, "image/jpeg")})
+            try:
+                status, data = self.cpai.request("POST", module["route"], body, {"Content-Type": content_type})
+                if status != 200:
+                    raise EnrichmentError(f"CPAI module {module['name']}: HTTP {status}")
+                try:
+                    result = json.loads(data)
+                except ValueError:
+                    raise EnrichmentError(f"CPAI module {module['name']}: invalid JSON response")
+                attributes = merge_attributes(attributes, predictions_to_attributes(module, result))
+            except (EnrichmentError, ValueError, TypeError, AttributeError) as e:
+                complete = False
+                self.failed_count += 1
+                logging.warning(f"Enrichment of event {event_id} incomplete: {e}")
+        return attributes, complete
+
+    def close(self):
+        self.frigate.close()
+        self.cpai.close()
+
+    def stats(self):
+        return {"events": self.events.stats(), "results": self.results.stats(), "fetches": self.fetch_count,
+                "model_runs": self.model_run_count, "failures": self.failed_count, "no_snapshot": self.no_snapshot_count,
+                "connections": self.frigate.created_count + self.cpai.created_count}
+
+def main(scorer, argv):
+    """Entry point for `scorer.py enrich`. Returns a process exit code."""
+    parser = argparse.ArgumentParser(prog="scorer.py enrich", description="Enrich one Frigate snapshot with the configured CPAI modules.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--event-id", help="Frigate event whose snapshot is fetched from ENRICH_FRIGATE_URL.")
+    source.add_argument("--image", help="JPEG file to analyse instead.")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON.")
+    args = parser.parse_args(argv)
+
+    enricher = scorer.enricher
+    if enricher is None:
+        print("Enrichment is disabled; set ENRICH_CPAI_URL and ENRICH_MODULES_FILE.", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    try:
+        if args.image:
+            with open(args.image, "rb") as f:
+                attributes, complete = enricher.analyse(f.read(), args.image)
+            outcome = "analysed" if complete else "failed"
+        else:
+            attributes, outcome = enricher.enrich(args.event_id, {})
+    except OSError as e:
+        print(e, file=sys.stderr)
+        return 1
+    report = {"modules": [{"name": m["name"], "route": m["route"], "attribute": m["attribute"]} for m in enricher.modules],
+              "outcome": outcome, "attributes": attributes, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+    enricher.close()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module in report["modules"]:
+            print(f"  {module['name']}: POST {module['route']} -> attributes.{module['attribute']}")
+        print(f"{outcome} in {report['elapsed_ms']} ms: {attributes}")
+    return 0 if outcome not in ("failed", "no_snapshot") else 1
@@ -0,0 +1,174 @@
+# scorer_incidents.py
+# Cross-camera correlation of Frigate events into incidents for scorer.py.
+# The same person walking past several cameras produces one Frigate event_id per camera. The
+# index links such events into one incident so the scorer can aggregate their scores and send a
+# single audio inquiry (and raise a single alarm) per incident.
+#
+# Two events belong to the same incident when, within window_seconds of the incident's last
+# activity, they have:
+#   - the same re-identification value (e.g. an embedding hash or a recognised sub_label), or
+#   - the same correlation key: camera group (cameras listed together in camera_groups, or all
+#     cameras when no groups are configured), label and, optionally, zone.
+# Keys are looked up in the current and previous time bucket (window_seconds wide), so linking is
+# two dict lookups regardless of the number of incidents. An incident stops accepting new events
+# after max_age_seconds, so constant activity (e.g. a busy path) still gets a fresh inquiry now and
+# then. Incidents are kept in least-recently-active order and evicted when idle for two windows or
+# when max_incidents is exceeded.
+
+import time
+import hashlib
+import threading
+import itertools
+from collections import OrderedDict
+
+class Incident:
+    """Events correlated across cameras, with their aggregated score and decisions."""
+    __slots__ = ("incident_id", "event_scores", "cameras", "keys", "first_seen", "last_seen",
+                 "inquiry_event_id", "alarmed")
+
+    def __init__(self, incident_id, now):
+        self.incident_id = incident_id
+        self.event_scores = {}       # event_id -> latest score (capped at max_events_per_incident)
+        self.cameras = set()
+        self.keys = set()            # Index keys pointing at this incident, removed on eviction
+        self.first_seen = now
+        self.last_seen = now
+        self.inquiry_event_id = None # Event whose audio inquiry covers the whole incident
+        self.alarmed = False
+
+    def score(self, camera_bonus=0.0):
+        """Highest event score, plus camera_bonus for every camera beyond the first."""
+        if not self.event_scores:
+            return 0.0
+        return round(max(self.event_scores.values()) + camera_bonus * (len(self.cameras) - 1), 2)
+
+class IncidentIndex:
+    """Bounded, thread-safe spatio-temporal index linking Frigate events into incidents."""
+
+    def __init__(self, window_seconds=30.0, max_age_seconds=300.0, camera_groups=None, match_zone=False,
+                 reid_field=None, max_incidents=1000, max_events_per_incident=100, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.max_age_seconds = max_age_seconds
+        self.camera_groups = camera_groups or {} # camera -> group name; unlisted cameras form their own group
+        self.match_zone = match_zone
+        self.reid_field = reid_field             # Dotted path in the event data, e.g. "attributes.reid"
+        self.max_incidents = max_incidents
+        self.max_events_per_incident = max_events_per_incident
+        self.clock = clock
+        self._incidents = OrderedDict() # incident_id -> Incident, least recently active first
+        self._index = {}                # correlation or re-id key -> incident_id
+        self._events = {}               # event_id -> incident_id
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.linked_count = 0
+        self.evicted_count = 0
+
+    def __len__(self):
+        return len(self._incidents)
+
+    def link(self, event_id, event_data, score):
+        """Adds or updates an event and returns its Incident (creating one if nothing correlates)."""
+        with self._lock:
+            now = self.clock()
+            self._evict_locked(now)
+            incident = self._incidents.get(self._events.get(event_id))
+            bucket = int(now // self.window_seconds)
+            correlation_key = self._correlation_key(event_data)
+            reid_key = self._reid_key(event_data)
+            if incident is None:
+                for key in filter(None, (reid_key and ("reid", reid_key), ("key", correlation_key, bucket),
+                                         ("key", correlation_key, bucket - 1))):
+                    candidate = self._incidents.get(self._index.get(key))
+                    if (candidate is not None and now - candidate.last_seen <= self.window_seconds
+                            and now - candidate.first_seen <= self.max_age_seconds):
+                        incident = candidate
+                        self.linked_count += 1
+                        break
+                if incident is None:
+                    incident = Incident(f"inc-{next(self._ids)}", now)
+                    self._incidents[incident.incident_id] = incident
+                if len(incident.event_scores) < self.max_events_per_incident:
+                    self._events[event_id] = incident.incident_id
+            if event_id in incident.event_scores or len(incident.event_scores) < self.max_events_per_incident:
+                incident.event_scores[event_id] = score
+            incident.cameras.add(event_data.get("camera"))
+            incident.last_seen = now
+            self._incidents.move_to_end(incident.incident_id)
+            for key in (reid_key and ("reid", reid_key), ("key", correlation_key, bucket)):
+                if key:
+                    self._index[key] = incident.incident_id
+                    incident.keys.add(key)
+            return incident
+
+    def get_for_event(self, event_id):
+        """Returns the Incident an event was linked into, or None."""
+        return self._incidents.get(self._events.get(event_id))
+
+    def claim_inquiry(self, incident, event_id):
+        """Makes event_id the incident's inquiry if it has none yet. Returns True if claimed."""
+        with self._lock:
+            if incident.inquiry_event_id is not None:
+                return False
+            incident.inquiry_event_id = event_id
+            return True
+
+    def claim_alarm(self, incident):
+        """Marks the incident alarmed. Returns True only for the first caller."""
+        with self._lock:
+            if incident.alarmed:
+                return False
+            incident.alarmed = True
+            return True
+
+    def stats(self):
+        """Returns a snapshot of index sizes and counters."""
+        return {
+            "incidents": len(self._incidents),
+            "events": len(self._events),
+            "index_keys": len(self._index),
+            "linked": self.linked_count,
+            "evicted": self.evicted_count,
+        }
+
+    def _correlation_key(self, event_data):
+        camera = event_data.get("camera")
+        key = (self.camera_groups.get(camera, camera) if self.camera_groups else "*", event_data.get("label"))
+        if self.match_zone:
+            zones = event_data.get("current_zones") or event_data.get("entered_zones") or []
+            key += (zones[0] if zones else None,)
+        return key
+
+    def _reid_key(self, event_data):
+        if not self.reid_field:
+            return None
+        value = event_data
+        for part in self.reid_field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if value in (None, "", [], {}):
+            return None
+        # Embeddings can be long lists; index a short digest of them
+        return hashlib.blake2b(repr(value).encode(), digest_size=8).hexdigest()
+
+    def _evict_locked(self, now):
+        while self._incidents:
+            oldest_id, oldest = next(iter(self._incidents.items()))
+            if len(self._incidents) > self.max_incidents or now - oldest.last_seen > 2 * self.window_seconds:
+                del self._incidents[oldest_id]
+                for key in oldest.keys:
+                    if self._index.get(key) == oldest_id:
+                        del self._index[key]
+                for event_id in oldest.event_scores:
+                    if self._events.get(event_id) == oldest_id:
+                        del self._events[event_id]
+                self.evicted_count += 1
+            else:
+                break
+
+def parse_camera_groups(text):
+    """Parses "front,driveway,porch;back,garden" into {camera: group name}."""
+    groups = {}
+    for group in text.split(";"):
+        cameras = [camera.strip() for camera in group.split(",") if camera.strip()]
+        for camera in cameras:
+            groups[camera] = cameras[0]
+    return groups
@@ -0,0 +1,266 @@
+# scorer_instance.py
+# Runs scorer.py instances in-process, on the in-memory broker of scorer_broker.py and a simulated
+# clock, for integration tests and simulations with deterministic timing.
+#
+# scorer.py keeps its configuration and state in module globals, so each ScorerInstance executes
+# scorer.py again as a separate module: every instance has its own configuration (an env dict
+# overlaid on os.environ while the module loads), pending inquiries, tracks, alert windows and
+# MQTT client. Nothing runs in the background: messages are delivered by the broker on the calling
+# thread, and timeouts fire when the simulation advances its clock.
+#
+#   sim = Simulation()
+#   scorer = sim.add_scorer({"EVENT_TIMEOUT_SECONDS": "30", "EVENT_TIMEOUT_ACTION": "publish"})
+#   sim.publish("frigate/events", {"type": "new", "after": {...}})
+#   sim.advance(31)                      # The unanswered inquiry times out
+#   sim.decisions()                      # [{"kind": "inquiry", ...}, {"kind": "timeout", ...}]
+#
+# Usage (synthetic load through one instance, or N shards of one group, see scorer_shards.py):
+#   python scorer.py simulate [--events 5000] [--instances N] [--cameras 8] [--interval 0.2] [--reply-rate 0.5]
+#                             [--seed 1] [--json]
+#
+# Latency traces keep using the real monotonic clock, so the latency in simulated alerts is not meaningful.
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import itertools
+import threading
+import importlib.util
+import logging
+
+from scorer_broker import LocalBroker
+
+SCORER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scorer.py")
+_load_lock = threading.Lock() # os.environ is process-wide; load one instance at a time
+_instance_ids = itertools.count(1)
+
+class ManualClock:
+    """A monotonic clock that only moves when advanced."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+        return self.now
+
+def load_scorer_module(env=None, name=None):
+    """Executes scorer.py as a new module, reading its configuration from os.environ overlaid with env.
+
+    GPIO is off unless env sets USE_GPIO. Raises ValueError if the configuration is rejected.
+    """
+    env = {key: str(value) for key, value in (env or {}).items()}
+    env.setdefault("USE_GPIO", "false")
+    name = name or f"scorer_instance_{next(_instance_ids)}"
+    spec = importlib.util.spec_from_file_location(name, SCORER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    with _load_lock:
+        saved_environ = dict(os.environ)
+        os.environ.update(env)
+        try:
+            spec.loader.exec_module(module)
+        except SystemExit:
+            raise ValueError(f"Invalid scorer configuration for {name}; see the log.")
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_environ)
+    return module
+
+class ScorerInstance:
+    """One scorer with its own configuration and state, connected to a LocalBroker."""
+
+    def __init__(self, broker, clock, env=None, name=None):
+        self.broker = broker
+        self.clock = clock
+        self.module = load_scorer_module(env, name)
+        self.name = self.module.__name__
+        self.client = broker.client(self.name)
+        self.module.mqtt_client = self.client
+        self.module.set_clock(clock)
+
+    def start(self):
+        """Subscribes the scorer's callbacks (inline, as SCORER_WORKER_MODE=inline) and connects."""
+        scorer = self.module
+        self.client.on_connect = scorer.on_connect
+        self.client.on_disconnect = scorer.on_disconnect
+        scorer.register_callbacks(self.client, scorer.on_frigate_event, scorer.on_audio_result)
+        if scorer.pending_journal:
+            scorer.restore_pending_state()
+        self.client.connect()
+        return self
+
+    def tick(self):
+        """Does what the background ticks of the service would: expires inquiries and closes alert windows."""
+        self.module.pending_events.expire()
+        self.module.alert_coalescer.flush_due()
+
+    def stop(self):
+        """Publishes alerts still being coalesced, flushes the journal and disconnects."""
+        self.module.alert_coalescer.flush_due(flush_all=True)
+        if self.module.pending_journal:
+            self.module.pending_journal.stop()
+        self.client.disconnect()
+
+    def stats(self):
+        scorer = self.module
+        return {
+            "pending": len(scorer.pending_events),
+            "tracks": len(scorer.tracks),
+            "incidents": len(scorer.incidents) if scorer.incidents is not None else 0,
+            "alerts": scorer.alert_coalescer.stats(),
+            "shard": scorer.shard_router.stats() if scorer.shard_router else None,
+            "enrich": scorer.enricher.stats() if scorer.enricher else None,
+        }
+
+class Simulation:
+    """A LocalBroker, a ManualClock and any number of scorer instances, advanced together."""
+
+    def __init__(self, broker=None, clock=None, tick_seconds=1.0):
+        self.broker = broker or LocalBroker()
+        self.clock = clock or ManualClock()
+        self.tick_seconds = tick_seconds # Clock step of advance(), like PENDING_EXPIRY_TICK_SECONDS
+        self.scorers = []
+
+    def add_scorer(self, env=None, name=None):
+        """Creates, connects and returns a new ScorerInstance."""
+        scorer = ScorerInstance(self.broker, self.clock, env, name).start()
+        self.scorers.append(scorer)
+        self.broker.run_until_idle()
+        return scorer
+
+    def publish(self, topic, payload, deliver=True):
+        """Publishes a message (dicts are sent as JSON) and, unless deliver is False, delivers everything queued."""
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        self.broker.publish(topic, payload)
+        if deliver:
+            self.broker.run_until_idle()
+
+    def advance(self, seconds):
+        """Moves the clock forward in tick_seconds steps, running every scorer's ticks and delivering messages."""
+        target = self.clock() + seconds
+        while self.clock() < target:
+            self.clock.advance(min(self.tick_seconds, target - self.clock()))
+            for scorer in self.scorers:
+                scorer.tick()
+            self.broker.run_until_idle()
+
+    def stop(self):
+        for scorer in self.scorers:
+            scorer.stop()
+        self.broker.run_until_idle()
+
+    def decisions(self, start=0):
+        """Alarm, inquiry and timeout decisions published so far (from broker.published[start:]), as in scorer_bench."""
+        from scorer_bench import extract_decisions
+        if not self.scorers:
+            return []
+        return extract_decisions(self.scorers[0].module, [(0, topic, payload) for topic, payload in self.broker.published[start:]])
+
+# --- Synthetic load ---
+ATTRIBUTE_ODDS = {"mask": 0.3, "hoodie": 0.3, "crouching": 0.15, "weapon": 0.02}
+REPLIES = (("package delivery for you", "neutral"), ("just visiting a friend", "neutral"),
+           ("", "silent"), ("go away", "negative"), ("help police", "negative"))
+
+def topic_for(topic_filter, suffix=None):
+    """A concrete topic under a subscription filter: "frigate/events/#" -> "frigate/events" (or ".../<suffix>")."""
+    base = topic_filter[:-2] if topic_filter.endswith("/#") else topic_filter.replace("+", suffix or "")
+    return f"{base}/{suffix}" if suffix and topic_filter.endswith("/#") else base
+
+def synthetic_event(rng, index, cameras):
+    """A Frigate "new" event for a person with randomly drawn attributes."""
+    attributes = {"clothing": {"mask": rng.random() < ATTRIBUTE_ODDS["mask"],
+                               "hoodie": rng.random() < ATTRIBUTE_ODDS["hoodie"]}}
+    if rng.random() < ATTRIBUTE_ODDS["crouching"]:
+        attributes["pose"] = "crouch"
+    if rng.random() < ATTRIBUTE_ODDS["weapon"]:
+        attributes["weapon"] = True
+    event_id = f"sim-{index}"
+    camera = f"camera_{rng.randrange(cameras)}"
+    return {"type": "new", "before": None,
+            "after": {"id": event_id, "camera": camera, "label": "person", "frame_time": time.time(),
+                      "current_zones": [], "attributes": attributes}}
+
+def simulate(sim, event_count, cameras, interval, reply_rate, reply_delay, seed):
+    """Pushes event_count synthetic events through sim, answering inquiries with a reply_rate share of audio results."""
+    rng = random.Random(seed)
+    scorer = sim.scorers[0].module
+    replies = [] # heap of (clock time, sequence, event_id)
+    sequence = itertools.count()
+    scanned = 0
+    started = time.perf_counter()
+    for index in range(event_count):
+        sim.publish(topic_for(scorer.MQTT_FRIGATE_TOPIC), synthetic_event(rng, index, cameras))
+        # Answer some of the inquiries published since the last event, after reply_delay
+        for topic, payload in sim.broker.published[scanned:]:
+            if topic.startswith(scorer.MQTT_INQUIRY_TRIGGER_TOPIC_BASE + "/") and rng.random() < reply_rate:
+                heapq.heappush(replies, (sim.clock() + reply_delay, next(sequence), json.loads(payload)["event_id"]))
+        scanned = len(sim.broker.published)
+        while replies and replies[0][0] <= sim.clock():
+            _, _, event_id = heapq.heappop(replies)
+            transcript, tone = rng.choice(REPLIES)
+            sim.publish(topic_for(scorer.MQTT_AUDIO_TOPIC, event_id), {"id": event_id, "transcript": transcript, "tone": tone})
+        sim.advance(interval)
+    # Deliver the remaining replies and let every unanswered inquiry time out
+    while replies:
+        reply_at, _, event_id = heapq.heappop(replies)
+        if reply_at > sim.clock():
+            sim.advance(reply_at - sim.clock())
+        transcript, tone = rng.choice(REPLIES)
+        sim.publish(topic_for(scorer.MQTT_AUDIO_TOPIC, event_id), {"id": event_id, "transcript": transcript, "tone": tone})
+    sim.advance(scorer.EVENT_TIMEOUT_SECONDS + sim.tick_seconds)
+    elapsed = time.perf_counter() - started
+    sim.stop()
+
+    counts = {}
+    for decision in sim.decisions():
+        counts[decision["kind"]] = counts.get(decision["kind"], 0) + 1
+    return {
+        "events": event_count,
+        "messages_delivered": sim.broker.delivered_count,
+        "elapsed_seconds": round(elapsed, 3),
+        "events_per_second": round(event_count / elapsed, 1) if elapsed > 0 else None,
+        "simulated_seconds": round(sim.clock(), 3),
+        "decisions": counts,
+        "scorers": {scorer.name: scorer.stats() for scorer in sim.scorers},
+    }
+
+def main(argv):
+    """Entry point for `scorer.py simulate`. Returns a process exit code."""
+    parser = argparse.ArgumentParser(prog="scorer.py simulate", description="Push synthetic Frigate events through an in-process scorer.")
+    parser.add_argument("--events", type=int, default=5000, help="Number of synthetic events.")
+    parser.add_argument("--instances", type=int, default=1, help="Scorer instances; more than one shards them in one group.")
+    parser.add_argument("--cameras", type=int, default=8, help="Number of cameras the events are spread over.")
+    parser.add_argument("--interval", type=float, default=0.2, help="Simulated seconds between events.")
+    parser.add_argument("--reply-rate", type=float, default=0.5, help="Share of inquiries that get an audio result.")
+    parser.add_argument("--reply-delay", type=float, default=8.0, help="Simulated seconds before an audio result arrives.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed; the same seed gives the same decisions.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.ERROR) # Per-event INFO logging would dominate the run
+    try:
+        sim = Simulation()
+        for index in range(max(1, args.instances)):
+            env = {"SCORER_SHARD_GROUP": "scorers", "SCORER_SHARD_ID": f"scorer-{index + 1}"} if args.instances > 1 else {}
+            sim.add_scorer(env)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    report = simulate(sim, args.events, args.cameras, args.interval, args.reply_rate, args.reply_delay, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['events']} events ({report['messages_delivered']} messages) in {report['elapsed_seconds']} s: "
+              f"{report['events_per_second']} events/s, {report['simulated_seconds']} simulated seconds")
+        print(f"Decisions: {report['decisions']}")
+        for name, stats in report["scorers"].items():
+            print(f"  {name}: {stats}")
+    return 0
@@ -0,0 +1,202 @@
+# scorer_journal.py
+# Append-only journal that makes the scorer's pending inquiries (scorer_pending.py) and its recent
+# alarm decisions survive a restart.
+# Every change is one JSON line ("add", "score", "remove", "decision"). Lines are buffered and
+# written with a single write + fsync every fsync_interval seconds, so the hot path never waits
+# on the SD card; a crash loses at most that interval. On startup the journal is replayed
+# (a truncated last line from a crash is ignored) and then compacted: the file is rewritten as a
+# snapshot of the live state to a temporary file and atomically renamed over the journal. The
+# same compaction runs whenever the journal holds several times more lines than live entries.
+#
+# Deadlines are journaled as wall-clock times ("expires_at") because the monotonic clock of the
+# store does not survive a reboot.
+
+import os
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+class PendingJournal:
+    """Batched, fsync'd JSONL journal of pending inquiries and recent decisions."""
+
+    def __init__(self, path, fsync_interval=1.0, compact_min_records=1000, decision_retention_seconds=600):
+        self.path = path
+        self.fsync_interval = fsync_interval # 0 = write and fsync on every record
+        self.compact_min_records = compact_min_records
+        self.decision_retention_seconds = decision_retention_seconds
+        self.compact_fn = None # Set by the store: rewrites the journal from a consistent snapshot
+        self.decisions = OrderedDict() # event_id -> decision record, oldest first
+        self._buffer = []
+        self._records = 0 # Lines in the journal file (and buffer) since the last compaction
+        self._live = 0    # Live pending entries at the last append, to decide when to compact
+        self._lock = threading.Lock()
+        self._file = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.write_errors = 0
+
+    # --- Recording ---
+    def record_add(self, event_id, entry, live_count):
+        self._append(_add_record(event_id, entry), live_count)
+
+    def record_score(self, event_id, score, live_count):
+        self._append({"op": "score", "id": event_id, "score": score}, live_count)
+
+    def record_remove(self, event_id, live_count):
+        self._append({"op": "remove", "id": event_id}, live_count)
+
+    def record_decision(self, event_id, kind, score):
+        """Remembers a decision (e.g. "alarm") so a restarted scorer does not repeat it."""
+        record = {"op": "decision", "id": event_id, "kind": kind, "score": score, "timestamp": time.time()}
+        with self._lock:
+            self.decisions.pop(event_id, None)
+            self.decisions[event_id] = record
+            self._prune_decisions_locked(record["timestamp"])
+        self._append(record, None)
+
+    def _append(self, record, live_count):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if live_count is not None:
+                self._live = live_count
+            self._buffer.append(line)
+            self._records += 1
+            if self.fsync_interval <= 0:
+                self._flush_locked()
+
+    def _prune_decisions_locked(self, now):
+        cutoff = now - self.decision_retention_seconds
+        while self.decisions:
+            event_id, record = next(iter(self.decisions.items()))
+            if record["timestamp"] >= cutoff:
+                break
+            del self.decisions[event_id]
+
+    # --- Replay and compaction ---
+    def replay(self):
+        """Reads the journal. Returns {event_id: pending record} and fills self.decisions."""
+        pending = {}
+        if not os.path.exists(self.path):
+            return pending
+        lines = 0
+        with open(self.path, "r") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                    op, event_id = record["op"], record["id"]
+                except (ValueError, KeyError, TypeError):
+                    logging.warning(f"Ignoring unreadable pending journal line {line_number} in {self.path}.")
+                    continue
+                lines += 1
+                if op == "add":
+                    pending[event_id] = record
+                elif op == "score" and event_id in pending:
+                    pending[event_id]["score"] = record["score"]
+                elif op == "remove":
+                    pending.pop(event_id, None)
+                elif op == "decision":
+                    self.decisions.pop(event_id, None)
+                    self.decisions[event_id] = record
+        with self._lock:
+            self._records = lines
+            self._prune_decisions_locked(time.time())
+        return pending
+
+    def rewrite(self, pending_records):
+        """Replaces the journal with a snapshot of pending_records ({event_id: entry}) and the recent decisions.
+
+        Must be called while the store is locked, so no pending change can be lost between the snapshot and the swap.
+        """
+        with self._lock:
+            self._prune_decisions_locked(time.time())
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                for event_id, entry in pending_records.items():
+                    f.write(json.dumps(_add_record(event_id, entry), separators=(",", ":")) + "\n")
+                for record in self.decisions.values():
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if self._file:
+                self._file.close()
+                self._file = None
+            os.replace(temp_path, self.path)
+            _fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+            self._buffer = []
+            self._records = len(pending_records) + len(self.decisions)
+            self._live = len(pending_records)
+
+    def needs_compaction(self):
+        return self._records > max(self.compact_min_records, 4 * (self._live + len(self.decisions)))
+
+    # --- Background flushing ---
+    def start(self):
+        """Starts the background flush (and compaction) thread."""
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="scorer-pending-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flushes outstanding records and stops the background thread."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            self._flush_locked()
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer = []
+        except OSError as e:
+            # Keep the buffer and retry on the next flush; the in-memory store is unaffected
+            self.write_errors += 1
+            logging.error(f"Error writing pending journal {self.path}: {e}")
+
+    def _flush_loop(self):
+        # With fsync_interval 0 records are already written synchronously; the loop only compacts
+        while not self._stop_event.wait(self.fsync_interval if self.fsync_interval > 0 else 1.0):
+            self.flush()
+            if self.compact_fn and self.needs_compaction():
+                try:
+                    self.compact_fn()
+                except OSError as e:
+                    logging.error(f"Error compacting pending journal {self.path}: {e}")
+
+def _add_record(event_id, entry):
+    """Journal record for a pending entry; the store-clock "deadline" is left out, extras (e.g. "trace") kept."""
+    record = {"op": "add", "id": event_id}
+    record.update({key: value for key, value in entry.items() if key != "deadline"})
+    return record
+
+def _fsync_directory(directory):
+    """Makes a rename durable (not supported on every platform)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
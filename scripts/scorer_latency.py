@@ -0,0 +1,161 @@
+# scorer_latency.py
+# Aggregates the latency breakdowns that scorer.py puts in vz/alert payloads (see event_trace.py)
+# into percentile reports per decision path (visual, audio, timeout).
+#
+# Usage (run through scorer.py so the same MQTT configuration is used):
+#   python scorer.py latency --input alerts.jsonl [--json]
+#   python scorer.py latency --duration 3600 [--output alerts.jsonl] [--json]
+#
+# --input reads either one alert payload per line or a capture in the scorer_bench format
+# ({"ts", "topic", "payload"}; only MQTT_ALERT_TOPIC lines are used). Without --input, alerts are
+# collected live from the broker for --duration seconds (or until interrupted).
+
+import sys
+import json
+import time
+import argparse
+import threading
+import logging
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def load_alerts(path, alert_topic):
+    """Reads alert payloads from a JSONL file of alerts or of captured messages."""
+    alerts = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                logging.error(f"Skipping malformed line {line_number}: {e}")
+                continue
+            if "topic" in record and "payload" in record:
+                if record["topic"] != alert_topic:
+                    continue
+                record = record["payload"]
+                if isinstance(record, str):
+                    try:
+                        record = json.loads(record)
+                    except ValueError:
+                        continue
+            if isinstance(record, dict):
+                alerts.append(record)
+    return alerts
+
+def decision_path(latency):
+    """Classifies an alert by how it was decided, from its latency breakdown."""
+    if "audio_round_trip_ms" in latency:
+        return "audio"
+    if "timed_out" in latency.get("steps", {}):
+        return "timeout"
+    return "visual"
+
+def aggregate(alerts):
+    """Returns {path: {"count": n, "metrics": {name: {"count", "p50", "p90", "p99", "max"}}}} in milliseconds."""
+    samples = {} # path -> metric name -> values
+    for alert in alerts:
+        latency = alert.get("latency")
+        if not isinstance(latency, dict) or "total_ms" not in latency:
+            continue
+        for path in (decision_path(latency), "all"):
+            path_samples = samples.setdefault(path, {})
+            path_samples.setdefault("_alerts", []).append(1)
+            for name in ("total_ms", "audio_round_trip_ms", "detection_lag_ms"):
+                if isinstance(latency.get(name), (int, float)):
+                    path_samples.setdefault(name, []).append(latency[name])
+            for stage, value in latency.get("steps", {}).items():
+                path_samples.setdefault(f"step:{stage}", []).append(value)
+
+    report = {}
+    for path, path_samples in samples.items():
+        metrics = {}
+        for name, values in path_samples.items():
+            if name == "_alerts":
+                continue
+            values.sort()
+            summary = {"count": len(values)}
+            for fraction in PERCENTILES:
+                summary[f"p{int(fraction * 100)}"] = round(_percentile(values, fraction), 2)
+            summary["max"] = round(values[-1], 2)
+            metrics[name] = summary
+        report[path] = {"count": len(path_samples["_alerts"]), "metrics": metrics}
+    return report
+
+def collect_live(scorer, duration, output_path=None):
+    """Subscribes to MQTT_ALERT_TOPIC and returns the alerts received within duration seconds (0 = until interrupted)."""
+    import paho.mqtt.client as mqtt
+
+    alerts = []
+    output = open(output_path, "a") if output_path else None
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(scorer.MQTT_ALERT_TOPIC)
+            logging.info(f"Collecting alerts from {scorer.MQTT_ALERT_TOPIC}...")
+        else:
+            logging.error(f"Failed to connect to MQTT broker, return code: {rc}")
+
+    def on_message(client, userdata, msg):
+        try:
+            alert = json.loads(msg.payload.decode())
+        except (UnicodeDecodeError, ValueError):
+            return
+        alerts.append(alert)
+        if output:
+            output.write(json.dumps(alert) + "\n")
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    try:
+        client.connect(scorer.MQTT_HOST, scorer.MQTT_PORT, 60)
+        client.loop_start()
+        if duration > 0:
+            time.sleep(duration)
+        else:
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        if output:
+            output.close()
+    return alerts
+
+def print_report(report):
+    for path in sorted(report, key=lambda p: (p == "all", p)):
+        print(f"{path}: {report[path]['count']} alert(s)")
+        print(f"  {'metric (ms)':<32} {'count':>6} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}")
+        for name, summary in sorted(report[path]["metrics"].items(), key=lambda item: (item[0].startswith("step:"), item[0])):
+            print(f"  {name:<32} {summary['count']:>6} {summary['p50']:>10} {summary['p90']:>10} "
+                  f"{summary['p99']:>10} {summary['max']:>10}")
+
+def main(scorer, argv):
+    """Entry point for `scorer.py latency`. Returns a process exit code."""
+    parser = argparse.ArgumentParser(prog="scorer.py latency", description="Percentile report of alert latency breakdowns.")
+    parser.add_argument("--input", help="JSONL file of alert payloads or captured messages. Default: collect live.")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds to collect live alerts (0 = until interrupted).")
+    parser.add_argument("--output", help="Append live alerts to this JSONL file.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        alerts = load_alerts(args.input, scorer.MQTT_ALERT_TOPIC)
+    else:
+        alerts = collect_live(scorer, args.duration, args.output)
+    report = aggregate(alerts)
+    if not report:
+        print(f"No alerts with a latency breakdown found ({len(alerts)} alert(s) read).", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
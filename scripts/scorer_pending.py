@@ -0,0 +1,229 @@
+# scorer_pending.py
+# Store for events waiting on an audio inquiry result.
+# Entries are indexed by event ID in a dict and by deadline in a min-heap, so lookups are
+# O(1) and expiry is O(log n) per expired entry instead of a scan of every pending event.
+# A background tick expires entries even when no new events arrive, and a hard cap bounds
+# memory when inquiries pile up faster than the audio service answers them.
+# With a PendingJournal (scorer_journal.py) every change is also journaled, and restore()
+# rebuilds the store after a restart.
+
+import heapq
+import itertools
+import threading
+import time
+import logging
+
+# Eviction policies applied when the store is at max_size
+EVICTION_EVICT_OLDEST = "evict_oldest" # Drop the entry closest to its deadline to make room
+EVICTION_REJECT_NEW = "reject_new"     # Keep existing entries and refuse the new one
+EVICTION_POLICIES = (EVICTION_EVICT_OLDEST, EVICTION_REJECT_NEW)
+
+class PendingInquiryStore:
+    """Thread-safe pending inquiry store with deadline-ordered expiry.
+
+    Each entry is a dict with at least "score", "timestamp" (wall clock, for logs and payloads),
+    "deadline" (on the store's clock), "expires_at" (the deadline on the wall clock, for the
+    journal) and "initial_data". Entries should only be changed through the store's methods so the
+    journal sees every change. Callbacks receive (event_id, entry) and are always invoked outside
+    the store lock.
+    """
+
+    def __init__(self, timeout_seconds=60, max_size=1000, eviction_policy=EVICTION_EVICT_OLDEST,
+                 on_expire=None, on_evict=None, clock=time.monotonic, journal=None):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction_policy}'. Expected one of {EVICTION_POLICIES}.")
+        self.timeout_seconds = timeout_seconds
+        self.max_size = max_size
+        self.eviction_policy = eviction_policy
+        self.on_expire = on_expire
+        self.on_evict = on_evict
+        self.clock = clock
+        self.journal = journal
+        if journal:
+            journal.compact_fn = self.compact_journal
+
+        self._entries = {}
+        self._heap = [] # (deadline, sequence, event_id); stale items are skipped lazily
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._tick_thread = None
+        self._stop_event = threading.Event()
+        self.expired_count = 0
+        self.evicted_count = 0
+        self.rejected_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, event_id):
+        return event_id in self._entries
+
+    def event_ids(self):
+        """Returns a snapshot of the pending event IDs."""
+        return list(self._entries)
+
+    def get(self, event_id):
+        """Returns the entry for event_id without removing it, or None."""
+        return self._entries.get(event_id)
+
+    def add(self, event_id, score, initial_data, timeout_seconds=None, **extra):
+        """Adds (or replaces) a pending entry. Returns False if the store is full and rejects it.
+
+        timeout_seconds overrides the store's timeout, e.g. for an inquiry handed over by another shard.
+        """
+        if timeout_seconds is None:
+            timeout_seconds = self.timeout_seconds
+        evicted = []
+        with self._lock:
+            if event_id not in self._entries and len(self._entries) >= self.max_size:
+                if self.eviction_policy == EVICTION_REJECT_NEW:
+                    self.rejected_count += 1
+                    logging.warning(f"Pending inquiry store full ({self.max_size}). Rejecting event {event_id}.")
+                    return False
+                while len(self._entries) >= self.max_size:
+                    oldest = self._pop_earliest_locked()
+                    if oldest is None:
+                        break
+                    evicted.append(oldest)
+                    self.evicted_count += 1
+                    if self.journal:
+                        self.journal.record_remove(oldest[0], len(self._entries))
+
+            deadline = self.clock() + timeout_seconds
+            now = time.time()
+            entry = {
+                "score": score,
+                "timestamp": now,
+                "deadline": deadline,
+                "expires_at": now + timeout_seconds,
+                "initial_data": initial_data,
+            }
+            entry.update(extra)
+            self._entries[event_id] = entry
+            heapq.heappush(self._heap, (deadline, next(self._sequence), event_id))
+            self._compact_locked()
+            if self.journal:
+                self.journal.record_add(event_id, entry, len(self._entries))
+
+        for evicted_id, evicted_entry in evicted:
+            logging.warning(f"Pending inquiry store full ({self.max_size}). Evicted oldest event {evicted_id}.")
+            if self.on_evict:
+                self.on_evict(evicted_id, evicted_entry)
+        return True
+
+    def pop(self, event_id):
+        """Removes and returns the entry for event_id, or None if it is unknown or already expired."""
+        with self._lock:
+            # The heap item is left behind and skipped when it surfaces
+            entry = self._entries.pop(event_id, None)
+            if entry is not None and self.journal:
+                self.journal.record_remove(event_id, len(self._entries))
+            return entry
+
+    def update_score(self, event_id, score):
+        """Sets the base score of a pending entry. Returns False if it is no longer pending."""
+        with self._lock:
+            entry = self._entries.get(event_id)
+            if entry is None:
+                return False
+            entry["score"] = score
+            if self.journal:
+                self.journal.record_score(event_id, score, len(self._entries))
+            return True
+
+    def expire(self, now=None):
+        """Removes every entry whose deadline has passed and returns them as (event_id, entry) pairs."""
+        expired = []
+        with self._lock:
+            now = self.clock() if now is None else now
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, event_id = heapq.heappop(self._heap)
+                entry = self._entries.get(event_id)
+                if entry is not None and entry["deadline"] == deadline:
+                    del self._entries[event_id]
+                    expired.append((event_id, entry))
+                    if self.journal:
+                        self.journal.record_remove(event_id, len(self._entries))
+            self.expired_count += len(expired)
+
+        if self.on_expire:
+            for event_id, entry in expired:
+                self.on_expire(event_id, entry)
+        return expired
+
+    def restore(self):
+        """Reloads pending entries from the journal and compacts it. Returns the number restored.
+
+        Entries whose deadline passed while the scorer was down are restored as already due, so the
+        next expiry tick applies the timeout action to them.
+        """
+        if not self.journal:
+            return 0
+        records = self.journal.replay()
+        # Keep the entries with the latest deadlines if the journal holds more than the store may
+        records = sorted(records.items(), key=lambda item: item[1].get("expires_at", 0))[-self.max_size:]
+        with self._lock:
+            now, wall_now = self.clock(), time.time()
+            for event_id, record in records:
+                entry = {key: value for key, value in record.items() if key not in ("op", "id")}
+                entry["deadline"] = now + max(0.0, entry.get("expires_at", wall_now) - wall_now)
+                entry.setdefault("expires_at", wall_now)
+                self._entries[event_id] = entry
+                heapq.heappush(self._heap, (entry["deadline"], next(self._sequence), event_id))
+            self.journal.rewrite(self._entries)
+        return len(records)
+
+    def compact_journal(self):
+        """Rewrites the journal as a snapshot of the current entries."""
+        with self._lock:
+            self.journal.rewrite(self._entries)
+
+    def start(self, tick_interval=1.0):
+        """Starts a background thread that expires entries every tick_interval seconds."""
+        if self._tick_thread:
+            return
+        self._stop_event.clear()
+        self._tick_thread = threading.Thread(target=self._tick_loop, args=(tick_interval,),
+                                             name="scorer-pending-expiry", daemon=True)
+        self._tick_thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stops the background expiry thread."""
+        if not self._tick_thread:
+            return
+        self._stop_event.set()
+        self._tick_thread.join(timeout)
+        self._tick_thread = None
+
+    def stats(self):
+        """Returns a snapshot of store size and expiry/eviction counters."""
+        return {
+            "size": len(self._entries),
+            "heap_size": len(self._heap),
+            "expired": self.expired_count,
+            "evicted": self.evicted_count,
+            "rejected": self.rejected_count,
+        }
+
+    def _tick_loop(self, tick_interval):
+        while not self._stop_event.wait(tick_interval):
+            try:
+                self.expire()
+            except Exception as e:
+                logging.error(f"Error expiring pending inquiries: {e}")
+
+    def _pop_earliest_locked(self):
+        while self._heap:
+            deadline, _, event_id = heapq.heappop(self._heap)
+            entry = self._entries.get(event_id)
+            if entry is not None and entry["deadline"] == deadline:
+                del self._entries[event_id]
+                return event_id, entry
+        return None
+
+    def _compact_locked(self):
+        # Rebuild the heap once stale items (from pop() or replaced entries) dominate it
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(entry["deadline"], next(self._sequence), event_id)
+                          for event_id, entry in self._entries.items()]
+            heapq.heapify(self._heap)
@@ -0,0 +1,184 @@
+# scorer_pipeline.py
+# Bounded, partitioned worker pipeline for scorer.py.
+# The paho network thread only enqueues raw MQTT messages here; a pool of worker
+# threads then decodes, scores and publishes them. Messages are partitioned by
+# event ID so that every message for a given event is handled by the same worker,
+# in arrival order.
+
+import re
+import queue
+import threading
+import zlib
+import logging
+
+# Drop policies applied when a worker queue is full
+DROP_POLICY_BLOCK = "block"              # Wait up to block_timeout for space, then drop the new message
+DROP_POLICY_DROP_NEWEST = "drop_newest"  # Drop the incoming message immediately
+DROP_POLICY_DROP_OLDEST = "drop_oldest"  # Evict the oldest queued message to make room
+DROP_POLICIES = (DROP_POLICY_BLOCK, DROP_POLICY_DROP_NEWEST, DROP_POLICY_DROP_OLDEST)
+
+# Cheap event ID extraction from the raw payload, so the network thread never has to
+# decode JSON. Frigate and audio result payloads both carry the event ID in an "id" field;
+# in Frigate's before/after blocks every "id" is the same event ID, so the first match is enough.
+_EVENT_ID_PATTERN = re.compile(rb'"id"\s*:\s*"([^"]+)"')
+
+_STOP = object() # Sentinel telling a worker thread to exit
+
+def extract_partition_key(msg):
+    """Returns the event ID found in the raw payload, falling back to the topic."""
+    match = _EVENT_ID_PATTERN.search(msg.payload or b"")
+    if match:
+        return match.group(1)
+    return msg.topic.encode()
+
+class WorkerPipeline:
+    """Dispatches MQTT messages to a pool of worker threads with bounded queues."""
+
+    def __init__(self, worker_count=2, queue_maxsize=1000, drop_policy=DROP_POLICY_DROP_OLDEST,
+                 block_timeout=0.5, metrics_interval=30.0):
+        if worker_count < 1:
+            raise ValueError(f"worker_count must be at least 1, got {worker_count}")
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}'. Expected one of {DROP_POLICIES}.")
+        self.worker_count = worker_count
+        self.queue_maxsize = queue_maxsize
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.metrics_interval = metrics_interval
+
+        self._queues = [queue.Queue(maxsize=queue_maxsize) for _ in range(worker_count)]
+        self._threads = []
+        self._metrics_thread = None
+        self._stop_event = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._enqueued = 0
+        self._processed = 0
+        self._dropped = 0
+        self._errors = 0
+        self._high_water = [0] * worker_count
+
+    def start(self):
+        """Starts the worker threads (and the periodic metrics logger, if enabled)."""
+        for index in range(self.worker_count):
+            thread = threading.Thread(target=self._worker_loop, args=(index,),
+                                      name=f"scorer-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.metrics_interval > 0:
+            self._metrics_thread = threading.Thread(target=self._metrics_loop,
+                                                    name="scorer-pipeline-metrics", daemon=True)
+            self._metrics_thread.start()
+        logging.info(f"Worker pipeline started: {self.worker_count} worker(s), queue size {self.queue_maxsize}, "
+                     f"drop policy '{self.drop_policy}'.")
+
+    def stop(self, timeout=5.0):
+        """Signals the workers to finish their queued messages and exit."""
+        self._stop_event.set()
+        for work_queue in self._queues:
+            try:
+                work_queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logging.warning("Worker queue still full during shutdown; queued messages will be discarded.")
+        for thread in self._threads:
+            thread.join(timeout)
+        logging.info(f"Worker pipeline stopped. Final metrics: {self.stats()}")
+
+    def wrap(self, handler):
+        """Returns a paho message callback that enqueues messages for `handler` instead of running it inline."""
+        def enqueue_callback(client, userdata, msg):
+            self.submit(handler, client, userdata, msg)
+        return enqueue_callback
+
+    def submit(self, handler, client, userdata, msg):
+        """Enqueues a message on its partition's worker queue. Returns False if the message was dropped."""
+        key = extract_partition_key(msg)
+        index = zlib.crc32(key) % self.worker_count
+        work_queue = self._queues[index]
+        item = (handler, client, userdata, msg)
+
+        if self.drop_policy == DROP_POLICY_BLOCK:
+            try:
+                work_queue.put(item, timeout=self.block_timeout)
+            except queue.Full:
+                self._record_drop(msg, index)
+                return False
+        elif self.drop_policy == DROP_POLICY_DROP_NEWEST:
+            try:
+                work_queue.put_nowait(item)
+            except queue.Full:
+                self._record_drop(msg, index)
+                return False
+        else: # DROP_POLICY_DROP_OLDEST
+            while True:
+                try:
+                    work_queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        evicted = work_queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    work_queue.task_done()
+                    if evicted is _STOP:
+                        # The pipeline is stopping: keep the sentinel and drop the new message instead
+                        work_queue.put(_STOP)
+                        self._record_drop(msg, index)
+                        return False
+                    self._record_drop(evicted[3], index)
+
+        depth = work_queue.qsize()
+        with self._stats_lock:
+            self._enqueued += 1
+            if depth > self._high_water[index]:
+                self._high_water[index] = depth
+        return True
+
+    def stats(self):
+        """Returns a snapshot of queue depths and message counters."""
+        with self._stats_lock:
+            return {
+                "queue_depths": [work_queue.qsize() for work_queue in self._queues],
+                "queue_high_water": list(self._high_water),
+                "enqueued": self._enqueued,
+                "processed": self._processed,
+                "dropped": self._dropped,
+                "errors": self._errors,
+            }
+
+    def _record_drop(self, msg, index):
+        with self._stats_lock:
+            self._dropped += 1
+        logging.warning(f"Worker queue {index} full; dropped message on topic {msg.topic} "
+                        f"(policy '{self.drop_policy}').")
+
+    def _worker_loop(self, index):
+        work_queue = self._queues[index]
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                work_queue.task_done()
+                return
+            handler, client, userdata, msg = item
+            try:
+                handler(client, userdata, msg)
+            except Exception as e:
+                # Handlers log their own errors; this only guards the worker thread itself.
+                logging.error(f"Unhandled error in worker {index} processing topic {msg.topic}: {e}")
+                with self._stats_lock:
+                    self._errors += 1
+            finally:
+                with self._stats_lock:
+                    self._processed += 1
+                work_queue.task_done()
+
+    def _metrics_loop(self):
+        while not self._stop_event.wait(self.metrics_interval):
+            logging.info(f"Worker pipeline metrics: {self.stats()}")
+            with self._stats_lock:
+                # High-water marks are reported per interval
+                self._high_water = [work_queue.qsize() for work_queue in self._queues]
+
+    def wait_idle(self):
+        """Blocks until every queued message has been processed (used by replay tools)."""
+        for work_queue in self._queues:
+            work_queue.join()
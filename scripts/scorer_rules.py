@@ -0,0 +1,290 @@
+# scorer_rules.py
+# Data-driven scoring rules for scorer.py.
+# Rules are loaded from a JSON or YAML file (or built from the SCORE_* environment defaults)
+# and compiled once into flat predicate closures. Evaluating an event is then a single pass
+# over (predicate, weight) pairs with no per-rule logging or config lookups.
+#
+# Rule file format (YAML shown, JSON uses the same structure):
+#
+#   thresholds:
+#     alarm: 0.8
+#     inquiry: 0.3
+#   visual_rules:
+#     - name: weapon
+#       weight: 0.5
+#       any:                              # Matches if any condition matches
+#         - {field: extras.weapon, op: truthy}
+#         - {field: attributes.weapon, op: truthy}
+#     - name: pose_crouch_prone
+#       weight: 0.15
+#       field: attributes.pose            # Dotted path into the event's "after" block
+#       op: in
+#       value: [crouch, prone]
+#   audio_rules:
+#     - name: calm_delivery
+#       weight: -0.2
+#       all:                              # Matches if every condition matches
+#         - {field: transcript, op: keywords, value: [delivery]}
+#         - {field: tone, op: ne, value: negative}
+#
+# Supported ops: eq, ne, in, not_in, truthy, falsy, empty, contains, contains_any, keywords, gt, gte, lt, lte.
+# "contains"/"contains_any" are plain substring checks; "keywords" matches whole words and phrases
+# (with "word*" prefixes) case-insensitively via keyword_matcher.py.
+#
+# For Frigate update streams, rescore_visual() does delta scoring: it extracts only the fields
+# the visual rules read, compares them with the previous update of the same track and re-evaluates
+# just the rules whose inputs changed.
+
+import os
+import json
+import threading
+import logging
+
+from keyword_matcher import KeywordMatcher
+
+# Optional YAML support
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+_MISSING = object()
+
+def _compile_accessor(path):
+    """Compiles a dotted field path into a closure that walks nested dicts."""
+    keys = tuple(path.split("."))
+    if len(keys) == 1:
+        key = keys[0]
+        def get_single(data):
+            return data.get(key, _MISSING)
+        return get_single
+
+    def get_nested(data):
+        value = data
+        for key in keys:
+            if not isinstance(value, dict):
+                return _MISSING
+            value = value.get(key, _MISSING)
+            if value is _MISSING:
+                return _MISSING
+        return value
+    return get_nested
+
+def _compile_condition(condition):
+    """Compiles a single {field, op, value} condition (or a nested any/all group) into a predicate."""
+    if "any" in condition:
+        predicates = tuple(_compile_condition(c) for c in condition["any"])
+        return lambda data: any(p(data) for p in predicates)
+    if "all" in condition:
+        predicates = tuple(_compile_condition(c) for c in condition["all"])
+        return lambda data: all(p(data) for p in predicates)
+
+    if "field" not in condition:
+        raise ValueError(f"Rule condition is missing 'field': {condition}")
+    get = _compile_accessor(condition["field"])
+    op = condition.get("op", "truthy")
+    value = condition.get("value")
+
+    if op == "eq":
+        return lambda data: get(data) == value
+    if op == "ne":
+        return lambda data: get(data) != value
+    if op in ("in", "not_in"):
+        members = frozenset(value or ())
+        if op == "in":
+            return lambda data: _hashable(get(data)) in members
+        return lambda data: _hashable(get(data)) not in members
+    if op == "truthy":
+        return lambda data: _truthy(get(data))
+    if op == "falsy":
+        return lambda data: not _truthy(get(data))
+    if op == "empty":
+        return lambda data: not str(_or_empty(get(data))).strip()
+    if op == "contains":
+        return lambda data: value in str(_or_empty(get(data)))
+    if op == "contains_any":
+        needles = tuple(value or ())
+        def contains_any(data):
+            text = str(_or_empty(get(data)))
+            return any(needle in text for needle in needles)
+        return contains_any
+    if op == "keywords":
+        matcher = KeywordMatcher({"keywords": [value] if isinstance(value, str) else value or ()})
+        return lambda data: matcher.search(str(_or_empty(get(data))))
+    if op in ("gt", "gte", "lt", "lte"):
+        threshold = float(value)
+        compare = {
+            "gt": lambda x: x > threshold,
+            "gte": lambda x: x >= threshold,
+            "lt": lambda x: x < threshold,
+            "lte": lambda x: x <= threshold,
+        }[op]
+        def numeric(data):
+            field_value = get(data)
+            return isinstance(field_value, (int, float)) and compare(field_value)
+        return numeric
+    raise ValueError(f"Unknown rule op '{op}' in condition: {condition}")
+
+def _condition_fields(condition):
+    """Returns the set of field paths a condition (or nested group) reads."""
+    if "any" in condition or "all" in condition:
+        fields = set()
+        for c in condition.get("any", ()) or condition.get("all", ()):
+            fields |= _condition_fields(c)
+        return fields
+    return {condition["field"]} if "field" in condition else set()
+
+def _truthy(value):
+    return value is not _MISSING and bool(value)
+
+def _or_empty(value):
+    return "" if value is _MISSING or value is None else value
+
+def _hashable(value):
+    return value if isinstance(value, (str, int, float, bool, type(None))) else _MISSING
+
+class VisualScore:
+    """Result of scoring one detection block, kept per track for delta scoring."""
+    __slots__ = ("rules", "field_values", "matches", "score")
+
+    def __init__(self, rules, field_values, matches, score):
+        self.rules = rules               # CompiledRules instance that produced this score
+        self.field_values = field_values # Tuple of extracted values, one per visual field path
+        self.matches = matches           # Tuple of booleans, one per visual rule
+        self.score = score
+
+    @property
+    def matched_rules(self):
+        return [rule[0] for rule, matched in zip(self.rules.visual_rules, self.matches) if matched]
+
+class CompiledRules:
+    """An immutable, compiled rule set. Swapped atomically on reload."""
+
+    def __init__(self, visual_rules, audio_rules, alarm_threshold, inquiry_threshold, source,
+                 visual_field_paths=(), visual_rule_deps=()):
+        self.visual_rules = visual_rules # Tuple of (name, predicate, weight)
+        self.audio_rules = audio_rules
+        self.alarm_threshold = alarm_threshold
+        self.inquiry_threshold = inquiry_threshold
+        self.source = source
+        # Delta scoring support: the field paths visual rules read, and per field the rules reading it
+        self.visual_field_paths = visual_field_paths
+        self._visual_field_accessors = tuple(_compile_accessor(path) for path in visual_field_paths)
+        self._rules_by_field = tuple(
+            tuple(rule_index for rule_index, deps in enumerate(visual_rule_deps) if field_index in deps)
+            for field_index in range(len(visual_field_paths)))
+
+    def score_visual(self, data):
+        """Returns (score, matched_rule_names) for a Frigate/CPAI event's detection block."""
+        return _evaluate(self.visual_rules, data)
+
+    def rescore_visual(self, data, previous=None):
+        """Scores a detection block, re-evaluating only rules whose fields changed since `previous`.
+
+        Returns a new VisualScore. A full evaluation is done when there is no previous score or
+        it was produced by a different (e.g. since reloaded) rule set.
+        """
+        field_values = tuple(get(data) for get in self._visual_field_accessors)
+        rules = self.visual_rules
+        if previous is None or previous.rules is not self:
+            matches = tuple(predicate(data) for _, predicate, _ in rules)
+            score = sum(rules[i][2] for i, matched in enumerate(matches) if matched)
+            return VisualScore(self, field_values, matches, score)
+
+        if field_values == previous.field_values:
+            return previous
+
+        dirty = set()
+        for field_index, (old, new) in enumerate(zip(previous.field_values, field_values)):
+            if old != new:
+                dirty.update(self._rules_by_field[field_index])
+        matches = list(previous.matches)
+        score = previous.score
+        for rule_index in dirty:
+            _, predicate, weight = rules[rule_index]
+            matched = predicate(data)
+            if matched != matches[rule_index]:
+                matches[rule_index] = matched
+                score += weight if matched else -weight
+        return VisualScore(self, field_values, tuple(matches), score)
+
+    def score_audio(self, audio_data):
+        """Returns (score_delta, matched_rule_names) for a normalised audio result."""
+        return _evaluate(self.audio_rules, audio_data)
+
+def _evaluate(rules, data):
+    score = 0.0
+    matched = []
+    for name, predicate, weight in rules:
+        if predicate(data):
+            score += weight
+            matched.append(name)
+    return score, matched
+
+def compile_rules(config, default_thresholds=(0.8, 0.3), source="<defaults>"):
+    """Compiles a rules config dict into a CompiledRules instance. Raises ValueError if invalid."""
+    def compile_list(rule_configs):
+        compiled = []
+        for index, rule in enumerate(rule_configs or ()):
+            name = rule.get("name", f"rule_{index}")
+            try:
+                weight = float(rule["weight"])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"Rule '{name}' needs a numeric 'weight'.")
+            compiled.append((name, _compile_condition(rule), weight))
+        return tuple(compiled)
+
+    visual_configs = config.get("visual_rules") or ()
+    field_paths = sorted(set().union(*(_condition_fields(rule) for rule in visual_configs)))
+    field_index = {path: i for i, path in enumerate(field_paths)}
+    rule_deps = tuple(frozenset(field_index[path] for path in _condition_fields(rule)) for rule in visual_configs)
+
+    thresholds = config.get("thresholds", {})
+    return CompiledRules(
+        visual_rules=compile_list(visual_configs),
+        audio_rules=compile_list(config.get("audio_rules")),
+        alarm_threshold=float(thresholds.get("alarm", default_thresholds[0])),
+        inquiry_threshold=float(thresholds.get("inquiry", default_thresholds[1])),
+        source=source,
+        visual_field_paths=tuple(field_paths),
+        visual_rule_deps=rule_deps,
+    )
+
+def load_rules_file(path):
+    """Reads a JSON or YAML rules file into a dict."""
+    with open(path, "r") as f:
+        if path.endswith((".yml", ".yaml")):
+            if yaml is None:
+                raise ValueError(f"PyYAML is not installed; cannot read YAML rules file {path}.")
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+class RuleEngine:
+    """Holds the active compiled rule set and reloads it from disk on request (e.g. SIGHUP)."""
+
+    def __init__(self, default_config, default_thresholds, rules_file=None):
+        self.default_config = default_config
+        self.default_thresholds = default_thresholds
+        self.rules_file = rules_file
+        self._reload_lock = threading.Lock()
+        self.rules = compile_rules(default_config, default_thresholds)
+
+    def reload(self):
+        """(Re)compiles the rules file. On any error the previously active rules stay in place."""
+        with self._reload_lock:
+            if not self.rules_file:
+                self.rules = compile_rules(self.default_config, self.default_thresholds)
+                return True
+            if not os.path.exists(self.rules_file):
+                logging.error(f"Scoring rules file not found: {self.rules_file}. Keeping rules from {self.rules.source}.")
+                return False
+            try:
+                config = load_rules_file(self.rules_file)
+                rules = compile_rules(config, self.default_thresholds, source=self.rules_file)
+            except Exception as e:
+                logging.error(f"Failed to load scoring rules from {self.rules_file}: {e}. Keeping rules from {self.rules.source}.")
+                return False
+            self.rules = rules # Atomic swap; in-flight evaluations keep the old rule set
+            logging.info(f"Loaded {len(rules.visual_rules)} visual and {len(rules.audio_rules)} audio scoring rules "
+                         f"from {self.rules_file} (alarm {rules.alarm_threshold}, inquiry {rules.inquiry_threshold}).")
+            return True
@@ -0,0 +1,131 @@
+# scorer_shards.py
+# Horizontal sharding of scorer.py across processes or hosts.
+# Every scorer in a group subscribes to the Frigate and audio topics through an MQTT shared
+# subscription ($share/<group>/...), so the broker hands each message to just one of them. The
+# event's state (track, pending inquiry) must however live on one shard, so the receiving scorer
+# looks up the event's owner on a consistent-hash ring of the live shards and, if that is another
+# shard, forwards the raw payload to the owner's inbox topic (<topic_base>/<shard_id>/frigate or
+# .../audio). A Frigate event and its audio result therefore always meet on the same shard.
+#
+# Membership: each shard publishes "online" (retained) to <topic_base>/<shard_id>/status and
+# registers "offline" as its MQTT will, and every shard watches <topic_base>/+/status. When a shard
+# joins or leaves, consistent hashing moves only about 1/N of the events to another shard. The
+# previous owner hands their tracks and pending inquiries over on <topic_base>/<new owner>/handover,
+# so replies still in flight are scored; events in flight on a shard that dies are lost unless its
+# pending journal is restored by a replacement.
+#
+# Events are routed by event ID, so cross-camera incidents (scorer_incidents.py) can't be used with
+# sharding: the scorer refuses to start with both enabled.
+
+import bisect
+import hashlib
+import threading
+import logging
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes. Keys and members are strings or bytes."""
+
+    def __init__(self, members=(), vnodes=64):
+        self.vnodes = vnodes
+        self._points = [] # Sorted (hash, member)
+        self._members = set()
+        for member in members:
+            self.add(member)
+
+    @property
+    def members(self):
+        return sorted(self._members)
+
+    def add(self, member):
+        if member in self._members:
+            return False
+        self._members.add(member)
+        for i in range(self.vnodes):
+            bisect.insort(self._points, (_hash(f"{member}#{i}".encode()), member))
+        return True
+
+    def remove(self, member):
+        if member not in self._members:
+            return False
+        self._members.discard(member)
+        self._points = [point for point in self._points if point[1] != member]
+        return True
+
+    def owner(self, key):
+        """Returns the member owning key, or None if the ring is empty."""
+        if not self._points:
+            return None
+        if isinstance(key, str):
+            key = key.encode()
+        index = bisect.bisect(self._points, (_hash(key), "")) % len(self._points)
+        return self._points[index][1]
+
+class ShardRouter:
+    """Routes scorer messages to the shard that owns their event ID."""
+
+    def __init__(self, shard_id, group, topic_base="vz/scorer/shard", vnodes=64):
+        if not shard_id or "/" in shard_id or "+" in shard_id or "#" in shard_id:
+            raise ValueError(f"Invalid shard ID '{shard_id}'.")
+        self.shard_id = shard_id
+        self.group = group
+        self.topic_base = topic_base
+        self._ring = HashRing([shard_id], vnodes) # This shard is always a member
+        self._lock = threading.Lock()
+        self.local_count = 0
+        self.forwarded_count = 0
+
+    # --- Topics ---
+    def shared(self, topic_filter):
+        """The shared-subscription form of a topic filter."""
+        return f"$share/{self.group}/{topic_filter}"
+
+    def inbox_topic(self, kind, shard_id=None):
+        """Topic on which shard_id (default: this shard) receives forwarded messages of kind ("frigate" or "audio")."""
+        return f"{self.topic_base}/{shard_id or self.shard_id}/{kind}"
+
+    def status_topic(self, shard_id=None):
+        return f"{self.topic_base}/{shard_id or self.shard_id}/status"
+
+    def status_filter(self):
+        return f"{self.topic_base}/+/status"
+
+    # --- Membership ---
+    @property
+    def members(self):
+        with self._lock:
+            return self._ring.members
+
+    def handle_status(self, topic, payload):
+        """Updates membership from a <topic_base>/<shard_id>/status message. Returns True if the ring changed."""
+        shard_id = topic[len(self.topic_base) + 1:].split("/", 1)[0]
+        online = payload.decode(errors="replace").strip().lower() == "online" if isinstance(payload, bytes) else payload == "online"
+        if shard_id == self.shard_id:
+            return False # Never drop ourselves, e.g. on our own stale "offline" will after a restart
+        with self._lock:
+            changed = self._ring.add(shard_id) if online else self._ring.remove(shard_id)
+            members = self._ring.members
+        if changed:
+            logging.info(f"Scorer shard {shard_id} is {'online' if online else 'offline'}. Shards: {members}")
+        return changed
+
+    # --- Routing ---
+    def owner(self, key):
+        with self._lock:
+            return self._ring.owner(key)
+
+    def route(self, kind, key, payload, publish):
+        """Returns True if this shard owns key; otherwise forwards payload to the owner's inbox with publish(topic, payload, qos=1)."""
+        owner = self.owner(key)
+        if owner is None or owner == self.shard_id:
+            self.local_count += 1
+            return True
+        publish(self.inbox_topic(kind, owner), payload, qos=1)
+        self.forwarded_count += 1
+        return False
+
+    def stats(self):
+        return {"shard_id": self.shard_id, "members": self.members,
+                "local": self.local_count, "forwarded": self.forwarded_count}
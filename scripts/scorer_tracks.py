@@ -0,0 +1,98 @@
+# scorer_tracks.py
+# Per-event track state for scorer.py.
+# Frigate publishes a stream of "update" messages for every tracked object. The scorer keeps
+# the last scored attribute vector for each event_id here so each update can be rescored
+# incrementally (see CompiledRules.rescore_visual) and so decisions already taken for a track
+# (alarm raised, inquiry sent) are not repeated. Tracks are dropped on Frigate "end" events,
+# after an idle timeout, or when the store reaches its size bound (least recently updated first).
+
+import time
+import threading
+from collections import OrderedDict
+
+class TrackState:
+    """Scoring state for a single Frigate event_id."""
+    __slots__ = ("event_id", "visual_score", "score", "alarmed", "inquired", "updates", "first_seen", "last_seen")
+
+    def __init__(self, event_id, now):
+        self.event_id = event_id
+        self.visual_score = None # scorer_rules.VisualScore from the last update
+        self.score = 0.0         # Rounded score from the last update
+        self.alarmed = False     # An alarm has been raised for this track
+        self.inquired = False    # An audio inquiry has been sent for this track
+        self.updates = 0
+        self.first_seen = now    # When the track was created (the Frigate "new" event, normally)
+        self.last_seen = now
+
+class TrackStore:
+    """Bounded, thread-safe map of event_id -> TrackState in least-recently-updated order."""
+
+    def __init__(self, max_tracks=5000, idle_timeout_seconds=600, clock=time.monotonic):
+        self.max_tracks = max_tracks
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.clock = clock
+        self._tracks = OrderedDict()
+        self._lock = threading.Lock()
+        self.ended_count = 0
+        self.evicted_count = 0
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __contains__(self, event_id):
+        return event_id in self._tracks
+
+    def get(self, event_id):
+        """Returns the TrackState for event_id without updating it, or None."""
+        return self._tracks.get(event_id)
+
+    def touch(self, event_id):
+        """Returns the TrackState for event_id, creating it if needed, and marks it as most recent."""
+        with self._lock:
+            now = self.clock()
+            track = self._tracks.get(event_id)
+            if track is None:
+                track = TrackState(event_id, now)
+                self._tracks[event_id] = track
+            else:
+                self._tracks.move_to_end(event_id)
+            track.last_seen = now
+            track.updates += 1
+            self._evict_locked(now)
+            return track
+
+    def event_ids(self):
+        """Returns a snapshot of the tracked event IDs."""
+        with self._lock:
+            return list(self._tracks)
+
+    def pop(self, event_id):
+        """Removes and returns the track for event_id without counting it as ended (e.g. handed to another shard)."""
+        with self._lock:
+            return self._tracks.pop(event_id, None)
+
+    def end(self, event_id):
+        """Removes and returns the track for event_id (Frigate "end" event), or None."""
+        with self._lock:
+            track = self._tracks.pop(event_id, None)
+            if track is not None:
+                self.ended_count += 1
+            return track
+
+    def stats(self):
+        """Returns a snapshot of track counts."""
+        return {
+            "tracks": len(self._tracks),
+            "ended": self.ended_count,
+            "evicted": self.evicted_count,
+        }
+
+    def _evict_locked(self, now):
+        # The OrderedDict is ordered by last update, so idle and overflow tracks are always at the front
+        while self._tracks:
+            oldest_id, oldest = next(iter(self._tracks.items()))
+            if len(self._tracks) > self.max_tracks or now - oldest.last_seen > self.idle_timeout_seconds:
+                del self._tracks[oldest_id]
+                self.evicted_count += 1
+            else:
+                break
@@ -0,0 +1,360 @@
+# service_metrics.py
+# Minimal in-process metrics shared by scorer.py and audio_service.py: counters, gauges and
+# latency histograms, exposed in the Prometheus text format on a local HTTP /metrics endpoint and
+# optionally published as a JSON snapshot to an MQTT stats topic.
+# No third-party dependency. When a registry is created with enabled=False every metric is a
+# shared no-op object, so instrumented hot paths cost one attribute lookup and an empty call.
+#
+# Like keyword_matcher.py, this file lives in scripts/ and the audio service adds scripts/ to
+# sys.path; the Docker images copy it next to each service.
+
+import json
+import time
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from sub-millisecond scoring up to multi-second transcription
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+class _NullMetric:
+    """Stands in for every metric type when metrics are disabled."""
+    __slots__ = ()
+    _timer = _NullTimer()
+
+    def labels(self, *values, **labels):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return self._timer
+
+    def wrap(self, func):
+        return func
+
+NULL_METRIC = _NullMetric()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    """Base for labelled metrics: children are created per distinct label value tuple."""
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values, **labels):
+        """Returns the child metric for the given label values (positional or by name)."""
+        if labels:
+            values = tuple(str(labels[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self._children[()]
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yields (suffix, label values, extra label, value) for the text exposition."""
+        raise NotImplementedError
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class Counter(_Metric):
+    """Monotonically increasing count. Name it with a _total suffix."""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield "", values, "", child.value
+
+class _GaugeChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+class Gauge(_Metric):
+    """Value that goes up and down; with fn, it is read from a callback at collection time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), fn=None):
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def samples(self):
+        if self.fn is not None:
+            try:
+                yield "", (), "", float(self.fn())
+            except Exception as e:
+                logging.debug(f"Gauge {self.name} callback failed: {e}")
+            return
+        for values, child in list(self._children.items()):
+            yield "", values, "", child.value
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self):
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self)
+
+    def wrap(self, func):
+        """Returns func wrapped so every call is timed."""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - start)
+        return timed
+
+    def quantile(self, q):
+        """Estimates a quantile as the upper bound of the bucket containing it."""
+        with self._lock:
+            target = q * self.count
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                if cumulative >= target and self.count:
+                    return bound
+        return self.buckets[-1] if self.count else 0.0 # Overflow reported as the largest bound
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds, by default) in cumulative buckets."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def wrap(self, func):
+        return self._default().wrap(func)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", values, f'le="{bound}"', cumulative
+            yield "_bucket", values, 'le="+Inf"', count
+            yield "_sum", values, "", total
+            yield "_count", values, "", count
+
+class MetricsRegistry:
+    """Creates and exports metrics. With enabled=False all metrics are no-ops and nothing is served."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+        self._stop_event = threading.Event()
+        self._http_server = None
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames)) if self.enabled else NULL_METRIC
+
+    def gauge(self, name, documentation, labelnames=(), fn=None):
+        return self._register(Gauge(name, documentation, labelnames, fn)) if self.enabled else NULL_METRIC
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets)) if self.enabled else NULL_METRIC
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, values, extra, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(metric.labelnames, values, extra)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Returns a compact JSON-friendly summary (histograms as count/mean/p50/p99) for the MQTT stats topic."""
+        summary = {}
+        for metric in self._metrics:
+            if isinstance(metric, Histogram):
+                entries = {}
+                for values, child in list(metric._children.items()):
+                    if child.count:
+                        entries[",".join(values) or "all"] = {
+                            "count": child.count,
+                            "mean_ms": round(child.sum / child.count * 1000, 3),
+                            "p50_ms": round(child.quantile(0.50) * 1000, 3),
+                            "p99_ms": round(child.quantile(0.99) * 1000, 3),
+                        }
+                summary[metric.name] = entries
+            else:
+                samples = [(values, value) for _, values, _, value in metric.samples()]
+                if len(samples) == 1 and not samples[0][0]:
+                    summary[metric.name] = samples[0][1]
+                else:
+                    summary[metric.name] = {",".join(values): value for values, value in samples}
+        return summary
+
+    def start_http_server(self, port, host="0.0.0.0"):
+        """Serves GET /metrics on a background thread (no-op when disabled or port is 0)."""
+        if not self.enabled or not port:
+            return
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Scrapes are not worth a log line each
+
+        self._http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._http_server.daemon_threads = True
+        threading.Thread(target=self._http_server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def start_publisher(self, publish_fn, interval):
+        """Calls publish_fn(json_snapshot) every interval seconds (no-op when disabled or interval <= 0)."""
+        if not self.enabled or interval <= 0:
+            return
+
+        def publish_loop():
+            while not self._stop_event.wait(interval):
+                try:
+                    publish_fn(json.dumps({"timestamp": time.time(), "metrics": self.snapshot()}))
+                except Exception as e:
+                    logging.error(f"Error publishing metrics snapshot: {e}")
+        threading.Thread(target=publish_loop, name="metrics-publisher", daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._http_server:
+            self._http_server.shutdown()
@@ -0,0 +1,8 @@
+# conftest.py
+# Makes the scorer modules in scripts/ importable from the tests.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("USE_GPIO", "false")
@@ -0,0 +1,100 @@
+# cpai_stub.py
+# A local http.server standing in for Frigate's snapshot API and CodeProject.AI, for scorer_enrich.py tests.
+#
+# Snapshots are served from `snapshots` (event_id -> JPEG bytes; unknown events get a 404). The CPAI
+# routes answer from the snapshot's bytes: /v1/vision/custom/weapons finds a gun in images containing
+# b"armed", /v1/vision/custom/clothing_custom a mask in images containing b"masked", and
+# /v1/vision/detection always finds a person. Routes in `failing_routes` return HTTP 500.
+
+import json
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like Frigate and CPAI
+    wbufsize = -1 # Buffer each response into one write; unbuffered headers hit Nagle + delayed ACK
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.stub.lock:
+            self.server.stub.connections.discard(self.connection)
+        super().finish()
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.record("GET", self.path)
+        parts = self.path.split("?")[0].split("/") # /api/events/<id>/snapshot.jpg
+        image = stub.snapshots.get(parts[3]) if len(parts) == 5 else None
+        if image is None:
+            self._send(404, b"Event not found", "text/plain")
+        else:
+            self._send(200, image, "image/jpeg")
+
+    def do_POST(self):
+        stub = self.server.stub
+        stub.record("POST", self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path in stub.failing_routes:
+            self._send(500, b"Internal Server Error", "text/plain")
+            return
+        predictions = []
+        if self.path == "/v1/vision/custom/weapons" and b"armed" in body:
+            predictions = [{"label": "gun", "confidence": 0.9}]
+        elif self.path == "/v1/vision/custom/clothing_custom" and b"masked" in body:
+            predictions = [{"label": "Mask", "confidence": 0.8}]
+        elif self.path == "/v1/vision/detection":
+            predictions = [{"label": "person", "confidence": 0.9}]
+        self._send(200, json.dumps({"success": True, "predictions": predictions}).encode(), "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+class StubServer:
+    """Frigate and CPAI on one local port. Use as a context manager; url is http://127.0.0.1:<port>."""
+
+    def __init__(self):
+        self.snapshots = {}
+        self.failing_routes = set()
+        self.requests = [] # (method, path)
+        self.connections = set()
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), name="cpai-stub", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.drop_connections()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def record(self, method, path):
+        with self.lock:
+            self.requests.append((method, path))
+
+    def drop_connections(self):
+        """Closes every kept-alive connection from the server side, as an idle timeout would."""
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
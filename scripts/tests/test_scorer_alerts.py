@@ -0,0 +1,67 @@
+# test_scorer_alerts.py
+# Rate limiting and coalescing in AlertCoalescer.
+
+from scorer_alerts import AlertCoalescer
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_coalescer(clock, published, **kwargs):
+    options = {"window_seconds": 10, "rate_per_minute": 1, "burst": 1}
+    options.update(kwargs)
+    return AlertCoalescer(published.append, clock=clock, **options)
+
+def alert(event_id, score=0.9):
+    return {"event_id": event_id, "final_score": score}
+
+def test_expired_window_waits_for_a_token():
+    clock, published = Clock(), []
+    coalescer = make_coalescer(clock, published)
+    for at in (0, 5, 10.5):
+        clock.now = at
+        coalescer.submit("cam", alert(str(at)))
+    assert len(published) == 1
+
+    # The held alarms go out once the bucket refills, as a single coalesced alert
+    for at in range(11, 130):
+        clock.now = at
+        coalescer.flush_due()
+    assert len(published) == 2
+    assert published[1]["type"] == "coalesced"
+    assert published[1]["suppressed"] == 2
+
+def test_overflow_respects_rate_limit():
+    clock, published = Clock(), []
+    coalescer = make_coalescer(clock, published, max_keys=2)
+    coalescer.submit("a", alert("a1"))
+    coalescer.submit("a", alert("a2")) # Merged into a's window
+    coalescer.submit("b", alert("b1")) # Rate limited: held in b's window
+    coalescer.submit("c", alert("c1")) # Overflow with an empty bucket
+    assert len(published) == 1
+    assert coalescer.stats()["open_windows"] <= 2
+    assert coalescer.stats()["dropped"] == 1
+
+def test_rearmed_window_merges_into_new_window():
+    clock, published = Clock(), []
+    coalescer = make_coalescer(clock, published)
+    coalescer.submit("cam", alert("1"))
+    clock.now = 5
+    coalescer.submit("cam", alert("2"))
+
+    # Simulate submit() opening a new window between flush_due popping the old one and re-arming it
+    clock.now = 11
+    original_take = coalescer._take_token
+    def take_after_submit():
+        coalescer.submit("cam", alert("3"))
+        return original_take()
+    coalescer._take_token = take_after_submit
+    coalescer.flush_due()
+    coalescer._take_token = original_take
+
+    coalescer.flush_due(flush_all=True)
+    merged = sum(item.get("suppressed", 1) for item in published)
+    assert merged == 3
@@ -0,0 +1,24 @@
+# test_scorer_bench.py
+# Replays the committed capture through the scorer and compares its decisions to the golden file.
+# After an intended scoring change, regenerate the golden file from scripts/ with:
+#   python scorer.py bench --capture tests/fixtures/bench_capture.jsonl --write-golden tests/fixtures/bench_golden.jsonl
+
+import os
+
+import pytest
+
+import scorer_bench
+from scorer_instance import load_scorer_module
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CAPTURE = os.path.join(FIXTURES, "bench_capture.jsonl")
+GOLDEN = os.path.join(FIXTURES, "bench_golden.jsonl")
+
+@pytest.mark.parametrize("workers", ["0", "2"])
+def test_capture_matches_golden(capsys, workers):
+    scorer = load_scorer_module()
+    exit_code = scorer_bench.main(scorer, ["bench", "--capture", CAPTURE, "--golden", GOLDEN,
+                                           "--speed", "0", "--workers", workers])
+    output = capsys.readouterr().out
+    assert exit_code == 0, output
+    assert "Decisions match" in output
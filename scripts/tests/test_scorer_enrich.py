@@ -0,0 +1,111 @@
+# test_scorer_enrich.py
+# Enricher outcomes, caching and HTTP handling against the local Frigate/CPAI stub in cpai_stub.py.
+
+import json
+
+import pytest
+
+from cpai_stub import StubServer
+from scorer_enrich import Enricher, load_modules
+
+MODULES = [
+    {"module": "objectdetection.yolov5.onnx", "enabled": True},
+    {"module": "objectdetection.weapons.onnx", "enabled": True},
+    {"module": "classification.clothing_custom.onnx", "enabled": True, "properties": {"MinConfidence": "0.5"}},
+]
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def stub():
+    with StubServer() as server:
+        yield server
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def enricher(stub, clock, tmp_path):
+    modules_file = tmp_path / "modules.json"
+    modules_file.write_text(json.dumps(MODULES))
+    enricher = Enricher(stub.url, stub.url, load_modules(str(modules_file)), refresh_seconds=5.0, clock=clock)
+    yield enricher
+    enricher.close()
+
+def event(frame_time, has_snapshot=True):
+    return {"label": "person", "has_snapshot": has_snapshot, "snapshot": {"frame_time": frame_time}}
+
+def methods(stub):
+    return [method for method, _ in stub.requests]
+
+def test_outcomes(stub, clock, enricher):
+    stub.snapshots["ev1"] = stub.snapshots["ev2"] = b"\xff\xd8masked armed"
+    attributes, outcome = enricher.enrich("ev1", event(1.0))
+    assert outcome == "analysed"
+    assert attributes == {"weapon": True, "clothing": {"mask": True}}
+    assert methods(stub) == ["GET", "POST", "POST", "POST"]
+
+    # Same snapshot, even after refresh_seconds: no HTTP call
+    clock.now = 10
+    assert enricher.enrich("ev1", event(1.0)) == (attributes, "cached")
+    assert len(stub.requests) == 4
+
+    # Another event with the same image: fetched, but the models don't run again
+    assert enricher.enrich("ev2", event(2.0)) == (attributes, "snapshot_cached")
+    assert methods(stub)[4:] == ["GET"]
+
+    # A new snapshot with a new image is analysed
+    stub.snapshots["ev1"] = b"\xff\xd8plain"
+    clock.now = 20
+    assert enricher.enrich("ev1", event(3.0)) == ({}, "analysed")
+    assert enricher.model_run_count == 2
+
+def test_missing_snapshot_is_cached_until_frame_time_changes(stub, clock, enricher):
+    assert enricher.enrich("ev1", event(1.0)) == ({}, "no_snapshot")
+    assert enricher.events.get("ev1").missing
+    clock.now = 60
+    assert enricher.enrich("ev1", event(1.0)) == ({}, "no_snapshot")
+    assert methods(stub) == ["GET"]
+
+    stub.snapshots["ev1"] = b"\xff\xd8armed"
+    attributes, outcome = enricher.enrich("ev1", event(2.0))
+    assert (attributes, outcome) == ({"weapon": True}, "analysed")
+    assert not enricher.events.get("ev1").missing
+
+def test_has_snapshot_false_makes_no_request(stub, enricher):
+    stub.snapshots["ev1"] = b"\xff\xd8armed"
+    assert enricher.enrich("ev1", event(None, has_snapshot=False)) == ({}, "no_snapshot")
+    assert stub.requests == []
+
+def test_stale_kept_alive_connection_is_retried(stub, clock, enricher):
+    stub.snapshots["ev1"] = b"\xff\xd8armed"
+    stub.snapshots["ev2"] = b"\xff\xd8masked"
+    assert enricher.enrich("ev1", event(1.0))[1] == "analysed"
+    created = enricher.frigate.created_count + enricher.cpai.created_count
+
+    stub.drop_connections() # The servers close their idle connections
+    attributes, outcome = enricher.enrich("ev2", event(1.0))
+    assert (attributes, outcome) == ({"clothing": {"mask": True}}, "analysed")
+    assert enricher.frigate.created_count + enricher.cpai.created_count > created
+    assert enricher.failed_count == 0
+
+def test_partial_module_failure_is_not_cached(stub, clock, enricher):
+    stub.snapshots["ev1"] = b"\xff\xd8masked armed"
+    stub.failing_routes.add("/v1/vision/custom/clothing_custom")
+    attributes, outcome = enricher.enrich("ev1", event(1.0))
+    assert (attributes, outcome) == ({"weapon": True}, "failed")
+    assert not enricher.events.get("ev1").complete
+    assert len(enricher.results) == 0
+
+    # Retried once refresh_seconds have passed, even for the same snapshot
+    stub.failing_routes.clear()
+    clock.now = 6
+    attributes, outcome = enricher.enrich("ev1", event(1.0))
+    assert (attributes, outcome) == ({"weapon": True, "clothing": {"mask": True}}, "analysed")
+    assert len(enricher.results) == 1
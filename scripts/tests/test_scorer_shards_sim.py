@@ -0,0 +1,45 @@
+# test_scorer_shards_sim.py
+# Sharded scorer instances (scorer_shards.py) on the in-process broker and simulated clock.
+
+import logging
+
+from scorer_instance import Simulation, simulate
+from test_scorer_sim import FRIGATE_TOPIC, kinds, person, reply
+
+logging.getLogger().setLevel(logging.ERROR)
+
+def shard_env(index):
+    return {"SCORER_SHARD_GROUP": "scorers", "SCORER_SHARD_ID": f"scorer-{index}", "EVENT_TIMEOUT_SECONDS": "60"}
+
+def test_pending_inquiries_follow_their_shard():
+    sim = Simulation()
+    sim.add_scorer(shard_env(1))
+    sim.add_scorer(shard_env(2))
+    event_ids = [f"ev{index}" for index in range(60)]
+    for event_id in event_ids:
+        sim.publish(FRIGATE_TOPIC, person(event_id, camera=f"camera_{len(event_id) % 3}"))
+    assert sorted(event_id for kind, event_id in kinds(sim) if kind == "inquiry") == sorted(event_ids)
+
+    # A third shard takes over part of the ring; its share of the pending inquiries must move with it
+    third = sim.add_scorer(shard_env(3))
+    sim.advance(1)
+    assert len(third.module.pending_events) > 0
+    assert sum(len(scorer.module.pending_events) for scorer in sim.scorers) == 60
+
+    for event_id in event_ids:
+        reply(sim, event_id, "call the police", "negative")
+    sim.stop()
+    assert sorted(event_id for kind, event_id in kinds(sim) if kind == "alert") == sorted(event_ids)
+
+def run_simulation(instances):
+    sim = Simulation()
+    for index in range(instances):
+        sim.add_scorer({"SCORER_SHARD_GROUP": "scorers", "SCORER_SHARD_ID": f"scorer-{index + 1}"} if instances > 1 else {})
+    report = simulate(sim, 500, cameras=8, interval=0.2, reply_rate=0.5, reply_delay=8.0, seed=1)
+    return report, sorted((decision["kind"], decision["event_id"], decision["score"]) for decision in sim.decisions())
+
+def test_sharded_simulation_matches_single_instance():
+    single_report, single = run_simulation(1)
+    sharded_report, sharded = run_simulation(3)
+    assert single_report["decisions"]["inquiry"] > 0 and single_report["decisions"]["alert"] > 0
+    assert sharded == single
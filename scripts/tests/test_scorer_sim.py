@@ -0,0 +1,129 @@
+# test_scorer_sim.py
+# End-to-end decisions of in-process scorer instances on a simulated clock (scorer_instance.py).
+
+import json
+import logging
+
+import pytest
+
+from scorer_instance import Simulation
+
+logging.getLogger().setLevel(logging.ERROR)
+
+FRIGATE_TOPIC = "frigate/events"
+TIMEOUT_TOPIC = "vz/timeout"
+
+def person(event_id, camera="front", weapon=False, event_type="new"):
+    """A Frigate event for a masked person in a hoodie (0.4: inquiry), or armed (0.9: alarm)."""
+    attributes = {"clothing": {"mask": True, "hoodie": True}}
+    if weapon:
+        attributes["weapon"] = True
+    return {"type": event_type, "before": None,
+            "after": {"id": event_id, "camera": camera, "label": "person", "current_zones": [],
+                      "attributes": attributes}}
+
+def reply(sim, event_id, transcript="just visiting a friend", tone="neutral"):
+    sim.publish(f"vz/audio/{event_id}", {"id": event_id, "transcript": transcript, "tone": tone})
+
+def kinds(sim):
+    return [(decision["kind"], decision["event_id"]) for decision in sim.decisions()]
+
+def published(sim, topic):
+    return [json.loads(payload) for published_topic, payload in sim.broker.published if published_topic == topic]
+
+@pytest.fixture
+def sim():
+    simulation = Simulation()
+    yield simulation
+    simulation.stop()
+
+@pytest.mark.parametrize("action", ["drop", "publish", "score_as_silence"])
+def test_eviction_is_not_a_timeout(sim, action):
+    sim.add_scorer({"PENDING_EVENTS_MAX": "1", "EVENT_TIMEOUT_ACTION": action, "SCORE_THRESHOLD_ALARM": "0.45"})
+    sim.publish(FRIGATE_TOPIC, person("first"))
+    sim.publish(FRIGATE_TOPIC, person("second")) # Evicts "first" from the full pending store
+    # Silence would take "first" to 0.5 and alarm; an eviction must never be scored
+    assert ("alert", "first") not in kinds(sim)
+    timeouts = published(sim, TIMEOUT_TOPIC)
+    if action == "publish":
+        assert [(payload["event_id"], payload["reason"]) for payload in timeouts] == [("first", "pending_capacity_evicted")]
+    else:
+        assert timeouts == []
+
+def test_timeout_drop(sim):
+    sim.add_scorer({"EVENT_TIMEOUT_SECONDS": "30", "EVENT_TIMEOUT_ACTION": "drop"})
+    sim.publish(FRIGATE_TOPIC, person("ev1"))
+    sim.advance(31)
+    assert kinds(sim) == [("inquiry", "ev1")]
+    assert len(sim.scorers[0].module.pending_events) == 0
+
+def test_timeout_publish(sim):
+    sim.add_scorer({"EVENT_TIMEOUT_SECONDS": "30", "EVENT_TIMEOUT_ACTION": "publish"})
+    sim.publish(FRIGATE_TOPIC, person("ev1"))
+    sim.advance(29)
+    assert published(sim, TIMEOUT_TOPIC) == []
+    sim.advance(2)
+    assert kinds(sim) == [("inquiry", "ev1"), ("timeout", "ev1")]
+    [payload] = published(sim, TIMEOUT_TOPIC)
+    assert payload["reason"] == "audio_inquiry_timeout"
+    assert payload["score"] == 0.4
+
+def test_timeout_score_as_silence(sim):
+    sim.add_scorer({"EVENT_TIMEOUT_SECONDS": "30", "EVENT_TIMEOUT_ACTION": "score_as_silence",
+                    "SCORE_THRESHOLD_ALARM": "0.45"})
+    sim.publish(FRIGATE_TOPIC, person("ev1"))
+    sim.advance(31)
+    assert kinds(sim) == [("inquiry", "ev1"), ("alert", "ev1")]
+    assert sim.decisions()[1]["score"] == 0.5
+
+def test_reply_before_timeout_is_scored(sim):
+    sim.add_scorer({"EVENT_TIMEOUT_SECONDS": "30", "EVENT_TIMEOUT_ACTION": "publish"})
+    sim.publish(FRIGATE_TOPIC, person("ev1"))
+    sim.advance(10)
+    reply(sim, "ev1", "call the police", "negative")
+    sim.advance(30)
+    assert kinds(sim) == [("inquiry", "ev1"), ("alert", "ev1")]
+
+def test_update_escalates_inquiry_to_alarm(sim):
+    sim.add_scorer()
+    sim.publish(FRIGATE_TOPIC, person("ev1"))
+    sim.publish(FRIGATE_TOPIC, person("ev1", event_type="update")) # Same score: no second inquiry
+    assert kinds(sim) == [("inquiry", "ev1")]
+    sim.publish(FRIGATE_TOPIC, person("ev1", weapon=True, event_type="update"))
+    assert kinds(sim) == [("inquiry", "ev1"), ("alert", "ev1")]
+    assert len(sim.scorers[0].module.pending_events) == 0
+
+def test_incident_links_cameras(sim):
+    sim.add_scorer({"INCIDENT_WINDOW_SECONDS": "30"})
+    sim.publish(FRIGATE_TOPIC, person("front-1", camera="front"))
+    sim.advance(5)
+    sim.publish(FRIGATE_TOPIC, person("porch-1", camera="porch"))
+    assert kinds(sim) == [("inquiry", "front-1")]
+
+def test_incident_window_closes(sim):
+    sim.add_scorer({"INCIDENT_WINDOW_SECONDS": "30", "INCIDENT_MAX_AGE_SECONDS": "30"})
+    sim.publish(FRIGATE_TOPIC, person("front-1", camera="front"))
+    sim.advance(90)
+    sim.publish(FRIGATE_TOPIC, person("porch-1", camera="porch"))
+    assert kinds(sim) == [("inquiry", "front-1"), ("inquiry", "porch-1")]
+
+def test_journal_restores_pending_inquiries(sim, tmp_path):
+    env = {"PENDING_JOURNAL_PATH": str(tmp_path / "pending.journal"), "EVENT_TIMEOUT_SECONDS": "60",
+           "EVENT_TIMEOUT_ACTION": "publish"}
+    first = sim.add_scorer(env)
+    sim.publish(FRIGATE_TOPIC, person("ev1"))
+    sim.publish(FRIGATE_TOPIC, person("ev2"))
+    sim.advance(10)
+    first.stop() # The service restarts
+    sim.scorers.remove(first)
+
+    second = sim.add_scorer(env)
+    assert len(second.module.pending_events) == 2
+    reply(sim, "ev1", "call the police", "negative")
+    assert kinds(sim) == [("inquiry", "ev1"), ("inquiry", "ev2"), ("alert", "ev1")]
+    assert len(second.module.pending_events) == 1
+
+    # Journaled deadlines are wall-clock times, which the simulated clock doesn't move: ev2 has
+    # (nearly) its whole timeout left, and still times out
+    sim.advance(61)
+    assert [payload["event_id"] for payload in published(sim, TIMEOUT_TOPIC)] == ["ev2"]